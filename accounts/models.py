@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import Avg
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.dispatch import receiver
@@ -116,49 +117,48 @@ class UserProfile(models.Model):
     
     def get_average_recipe_rating(self):
         """Calculate user's average recipe rating score."""
-        user_recipes = self.user.recipes.all()
-        if not user_recipes:
+        average = self.user.recipes.filter(rating_count__gt=0).aggregate(
+            average=Avg('rating_avg')
+        )['average']
+        if average is None:
             return 0
-        
-        total_rating = 0
-        total_recipes_with_ratings = 0
-        
-        for recipe in user_recipes:
-            avg_rating = recipe.average_rating
-            if avg_rating > 0:
-                total_rating += avg_rating
-                total_recipes_with_ratings += 1
-        
-        if total_recipes_with_ratings == 0:
-            return 0
-        
-        return round(total_rating / total_recipes_with_ratings, 1)
+        return round(average, 1)
     
+    def get_dietary_tag_ids(self):
+        """Return the ids of the user's dietary restriction tags."""
+        return list(self.dietary_tags.values_list('id', flat=True))
+
     def get_recommended_recipes(self, limit=10):
-        """Get recipes recommended based on user preferences."""
+        """Get recipes recommended based on user preferences.
+
+        Serves the ranking stored by the build_recommendations command,
+        dropping recipes that no longer fit the user's dietary tags or
+        that they have liked since. Users without a stored ranking get
+        the live, popularity-ordered query instead.
+        """
         from recipes.models import Recipe
-        
-        # Start with all recipes
-        recipes = Recipe.objects.all()
-        
+
+        dietary_tag_ids = self.get_dietary_tag_ids()
+        recipes = (
+            Recipe.objects.filter(recommended_for__user=self.user)
+            .with_all_tags(dietary_tag_ids)
+            .exclude(likes__user=self.user)
+            .order_by('recommended_for__rank')[:limit]
+        )
+        if recipes:
+            return recipes
+        return self._get_live_recommended_recipes(dietary_tag_ids, limit)
+
+    def _get_live_recommended_recipes(self, dietary_tag_ids, limit):
+        """Popular recipes matching the user's preferences, queried live."""
+        from recipes.models import Recipe
+
         # Filter by dietary preferences (must match ALL dietary restrictions)
-        if self.dietary_tags.exists():
-            for dietary_tag in self.dietary_tags.all():
-                recipes = recipes.filter(tags=dietary_tag)
+        recipes = Recipe.objects.with_all_tags(dietary_tag_ids)
         
-        # Prefer recipes from favorite cuisines
-        if self.favorite_cuisines.exists():
-            cuisine_recipes = Recipe.objects.filter(
-                tags__in=self.favorite_cuisines.all()
-            ).distinct()
-            
-            # If we have dietary restrictions, apply them to cuisine prefs
-            if self.dietary_tags.exists():
-                for dietary_tag in self.dietary_tags.all():
-                    cuisine_recipes = cuisine_recipes.filter(tags=dietary_tag)
-            
-            # Combine dietary-filtered recipes with cuisine preferences
-            recipes = recipes.union(cuisine_recipes)
+        # Favourite cuisines used to be unioned back in here, but they were
+        # already a subset of the dietary-filtered recipes, so the union
+        # never changed the result set and blocked further filtering.
         
         # Filter by preferred difficulty if set
         if self.preferred_difficulty:
@@ -166,20 +166,21 @@ class UserProfile(models.Model):
             if preferred_recipes.exists():
                 recipes = preferred_recipes
         
-        # Order by rating and limit
-        return (recipes.distinct()
-                .order_by('-view_count', '-created_at')[:limit])
+        # Order by popularity and limit
+        return recipes.order_by('-view_count', '-created_at')[:limit]
     
     def matches_dietary_restrictions(self, recipe):
         """Check if a recipe matches user's dietary restrictions."""
-        if not self.dietary_tags.exists():
+        from recipes.models import Recipe
+        
+        dietary_tag_ids = self.get_dietary_tag_ids()
+        if not dietary_tag_ids:
             return True
         
         # Recipe must have ALL user's dietary tags
-        user_dietary_tags = set(self.dietary_tags.all())
-        recipe_tags = set(recipe.tags.filter(tag_type='dietary'))
-        
-        return user_dietary_tags.issubset(recipe_tags)
+        return (Recipe.objects.filter(pk=recipe.pk)
+                .with_all_tags(dietary_tag_ids)
+                .exists())
     
     def get_dietary_summary(self):
         """Get a readable summary of dietary preferences."""
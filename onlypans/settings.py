@@ -175,6 +175,8 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / "static"]
 STATIC_ROOT = BASE_DIR / 'staticfiles'
+# Minified, content-hashed assets written by scripts/build.py
+ASSET_MANIFEST = BASE_DIR / 'static' / 'dist' / 'manifest.json'
 
 # Media files (user uploads)
 MEDIA_URL = '/media/'
@@ -224,7 +226,84 @@ if not DEBUG:
 # Enable compression (works with gunicorn and whitenoise)
 if not DEBUG:
     # Static files caching for production
-    STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+    # WhiteNoise's storage, reusing the .gz/.br files from scripts/build.py
+    STATICFILES_STORAGE = (
+        'onlypans.storage.PrecompressedManifestStaticFilesStorage'
+    )
+
+# Recipe view counts are buffered in memory and written in batches
+VIEW_COUNT_FLUSH_INTERVAL = 10  # seconds
+VIEW_COUNT_MAX_PENDING = 250  # distinct recipes per flush
+
+# Tests flush view counts themselves; a background flush would write
+# from another thread in the middle of other tests
+if 'test' in sys.argv:
+    VIEW_COUNT_FLUSH_INTERVAL = 24 * 3600  # seconds
+
+# Cache shared by every gunicorn worker, so dropping a cached carousel,
+# facet counts or feed data reaches all of them. Redis when REDIS_URL is
+# set (needs the redis package), otherwise a database table that
+# `manage.py createcachetable` creates (it also runs after every migrate).
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'onlypans_cache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+# Tests run in a single process, so an in-memory cache is shared enough
+if 'test' in sys.argv:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Filter sidebar counts are cached per filter combination
+RECIPE_FACETS_CACHE_TIMEOUT = 300  # seconds
+
+# The homepage cuisine carousel is cached until recipes change
+RECIPE_CAROUSEL_CACHE_TIMEOUT = 600  # seconds
+
+# Serve recipe cards' liked state from a cached per-user id set instead of
+# a subquery (worth it when CACHES is Redis rather than the database)
+RECIPE_LIKED_IDS_CACHE = False
+
+# New recipes are copied into followers' feeds unless the author has more
+# followers than this; their recipes are merged in when feeds are read
+RECIPE_FEED_FANOUT_LIMIT = 1000
+
+# Outgoing email. Notifications are queued in the database and sent by
+# `manage.py send_notifications`. Locally they are written to files in
+# sent_emails/ instead of going through SMTP; set EMAIL_BACKEND to
+# django.core.mail.backends.locmem.EmailBackend to keep them in memory.
+EMAIL_BACKEND = os.environ.get(
+    'EMAIL_BACKEND',
+    'django.core.mail.backends.filebased.EmailBackend' if DEBUG
+    else 'django.core.mail.backends.smtp.EmailBackend',
+)
+EMAIL_FILE_PATH = BASE_DIR / 'sent_emails'
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 25))
+EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', 'False').lower() == 'true'
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL',
+                                    'OnlyPans <noreply@onlypans.com>')
+
+# Notifications wait this long for more of the same kind (e.g. ratings on
+# one recipe) so they can be sent as a single email
+NOTIFICATION_COALESCE_WINDOW = 60  # seconds
 
 # Logging configuration
 LOGGING = {
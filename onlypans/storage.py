@@ -0,0 +1,81 @@
+# onlypans/storage.py
+"""
+Static files storage that serves the build's precompressed variants.
+
+scripts/build.py writes .gz and .br siblings of every text asset at
+maximum compression. collectstatic copies those as they are instead of
+hashing them like ordinary files, and when a variant decompresses to
+exactly what was collected (hashed copies included) it is copied next
+to the collected file rather than compressing that file again. Files
+without variants, or whose variants are stale or describe a file that
+collectstatic has since changed (CSS with rewritten url()s), are
+compressed by WhiteNoise as usual.
+"""
+import gzip
+import shutil
+
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DECOMPRESSORS = {'.gz': gzip.decompress}
+if brotli:
+    DECOMPRESSORS['.br'] = brotli.decompress
+
+
+def is_variant(name):
+    return name.endswith(('.gz', '.br'))
+
+
+class PrecompressedManifestStaticFilesStorage(
+    CompressedManifestStaticFilesStorage
+):
+    """WhiteNoise's storage, reusing variants written by the build."""
+
+    def post_process(self, paths, *args, **kwargs):
+        # Variants keep their names; only the files they compress are hashed
+        paths = {name: found for name, found in paths.items()
+                 if not is_variant(name)}
+        return super().post_process(paths, *args, **kwargs)
+
+    def compress_files(self, names):
+        originals = {hashed: name
+                     for name, hashed in self.hashed_files.items()}
+        to_compress = []
+        for name in names:
+            copied = self.copy_variants(originals.get(name, name), name)
+            if copied:
+                for compressed_name in copied:
+                    yield name, compressed_name
+            else:
+                to_compress.append(name)
+        yield from super().compress_files(to_compress)
+
+    def copy_variants(self, source, name):
+        """Copy source's variants for name if they match its contents.
+
+        Returns the names copied, or [] if any variant is missing or
+        doesn't decompress to name's contents.
+        """
+        with self.open(name) as f:
+            content = f.read()
+        copied = []
+        for suffix, decompress in DECOMPRESSORS.items():
+            variant = self.path(source) + suffix
+            try:
+                with open(variant, 'rb') as f:
+                    matches = decompress(f.read()) == content
+            except FileNotFoundError:
+                # The build leaves out variants that don't pay off
+                continue
+            except Exception:
+                matches = False
+            if not matches:
+                return []
+            if source != name:
+                shutil.copyfile(variant, self.path(name) + suffix)
+            copied.append(name + suffix)
+        return copied
@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.utils.html import format_html
 from .models import (
     Tag, Ingredient, Unit, Recipe, RecipeIngredient, 
-    RecipeStep, Comment, Rating
+    RecipeStep, Comment, Rating, Notification
 )
 
 
@@ -35,7 +35,7 @@ class RecipeStepInline(admin.StackedInline):
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ['title', 'user', 'prep_time', 'cook_time', 'servings', 'created_at']
+    list_display = ['title', 'user', 'prep_time', 'cook_time', 'servings', 'rating_avg', 'rating_count', 'created_at']
     list_filter = ['created_at', 'tags']
     search_fields = ['title', 'description']
     filter_horizontal = ['tags']
@@ -101,4 +101,27 @@ class CommentAdmin(admin.ModelAdmin):
 class RatingAdmin(admin.ModelAdmin):
     list_display = ['user', 'recipe', 'rating', 'created_at']
     list_filter = ['rating', 'created_at']
-    search_fields = ['user__username', 'recipe__title']
\ No newline at end of file
+    search_fields = ['user__username', 'recipe__title']
+
+
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ['kind', 'recipient', 'status', 'attempts',
+                    'next_attempt_at', 'created_at']
+    list_filter = ['kind', 'status']
+    search_fields = ['recipient__username', 'last_error']
+    readonly_fields = ['created_at', 'sent_at']
+    actions = ['retry_notifications']
+
+    def retry_notifications(self, request, queryset):
+        """Queue failed notifications for another round of attempts"""
+        from django.utils import timezone
+        updated = queryset.exclude(status=Notification.SENT).update(
+            status=Notification.PENDING, attempts=0,
+            next_attempt_at=timezone.now(),
+        )
+        self.message_user(
+            request,
+            f'{updated} notification{"s" if updated != 1 else ""} queued.'
+        )
+    retry_notifications.short_description = "Retry selected notifications"
@@ -0,0 +1,65 @@
+# recipes/carousel.py
+"""
+The cuisine carousel at the top of the homepage.
+
+The carousel shows five tags that have recipes, each with its six newest
+recipes and its total recipe count. It is built with two queries (the
+tags with their counts, then a sliced prefetch of their recipes) and kept
+in the cache, so homepage hits normally don't query for it at all.
+recipes.signals drops the cached copy when recipes are tagged, edited,
+deleted or rated; the cache is shared (see CACHES in settings), so that
+reaches every worker.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Prefetch
+
+CACHE_KEY = 'recipe-carousel'
+DEFAULT_CACHE_TIMEOUT = 600  # seconds
+
+CUISINES = 5
+RECIPES_PER_CUISINE = 6
+
+
+def _cache_timeout():
+    return getattr(settings, 'RECIPE_CAROUSEL_CACHE_TIMEOUT',
+                   DEFAULT_CACHE_TIMEOUT)
+
+
+def get_carousel():
+    """Return the carousel, from the cache when possible."""
+    carousel = cache.get(CACHE_KEY)
+    if carousel is None:
+        carousel = build_carousel()
+        cache.set(CACHE_KEY, carousel, _cache_timeout())
+    return carousel
+
+
+def build_carousel():
+    """Build the carousel as a list of {cuisine, recipes, recipe_count}."""
+    from .models import Recipe, Tag
+
+    cuisines = (
+        Tag.objects.filter(recipe__isnull=False)
+        .annotate(recipe_count=Count('recipe'))
+        .prefetch_related(Prefetch(
+            'recipe_set',
+            queryset=Recipe.objects.order_by('-created_at')[
+                :RECIPES_PER_CUISINE
+            ],
+            to_attr='carousel_recipes',
+        ))[:CUISINES]
+    )
+    return [
+        {
+            'cuisine': cuisine,
+            'recipes': cuisine.carousel_recipes,
+            'recipe_count': cuisine.recipe_count,
+        }
+        for cuisine in cuisines
+    ]
+
+
+def invalidate():
+    """Drop the cached carousel so the next homepage hit rebuilds it."""
+    cache.delete(CACHE_KEY)
@@ -0,0 +1,166 @@
+# recipes/digest.py
+"""
+The weekly recipe digest email.
+
+send_weekly_digests runs this as a streaming pipeline over the whole
+user base:
+
+1. The week's candidate recipes (the best rated CANDIDATES) are loaded
+   once and shared by every user.
+2. Users with an email address are read in pk order with .iterator(),
+   CHUNK_SIZE at a time, with one query per chunk for which candidate
+   authors they follow.
+3. Each user gets recipes from authors they follow first, topped up with
+   the week's most popular ones, rendered with templates compiled once
+   per run.
+4. Each chunk is sent with send_messages() over one SMTP connection.
+
+Progress is checkpointed in a DigestRun row per week after every chunk,
+so a run that is interrupted resumes after the last chunk it sent.
+Sending is at least once: a chunk that fails part-way is sent again in
+full on the next run.
+"""
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.template.loader import get_template
+from django.utils import timezone
+
+CANDIDATES = 200
+RECIPES_PER_DIGEST = 5
+CHUNK_SIZE = 200
+
+
+def week_start(now=None):
+    """The Monday starting the last full week"""
+    today = timezone.localdate(now)
+    return today - timedelta(days=today.weekday() + 7)
+
+
+def _midnight(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+class Digest:
+    """One week's digest, personalised per user."""
+
+    def __init__(self, start):
+        from .models import Recipe
+
+        self.start = start
+        self.end = start + timedelta(days=7)
+        self.recipes = list(
+            Recipe.objects.filter(created_at__gte=_midnight(self.start),
+                                  created_at__lt=_midnight(self.end))
+            .select_related('user')
+            .order_by('-rating_avg', '-created_at')[:CANDIDATES]
+        )
+        self.author_ids = {recipe.user_id for recipe in self.recipes}
+        self.templates = {
+            'txt': get_template('emails/weekly_digest.txt'),
+            'html': get_template('emails/weekly_digest.html'),
+        }
+
+    def followed_authors(self, user_ids):
+        """{user id: set of followed candidate authors} for a chunk"""
+        from .models import Follow
+
+        followed = {}
+        for follower_id, author_id in Follow.objects.filter(
+                follower_id__in=user_ids,
+                followed_id__in=self.author_ids).values_list(
+                    'follower_id', 'followed_id'):
+            followed.setdefault(follower_id, set()).add(author_id)
+        return followed
+
+    def recipes_for(self, user, followed=()):
+        """The user's recipes: followed authors first, then popular"""
+        picked = [recipe for recipe in self.recipes
+                  if recipe.user_id in followed][:RECIPES_PER_DIGEST]
+        from_followed = len(picked)
+        for recipe in self.recipes:
+            if len(picked) == RECIPES_PER_DIGEST:
+                break
+            if recipe not in picked and recipe.user_id != user.pk:
+                picked.append(recipe)
+        return picked, from_followed
+
+    def message(self, user, followed=()):
+        """The user's digest email"""
+        recipes, from_followed = self.recipes_for(user, followed)
+        context = {
+            'user': user,
+            'recipes': recipes,
+            'from_followed': from_followed,
+            'week_start': self.start,
+            'week_end': self.end - timedelta(days=1),
+        }
+        message = EmailMultiAlternatives(
+            subject="OnlyPans: This week's delicious recipes!",
+            body=self.templates['txt'].render(context),
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[user.email],
+        )
+        message.attach_alternative(self.templates['html'].render(context),
+                                   'text/html')
+        return message
+
+
+def recipients(after=0, chunk_size=CHUNK_SIZE):
+    """Yield lists of users with an email address, in pk order"""
+    users = (
+        User.objects.filter(is_active=True, pk__gt=after)
+        .exclude(email='').order_by('pk')
+        .only('pk', 'username', 'first_name', 'email')
+    )
+    chunk = []
+    for user in users.iterator(chunk_size=chunk_size):
+        chunk.append(user)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def send_weekly_digests(start=None, restart=False, chunk_size=CHUNK_SIZE,
+                        connection=None):
+    """Send the week's digest to every user, resuming an interrupted run.
+
+    Returns the number of emails sent by this call.
+    """
+    from .models import DigestRun
+
+    start = start or week_start()
+    run, _ = DigestRun.objects.get_or_create(week_start=start)
+    if restart:
+        run.last_user_id, run.emails_sent, run.finished_at = 0, 0, None
+        run.save(update_fields=['last_user_id', 'emails_sent',
+                                'finished_at'])
+    if run.finished_at:
+        return 0
+
+    digest = Digest(start)
+    if not digest.recipes:
+        run.finished_at = timezone.now()
+        run.save(update_fields=['finished_at'])
+        return 0
+
+    connection = connection or get_connection()
+    sent = 0
+    with connection:
+        for users in recipients(run.last_user_id, chunk_size):
+            followed = digest.followed_authors([user.pk for user in users])
+            count = connection.send_messages([
+                digest.message(user, followed.get(user.pk, ()))
+                for user in users
+            ]) or 0
+            sent += count
+            run.last_user_id = users[-1].pk
+            run.emails_sent += count
+            run.save(update_fields=['last_user_id', 'emails_sent'])
+    run.finished_at = timezone.now()
+    run.save(update_fields=['finished_at'])
+    return sent
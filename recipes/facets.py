@@ -0,0 +1,137 @@
+# recipes/facets.py
+"""
+Facet counts for the recipe list filters.
+
+For the recipes matching the current filters, count how many carry each
+tag, each tag type and fall into each total time bucket (the difficulty
+filter's easy/medium/hard). The three groupings are UNION ALLed into one
+aggregate query, so the cost doesn't grow with the number of tags.
+
+Results are cached under a normalised signature of the filters, so
+popular filter combinations are only counted once per cache timeout.
+Recipe and tag changes bump a version number that is part of every cache
+key, which retires all cached counts at once. The version lives in the
+shared cache, so a bump reaches every worker. If the cache evicts it,
+it restarts from the clock rather than from 1, so counts cached under
+an earlier version are never served again.
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, CharField, Count, Value, When
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+
+DEFAULT_CACHE_TIMEOUT = 300  # seconds
+VERSION_KEY = 'recipe-facets:version'
+
+# (bucket, lookups) matching RecipeSearchForm's difficulty choices
+TIME_BUCKETS = [
+    ('easy', {'total_time__lt': 30}),
+    ('medium', {'total_time__gte': 30, 'total_time__lte': 60}),
+    ('hard', {'total_time__gt': 60}),
+]
+
+# Form fields that don't change which recipes match
+IGNORED_FIELDS = {'sort_by'}
+
+
+def _cache_timeout():
+    return getattr(settings, 'RECIPE_FACETS_CACHE_TIMEOUT',
+                   DEFAULT_CACHE_TIMEOUT)
+
+
+def filter_signature(search_form, scope=()):
+    """A stable string describing the filters in a search form.
+
+    Equivalent filters give the same signature whatever order the query
+    string lists them in. scope describes any per-user filtering.
+    """
+    filters = {}
+    if search_form.is_bound and search_form.is_valid():
+        for name, value in search_form.cleaned_data.items():
+            if name in IGNORED_FIELDS or value in (None, '', []):
+                continue
+            if hasattr(value, 'values_list'):
+                value = sorted(value.values_list('pk', flat=True))
+                if not value:
+                    continue
+            filters[name] = value
+    return json.dumps([filters, list(scope)], sort_keys=True, default=str)
+
+
+def invalidate():
+    """Retire every cached facet count."""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), None)
+
+
+def _empty_counts():
+    return {'tags': {}, 'tag_types': {}, 'time': {}}
+
+
+def facet_counts(recipes, signature):
+    """Facet counts for a filtered queryset, cached by filter signature."""
+    if recipes.query.is_empty():
+        # A .none() queryset has no SQL to embed; nothing to count
+        return _empty_counts()
+    version = cache.get_or_set(VERSION_KEY, time.time_ns, None)
+    digest = hashlib.md5(signature.encode()).hexdigest()
+    key = f'recipe-facets:{version}:{digest}'
+    counts = cache.get(key)
+    if counts is None:
+        counts = count_facets(recipes)
+        cache.set(key, counts, _cache_timeout())
+    return counts
+
+
+def count_facets(recipes):
+    """Count tags, tag types and time buckets over recipes in one query.
+
+    Returns {'tags': {tag_id: n}, 'tag_types': {tag_type: n},
+    'time': {bucket: n}}.
+    """
+    from .models import Recipe
+
+    if recipes.query.is_empty():
+        return _empty_counts()
+    if not recipes.query.is_sliced:
+        recipes = recipes.order_by()
+    # Embed the filtered query as raw SQL rather than a queryset: Django
+    # re-aliases the tables of nested querysets, which would break the
+    # raw where clauses the search backends add with extra().
+    recipe_ids = RawSQL(*recipes.values('pk').query.sql_with_params())
+    through = Recipe.tags.through.objects.filter(recipe_id__in=recipe_ids)
+
+    tags = through.annotate(
+        facet=Value('tags'),
+        key=Cast('tag_id', CharField()),
+    ).values('facet', 'key').annotate(count=Count('recipe_id'))
+    # A recipe can have several tags of one type; count it once
+    tag_types = through.annotate(
+        facet=Value('tag_types'),
+        key=Cast('tag__tag_type', CharField()),
+    ).values('facet', 'key').annotate(
+        count=Count('recipe_id', distinct=True)
+    )
+    time = Recipe.objects.filter(pk__in=recipe_ids).annotate(
+        facet=Value('time'),
+        key=Case(
+            *[When(then=Value(bucket), **lookups)
+              for bucket, lookups in TIME_BUCKETS],
+            output_field=CharField(),
+        ),
+    ).values('facet', 'key').annotate(count=Count('pk')).order_by()
+
+    counts = _empty_counts()
+    for row in tags.union(tag_types, time, all=True):
+        key = row['key']
+        if row['facet'] == 'tags':
+            key = int(key)
+        counts[row['facet']][key] = row['count']
+    return counts
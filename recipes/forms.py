@@ -266,6 +266,79 @@ class RecipeSearchForm(forms.Form):
         })
     )
     
+    # Nutrition filters (per serving)
+    min_calories = forms.IntegerField(
+        required=False,
+        min_value=0,
+        widget=forms.NumberInput(attrs={
+            'class': 'form-control',
+            'placeholder': 'Min calories (kcal)'
+        })
+    )
+    
+    max_calories = forms.IntegerField(
+        required=False,
+        min_value=0,
+        widget=forms.NumberInput(attrs={
+            'class': 'form-control',
+            'placeholder': 'Max calories (kcal)'
+        })
+    )
+    
+    min_protein = forms.IntegerField(
+        required=False,
+        min_value=0,
+        widget=forms.NumberInput(attrs={
+            'class': 'form-control',
+            'placeholder': 'Min protein (g)'
+        })
+    )
+    
+    max_protein = forms.IntegerField(
+        required=False,
+        min_value=0,
+        widget=forms.NumberInput(attrs={
+            'class': 'form-control',
+            'placeholder': 'Max protein (g)'
+        })
+    )
+    
+    min_carbs = forms.IntegerField(
+        required=False,
+        min_value=0,
+        widget=forms.NumberInput(attrs={
+            'class': 'form-control',
+            'placeholder': 'Min carbs (g)'
+        })
+    )
+    
+    max_carbs = forms.IntegerField(
+        required=False,
+        min_value=0,
+        widget=forms.NumberInput(attrs={
+            'class': 'form-control',
+            'placeholder': 'Max carbs (g)'
+        })
+    )
+    
+    min_fat = forms.IntegerField(
+        required=False,
+        min_value=0,
+        widget=forms.NumberInput(attrs={
+            'class': 'form-control',
+            'placeholder': 'Min fat (g)'
+        })
+    )
+    
+    max_fat = forms.IntegerField(
+        required=False,
+        min_value=0,
+        widget=forms.NumberInput(attrs={
+            'class': 'form-control',
+            'placeholder': 'Max fat (g)'
+        })
+    )
+    
     # Difficulty filter (based on cook time as proxy)
     DIFFICULTY_CHOICES = [
         ('', 'Any Difficulty'),
@@ -282,8 +355,10 @@ class RecipeSearchForm(forms.Form):
         })
     )
     
-    # Sorting options
+    # Sorting options (the blank choice ranks searches by relevance and
+    # lists everything else newest first)
     SORT_CHOICES = [
+        ('', 'Best Match'),
         ('-created_at', 'Newest First'),
         ('created_at', 'Oldest First'),
         ('title', 'Title A-Z'),
@@ -293,12 +368,13 @@ class RecipeSearchForm(forms.Form):
         ('-total_time', 'Longest First'),
         ('servings', 'Fewest Servings'),
         ('-servings', 'Most Servings'),
+        ('calories_per_serving', 'Lowest Calorie'),
+        ('-protein_per_serving', 'Highest Protein'),
     ]
     
     sort_by = forms.ChoiceField(
         choices=SORT_CHOICES,
         required=False,
-        initial='-created_at',
         widget=forms.Select(attrs={
             'class': 'form-select'
         })
@@ -0,0 +1,276 @@
+# recipes/importer.py
+"""
+Reading recipe dumps and bulk importing them for load_recipes.
+
+Dumps are either a top-level JSON array of records or NDJSON (one record
+per line). read_records() streams either format, reading the file
+READ_SIZE bytes at a time and decoding one record at a time, so memory
+stays bounded however large the dump is. With each record it yields the
+byte offset just past it, which load_recipes reports as it goes so that
+an interrupted load can be resumed with --offset.
+
+Records are dicts (title, description, timings, servings, ingredients,
+instructions, tags, difficulty). RecipeImporter imports them a batch at
+a time for load_recipes --bulk. Instead of a get_or_create per
+ingredient, unit and tag and a save per row:
+
+* the existing Ingredient, Unit and Tag names are loaded into maps once,
+  and each batch creates the names it is missing with one bulk_create
+* each batch's slugs are allocated together by allocate_slugs(), with
+  one query per SLUG_QUERY_BATCH distinct titles
+* each batch's recipes, ingredient rows, steps and tag rows are inserted
+  with one bulk_create per table inside a single transaction
+
+bulk_create skips the post_save signals, so after each batch the
+importer refreshes what they would have: the search index and stored
+nutrition for the new recipes, and the cached facet counts and carousel.
+The new recipes reach followers' feeds through fan-out on read until
+rebuild_timelines runs, and are scored by the next build_related_recipes.
+"""
+import codecs
+import json
+import time
+
+from django.db import transaction
+
+from . import carousel, facets, search
+from .models import (Ingredient, Recipe, RecipeIngredient, RecipeStep, Tag,
+                     Unit)
+
+BATCH_SIZE = 500
+READ_SIZE = 64 * 1024  # bytes
+# A JSON array element still undecodable at this size is invalid rather
+# than incomplete
+MAX_RECORD_SIZE = 16 * 1024 * 1024  # characters
+JSON_WHITESPACE = ' \t\n\r'
+
+
+def detect_format(path):
+    """'json' for a dump that is a JSON array, otherwise 'ndjson'"""
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(READ_SIZE)
+            if not chunk:
+                return 'ndjson'
+            chunk = chunk.lstrip(JSON_WHITESPACE.encode())
+            if chunk:
+                return 'json' if chunk.startswith(b'[') else 'ndjson'
+
+
+def read_records(path, format='auto', offset=0):
+    """Yield (record, end offset) for each record in a dump.
+
+    offset resumes reading at a byte offset previously yielded.
+    """
+    if format == 'auto':
+        format = detect_format(path)
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        if format == 'ndjson':
+            yield from _read_lines(f, offset)
+        else:
+            yield from _read_array(f, offset)
+
+
+def _read_lines(f, offset):
+    for line in f:
+        offset += len(line)
+        if line.strip():
+            yield json.loads(line), offset
+
+
+def _read_array(f, offset):
+    """Decode the elements of a JSON array one at a time.
+
+    Resuming at an offset starts just after an element, where a comma or
+    the closing bracket is expected.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    buffer, more = '', True
+    expecting = 'separator' if offset else 'start'
+    while True:
+        stripped = buffer.lstrip(JSON_WHITESPACE)
+        offset += len(buffer) - len(stripped)
+        buffer = stripped
+        if not buffer and more:
+            chunk = f.read(READ_SIZE)
+            more = bool(chunk)
+            buffer = utf8.decode(chunk, final=not more)
+            continue
+        if not buffer:
+            raise json.JSONDecodeError('Unexpected end of file', '', 0)
+
+        if expecting == 'start':
+            if buffer[0] != '[':
+                raise json.JSONDecodeError("Expecting '['", buffer, 0)
+            buffer, offset, expecting = buffer[1:], offset + 1, 'first'
+            continue
+        if expecting in ('first', 'separator') and buffer[0] == ']':
+            return
+        if expecting == 'separator':
+            if buffer[0] != ',':
+                raise json.JSONDecodeError("Expecting ',' delimiter",
+                                           buffer, 0)
+            buffer, offset, expecting = buffer[1:], offset + 1, 'value'
+            continue
+
+        try:
+            record, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            if not more or len(buffer) > MAX_RECORD_SIZE:
+                raise
+            end = None
+        if (end is None or end == len(buffer)) and more:
+            # The element may continue in the next chunk
+            chunk = f.read(READ_SIZE)
+            more = bool(chunk)
+            buffer += utf8.decode(chunk, final=not more)
+            continue
+        offset += len(buffer[:end].encode('utf-8'))
+        buffer, expecting = buffer[end:], 'separator'
+        yield record, offset
+
+
+def chunked(iterable, size):
+    """Yield lists of up to size items"""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class RecipeImporter:
+    """Import recipe records in batches for one owning user."""
+
+    def __init__(self, user, batch_size=BATCH_SIZE):
+        self.user = user
+        self.batch_size = batch_size
+        self.ingredients = dict(Ingredient.objects.values_list('name', 'pk'))
+        self.units = dict(Unit.objects.values_list('name', 'pk'))
+        self.tags = dict(Tag.objects.values_list('name', 'pk'))
+        self.counts = {'recipes': 0, 'ingredients': 0, 'steps': 0,
+                       'tags': 0, 'lookups': 0}
+        self.elapsed = 0.0
+
+    @property
+    def rows(self):
+        """Rows inserted so far, across all tables"""
+        return sum(self.counts.values())
+
+    def import_records(self, records):
+        """Import an iterable of records, batch by batch"""
+        for batch in chunked(records, self.batch_size):
+            self.import_batch(batch)
+
+    def import_batch(self, records):
+        """Insert one batch of records in a single transaction"""
+        started = time.perf_counter()
+        with transaction.atomic():
+            self._create_lookups(records)
+            slugs = Recipe.objects.allocate_slugs(
+                [record.get('title', '') for record in records]
+            )
+            recipes = Recipe.objects.bulk_create([
+                Recipe(
+                    title=record.get('title', ''),
+                    slug=slug,
+                    description=record.get('description', ''),
+                    prep_time=record.get('prep_time', 15),
+                    cook_time=record.get('cook_time', 30),
+                    servings=record.get('servings', 4),
+                    user=self.user,
+                )
+                for record, slug in zip(records, slugs)
+            ])
+            if recipes and recipes[0].pk is None:
+                # Backends that can't return ids from bulk inserts
+                ids = dict(Recipe.objects.filter(
+                    slug__in=[recipe.slug for recipe in recipes]
+                ).values_list('slug', 'pk'))
+                for recipe in recipes:
+                    recipe.pk = ids[recipe.slug]
+
+            ingredients, steps, tags = [], [], []
+            for recipe, record in zip(recipes, records):
+                for order, item in enumerate(record.get('ingredients', []),
+                                             1):
+                    ingredients.append(RecipeIngredient(
+                        recipe_id=recipe.pk,
+                        ingredient_id=self.ingredients[item.get('name', '')],
+                        unit_id=self.units[item.get('unit', 'pieces')],
+                        quantity=item.get('quantity', 1),
+                        order=order,
+                    ))
+                for number, text in enumerate(record.get('instructions', []),
+                                              1):
+                    steps.append(RecipeStep(recipe_id=recipe.pk,
+                                            step_number=number,
+                                            instruction=text))
+                tags.extend(
+                    Recipe.tags.through(recipe_id=recipe.pk,
+                                        tag_id=self.tags[name])
+                    for name in dict.fromkeys(self._tag_names(record))
+                )
+            RecipeIngredient.objects.bulk_create(ingredients)
+            RecipeStep.objects.bulk_create(steps)
+            Recipe.tags.through.objects.bulk_create(tags)
+
+            recipe_ids = [recipe.pk for recipe in recipes]
+            search.index_recipes(recipe_ids)
+            Recipe.objects.filter(pk__in=recipe_ids).refresh_nutrition()
+        facets.invalidate()
+        carousel.invalidate()
+
+        self.counts['recipes'] += len(recipes)
+        self.counts['ingredients'] += len(ingredients)
+        self.counts['steps'] += len(steps)
+        self.counts['tags'] += len(tags)
+        self.elapsed += time.perf_counter() - started
+
+    def _tag_names(self, record):
+        """Names of the tags a record carries, difficulty included"""
+        for name in record.get('tags', []):
+            yield name
+        if 'difficulty' in record:
+            yield record['difficulty'].title()
+
+    def _create_lookups(self, records):
+        """Create the ingredients, units and tags this batch is missing"""
+        ingredients, units, tags = {}, {}, {}
+        for record in records:
+            for item in record.get('ingredients', []):
+                ingredients.setdefault(item.get('name', ''), Ingredient(
+                    name=item.get('name', ''), category='other'
+                ))
+                unit_name = item.get('unit', 'pieces')
+                units.setdefault(unit_name, Unit(
+                    name=unit_name, abbreviation=unit_name[:10],
+                    unit_type='count', grams_per_unit=1.0,
+                ))
+            for name in record.get('tags', []):
+                tags.setdefault(name, Tag(name=name, tag_type='cuisine',
+                                          color='#007bff'))
+            if 'difficulty' in record:
+                name = record['difficulty'].title()
+                tags.setdefault(name, Tag(name=name, tag_type='difficulty',
+                                          color='#28a745'))
+
+        for model, known, wanted in [(Ingredient, self.ingredients,
+                                      ingredients),
+                                     (Unit, self.units, units),
+                                     (Tag, self.tags, tags)]:
+            missing = [obj for name, obj in wanted.items()
+                       if name not in known]
+            if not missing:
+                continue
+            model.objects.bulk_create(missing, ignore_conflicts=True)
+            # ignore_conflicts doesn't return ids; read them back
+            known.update(model.objects.filter(
+                name__in=[obj.name for obj in missing]
+            ).values_list('name', 'pk'))
+            self.counts['lookups'] += len(missing)
@@ -0,0 +1,97 @@
+# recipes/likes.py
+"""
+Per-user "liked" state for recipe cards.
+
+By default the liked flag is an Exists() subquery annotated onto the
+listing query, so the database only checks the rows on the current page.
+
+With RECIPE_LIKED_IDS_CACHE = True the flag comes from a cached set
+instead: the ids of every recipe the user has liked, stored as a sorted
+array of unsigned 64-bit ints (8 bytes a like, wide enough for any
+BigAutoField id) and searched with bisect. Pages then need no like
+queries at all. The cached set is dropped whenever one of the user's
+likes is added or removed (see recipes.signals).
+"""
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef
+
+DEFAULT_CACHE_TIMEOUT = 3600  # seconds
+
+
+def use_cache():
+    return getattr(settings, 'RECIPE_LIKED_IDS_CACHE', False)
+
+
+def _cache_key(user_id):
+    return f'recipe-likes:{user_id}'
+
+
+def liked_ids(user):
+    """Sorted array of the ids of every recipe the user has liked."""
+    from .models import RecipeLike
+
+    key = _cache_key(user.pk)
+    ids = cache.get(key)
+    if ids is None:
+        ids = array('Q', RecipeLike.objects.filter(user=user)
+                    .order_by('recipe_id')
+                    .values_list('recipe_id', flat=True))
+        cache.set(key, ids, getattr(settings, 'RECIPE_LIKED_IDS_TIMEOUT',
+                                    DEFAULT_CACHE_TIMEOUT))
+    return ids
+
+
+def _contains(ids, recipe_id):
+    position = bisect_left(ids, recipe_id)
+    return position < len(ids) and ids[position] == recipe_id
+
+
+def invalidate(user_id):
+    """Drop a user's cached liked ids."""
+    cache.delete(_cache_key(user_id))
+
+
+def with_liked(recipes, user):
+    """Annotate is_liked onto a Recipe queryset (when not using the cache).
+
+    The subquery only runs for the rows the query returns, so annotate
+    before paginating and it costs one index lookup per card.
+    """
+    from .models import RecipeLike
+
+    if not user.is_authenticated or use_cache():
+        return recipes
+    return recipes.annotate(is_liked=Exists(
+        RecipeLike.objects.filter(user=user, recipe=OuterRef('pk'))
+    ))
+
+
+def mark_liked(recipes, user):
+    """Set is_liked on recipes that with_liked() didn't annotate."""
+    if user.is_authenticated and not use_cache():
+        return
+    ids = liked_ids(user) if user.is_authenticated else ()
+    for recipe in recipes:
+        recipe.is_liked = _contains(ids, recipe.pk)
+
+
+def has_liked(user, recipe):
+    """Whether the user has liked a single recipe."""
+    from .models import RecipeLike
+
+    if not user.is_authenticated:
+        return False
+    if use_cache():
+        return _contains(liked_ids(user), recipe.pk)
+    return RecipeLike.objects.filter(user=user, recipe=recipe).exists()
+
+
+def like_count(user):
+    """How many recipes the user has liked."""
+    if use_cache():
+        return len(liked_ids(user))
+    return user.liked_recipes.count()
@@ -0,0 +1,347 @@
+import socket
+import time
+
+from django.contrib.auth.models import User
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from recipes import notifications
+from recipes.models import (Follow, Ingredient, Notification, Recipe,
+                            RecipeIngredient, Tag, TimelineEntry, Unit)
+from recipes.nutrition import calculate_nutrition, nutrition_for_recipes
+from recipes.timeline import feed_page
+from recipes.views import recipe_list
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark query counts and timings against a synthetic catalogue. '
+        'All benchmark data is created inside a transaction that is rolled '
+        'back at the end, so the database is left untouched.'
+    )
+
+    scenarios = {
+        'dietary': 'bench_dietary',
+        'feed': 'bench_feed',
+        'notifications': 'bench_notifications',
+        'nutrition': 'bench_nutrition',
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=sorted(self.scenarios))
+        parser.add_argument(
+            '--sizes',
+            default='1000,10000,100000',
+            help='Comma separated catalogue sizes to measure'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=2000,
+            help='Rows per bulk insert while seeding'
+        )
+        parser.add_argument(
+            '--smtp', default='localhost:1025',
+            help='host:port of a debugging SMTP server for the '
+                 'notifications scenario, e.g. one started with '
+                 '`python -m aiosmtpd -n -l localhost:1025`'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            sizes = sorted(int(size) for size in options['sizes'].split(','))
+        except ValueError:
+            raise CommandError('--sizes must be a list of integers')
+        self.batch_size = options['batch_size']
+        self.smtp = options['smtp']
+
+        with transaction.atomic():
+            self.user = User.objects.create_user(
+                username='benchmark-user',
+                email='benchmark@onlypans.com'
+            )
+            getattr(self, self.scenarios[options['scenario']])(sizes)
+            transaction.set_rollback(True)
+
+    def seed_recipes(self, start, stop, tags_for=None, ingredients_for=None):
+        """Bulk insert recipes numbered start..stop-1.
+
+        tags_for(i) returns the tags to attach to recipe i and
+        ingredients_for(i) its (ingredient, unit, quantity) rows.
+        """
+        through = Recipe.tags.through
+        for batch_start in range(start, stop, self.batch_size):
+            batch_stop = min(batch_start + self.batch_size, stop)
+            recipes = Recipe.objects.bulk_create([
+                Recipe(
+                    user=self.user,
+                    title=f'Benchmark Recipe {i}',
+                    slug=f'benchmark-recipe-{i}',
+                    description=f'Synthetic recipe number {i}',
+                    prep_time=5 + i % 40,
+                    cook_time=5 + i % 90,
+                    servings=1 + i % 8,
+                )
+                for i in range(batch_start, batch_stop)
+            ])
+            if tags_for is None and ingredients_for is None:
+                continue
+            if recipes[0].pk is None:
+                # Backends that can't return ids from bulk inserts
+                recipes = Recipe.objects.filter(
+                    slug__startswith='benchmark-recipe-'
+                ).order_by('id')[batch_start:batch_stop]
+            if tags_for is not None:
+                through.objects.bulk_create([
+                    through(recipe_id=recipe.pk, tag_id=tag.pk)
+                    for i, recipe in enumerate(recipes, batch_start)
+                    for tag in tags_for(i)
+                ])
+            if ingredients_for is not None:
+                RecipeIngredient.objects.bulk_create([
+                    RecipeIngredient(recipe_id=recipe.pk,
+                                     ingredient=ingredient, unit=unit,
+                                     quantity=quantity, order=order)
+                    for i, recipe in enumerate(recipes, batch_start)
+                    for order, (ingredient, unit, quantity) in enumerate(
+                        ingredients_for(i), 1)
+                ])
+
+    def measure(self, func):
+        """Run func once, returning (query count, elapsed ms)."""
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            func()
+            elapsed = (time.perf_counter() - started) * 1000
+        return len(ctx.captured_queries), elapsed
+
+    def report(self, rows):
+        self.stdout.write(f"{'recipes':>10} {'queries':>8} {'ms':>10}")
+        for size, queries, elapsed in rows:
+            self.stdout.write(f'{size:>10,} {queries:>8} {elapsed:>10.1f}')
+        query_counts = {queries for _, queries, _ in rows}
+        if len(query_counts) == 1:
+            self.stdout.write(self.style.SUCCESS(
+                'Query count is constant across catalogue sizes'
+            ))
+        else:
+            self.stdout.write(self.style.WARNING(
+                'Query count changes with catalogue size'
+            ))
+
+    def bench_dietary(self, sizes):
+        """Homepage for a user with dietary restrictions."""
+        vegan = Tag.objects.create(name='Benchmark Vegan', tag_type='dietary')
+        gluten_free = Tag.objects.create(
+            name='Benchmark Gluten-Free', tag_type='dietary'
+        )
+        self.user.profile.dietary_tags.set([vegan, gluten_free])
+
+        def tags_for(i):
+            # A third of the catalogue fits both restrictions
+            if i % 3 == 0:
+                return [vegan, gluten_free]
+            return [vegan] if i % 3 == 1 else [gluten_free]
+
+        factory = RequestFactory(HTTP_HOST='localhost')
+
+        def homepage():
+            request = factory.get('/')
+            request.user = self.user
+            response = recipe_list(request)
+            assert response.status_code == 200
+
+        rows = []
+        seeded = 0
+        for size in sizes:
+            self.seed_recipes(seeded, size, tags_for)
+            seeded = size
+            homepage()  # warm up template and tag caches
+            rows.append((size, *self.measure(homepage)))
+        self.report(rows)
+
+    def bench_feed(self, sizes):
+        """Home feed pages for a user following `size` authors.
+
+        Every author has two recipes copied into the reader's timeline,
+        as fan-out on write leaves them. Five more authors with too many
+        followers to fan out are followed too, so each page also merges
+        their recipes in at read time.
+        """
+        def seed_authors(start, stop, fanned_out):
+            authors = User.objects.bulk_create([
+                User(username=f'benchmark-author-{i}')
+                for i in range(start, stop)
+            ])
+            if authors[0].pk is None:
+                authors = User.objects.filter(
+                    username__startswith='benchmark-author-'
+                ).order_by('id')[start:stop]
+            Follow.objects.bulk_create([
+                Follow(follower=self.user, followed=author)
+                for author in authors
+            ])
+            recipes = Recipe.objects.bulk_create([
+                Recipe(user=author, title=f'Benchmark Recipe {i}.{n}',
+                       slug=f'benchmark-recipe-{i}-{n}', prep_time=5,
+                       cook_time=10, fanned_out=fanned_out)
+                for i, author in enumerate(authors, start)
+                for n in range(2)
+            ], batch_size=self.batch_size)
+            if fanned_out:
+                # Re-read for backends that can't return ids from bulk inserts
+                recipes = Recipe.objects.filter(
+                    user__in=authors
+                ).values_list('pk', 'user_id', 'created_at')
+                TimelineEntry.objects.bulk_create([
+                    TimelineEntry(user=self.user, recipe_id=recipe_id,
+                                  author_id=author_id, created_at=created_at)
+                    for recipe_id, author_id, created_at in recipes
+                ], batch_size=self.batch_size)
+
+        def read_pages(pages=3):
+            cursor = None
+            for _ in range(pages):
+                page = feed_page(self.user, cursor)
+                assert len(page) == 12
+                cursor = page.next_cursor
+
+        seed_authors(0, 5, fanned_out=False)
+        rows = []
+        seeded = 5
+        for size in sizes:
+            seed_authors(seeded, size + 5, fanned_out=True)
+            seeded = size + 5
+            read_pages()  # warm up the pull author cache
+            rows.append((size, *self.measure(read_pages)))
+        self.stdout.write('Three feed pages per catalogue size '
+                          '(followed authors x 2 recipes):')
+        self.report(rows)
+
+    def bench_notifications(self, sizes):
+        """Outbox delivery throughput against a debugging SMTP server.
+
+        Sends `size` new follower emails, each to a different user so
+        nothing is coalesced, first with a fresh SMTP connection per
+        message (what send_mail() did) and then through the worker's
+        batched delivery over one connection.
+        """
+        host, _, port = self.smtp.rpartition(':')
+        try:
+            socket.create_connection((host, int(port)), timeout=2).close()
+        except (OSError, ValueError):
+            raise CommandError(
+                f'No SMTP server at {self.smtp}; start one with '
+                f'`python -m aiosmtpd -n -l {self.smtp}`'
+            )
+
+        def smtp_connection():
+            return get_connection(
+                'django.core.mail.backends.smtp.EmailBackend',
+                host=host, port=int(port), username='', password='',
+                use_tls=False, use_ssl=False,
+            )
+
+        def queue(start, stop):
+            recipients = User.objects.bulk_create([
+                User(username=f'benchmark-recipient-{i}',
+                     email=f'recipient{i}@example.com')
+                for i in range(start, stop)
+            ], batch_size=self.batch_size)
+            if recipients[0].pk is None:
+                recipients = User.objects.filter(
+                    username__startswith='benchmark-recipient-'
+                ).order_by('id')[start:stop]
+            Notification.objects.bulk_create([
+                Notification(kind=Notification.NEW_FOLLOWER,
+                             recipient=recipient, actor=self.user)
+                for recipient in recipients
+            ], batch_size=self.batch_size)
+            return notifications.claim_due_notifications(stop - start)
+
+        def per_message(groups):
+            for group in groups:
+                message = notifications.build_message(group)
+                message.connection = smtp_connection()
+                message.send()
+
+        self.stdout.write(f"{'emails':>10} {'per-message/s':>14} "
+                          f"{'batched/s':>10}")
+        for size in sizes:
+            groups = queue(0, size)
+            started = time.perf_counter()
+            per_message(groups)
+            per_message_rate = size / (time.perf_counter() - started)
+            Notification.objects.all().delete()
+
+            groups = queue(size, 2 * size)
+            started = time.perf_counter()
+            sent, failed = notifications.deliver(groups, smtp_connection())
+            batched_rate = size / (time.perf_counter() - started)
+            if failed:
+                raise CommandError(f'{failed} of {size} batched sends failed')
+            Notification.objects.all().delete()
+            User.objects.filter(
+                username__startswith='benchmark-recipient-'
+            ).delete()
+            self.stdout.write(f'{size:>10,} {per_message_rate:>14.0f} '
+                              f'{batched_rate:>10.0f}')
+
+    def bench_nutrition(self, sizes):
+        """Per-serving nutrition for the whole catalogue in one pass."""
+        units = [
+            Unit.objects.create(name='Benchmark Cup', abbreviation='bcup',
+                                unit_type='volume', grams_per_unit=240),
+            Unit.objects.create(name='Benchmark Gram', abbreviation='bg',
+                                unit_type='weight'),
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Benchmark Ingredient {n}',
+                calories_per_100g=50 + n * 37 % 600,
+                protein_per_100g=n * 1.3 % 30,
+                carbs_per_100g=n * 2.9 % 80,
+                fat_per_100g=n * 0.7 % 40,
+                fibre_per_100g=n % 7 or None,
+                sugars_per_100g=n * 1.1 % 25,
+                sodium_mg_per_100g=n * 13 % 900,
+                saturated_fat_per_100g=n * 0.3 % 15,
+            )
+            for n in range(50)
+        ]
+
+        def ingredients_for(i):
+            # Five to nine ingredients per recipe
+            return [
+                (ingredients[(i * 7 + k * 11) % len(ingredients)],
+                 units[(i + k) % len(units)],
+                 round(0.25 + (i + k) % 40 * 12.5, 2))
+                for k in range(5 + i % 5)
+            ]
+
+        recipes = Recipe.objects.filter(slug__startswith='benchmark-recipe-')
+        rows = []
+        seeded = 0
+        for size in sizes:
+            self.seed_recipes(seeded, size, ingredients_for=ingredients_for)
+            seeded = size
+            result = {}
+            queries, elapsed = self.measure(
+                lambda: result.update(nutrition_for_recipes(recipes))
+            )
+            rows.append((size, queries, elapsed))
+        self.report(rows)
+
+        # Spot check the batch results against the per-recipe calculation
+        sample = recipes.order_by('?')[:200]
+        mismatches = [recipe.slug for recipe in sample
+                      if result[recipe.pk] != calculate_nutrition(recipe)]
+        if mismatches:
+            raise CommandError(
+                f'Batch nutrition differs for {len(mismatches)} of 200 '
+                f'sampled recipes, e.g. {mismatches[0]}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            'Batch nutrition matches calculate_nutrition() on 200 recipes'
+        ))
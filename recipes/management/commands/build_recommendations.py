@@ -0,0 +1,48 @@
+"""
+Management command to rebuild the precomputed "For You" recommendations
+"""
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from recipes.recommendations import (
+    ACTIVE_DAYS, active_users, build_recommendations
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Rank recipes for recently active users and store their "For You" '
+        'recommendations (schedule this, e.g. nightly)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=ACTIVE_DAYS,
+            help='Rank users who logged in within this many days',
+        )
+        parser.add_argument(
+            '--user',
+            action='append',
+            dest='usernames',
+            metavar='USERNAME',
+            help='Only rank the given user (repeatable)',
+        )
+
+    def handle(self, *args, **options):
+        if options['usernames']:
+            users = User.objects.filter(username__in=options['usernames'])
+        else:
+            users = active_users(options['days'])
+
+        started = time.perf_counter()
+        ranked = build_recommendations(users)
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Built recommendations for {ranked} users in {elapsed:.1f}s'
+            )
+        )
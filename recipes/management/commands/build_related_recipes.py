@@ -0,0 +1,33 @@
+"""
+Management command to rebuild the precomputed related recipes
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from recipes.related import build_related_recipes
+
+
+class Command(BaseCommand):
+    help = (
+        'Rescore related recipes for recipes whose tags, ingredients or '
+        'likes changed since the last run (schedule this, e.g. hourly)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Rescore every recipe, not just the changed ones',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rebuilt = build_related_recipes(full=options['full'])
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Rebuilt related recipes for {rebuilt} recipes '
+                f'in {elapsed:.1f}s'
+            )
+        )
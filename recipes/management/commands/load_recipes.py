@@ -1,23 +1,59 @@
+import itertools
+import json
+import os
+
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
+from django.db import transaction
+from recipes.importer import BATCH_SIZE, RecipeImporter, chunked, read_records
 from recipes.models import (
     Recipe, Tag, Ingredient, Unit, RecipeIngredient, RecipeStep
 )
-import json
 
 
 class Command(BaseCommand):
-    help = 'Load recipes from JSON file'
+    help = 'Load recipes from a JSON array or NDJSON file'
 
     def add_arguments(self, parser):
         parser.add_argument('json_file', type=str, help='Path to JSON file')
+        parser.add_argument(
+            '--format',
+            choices=['auto', 'json', 'ndjson'],
+            default='auto',
+            help='JSON array or one record per line (default: detect)'
+        )
+        parser.add_argument(
+            '--bulk',
+            action='store_true',
+            help='Insert recipes in batches with bulk_create'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help=f'Records per chunk, and per transaction with --bulk '
+                 f'(default {BATCH_SIZE})'
+        )
+        parser.add_argument(
+            '--offset',
+            type=int,
+            default=0,
+            help='Resume at a byte offset reported by an earlier run'
+        )
+        parser.add_argument(
+            '--skip',
+            type=int,
+            default=0,
+            help='Skip this many records before loading'
+        )
 
     def handle(self, *args, **options):
         json_file = options['json_file']
+        self.offset = options['offset']
+        self.loaded = 0
 
         try:
-            with open(json_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            size = os.path.getsize(json_file)
 
             # Get or create a default user
             user, created = User.objects.get_or_create(
@@ -35,89 +71,41 @@ class Command(BaseCommand):
                 user.save()
                 self.stdout.write('Created admin user')
 
-            recipes_created = 0
-
-            # Process each recipe
-            for recipe_data in data:
-                # Create recipe
-                recipe = Recipe.objects.create(
-                    title=recipe_data.get('title', ''),
-                    description=recipe_data.get('description', ''),
-                    prep_time=recipe_data.get('prep_time', 15),
-                    cook_time=recipe_data.get('cook_time', 30),
-                    servings=recipe_data.get('servings', 4),
-                    user=user  # Changed from 'author' to 'user'
+            records = read_records(json_file, options['format'],
+                                   self.offset)
+            for _record, self.offset in itertools.islice(records,
+                                                         options['skip']):
+                pass
+
+            importer = None
+            if options['bulk']:
+                importer = RecipeImporter(user, options['batch_size'])
+
+            # Process the records a chunk at a time
+            for chunk in chunked(records, options['batch_size']):
+                if importer:
+                    importer.import_batch([record for record, _ in chunk])
+                    self.loaded += len(chunk)
+                    self.offset = chunk[-1][1]
+                else:
+                    for recipe_data, end in chunk:
+                        recipe = self.load_record(recipe_data, user)
+                        self.loaded += 1
+                        self.offset = end
+                        self.stdout.write(f'Created recipe: {recipe.title}')
+                self.stdout.write(
+                    f'Loaded {self.loaded} recipes, '
+                    f'{self.offset:,} of {size:,} bytes '
+                    f'({self.offset / (size or 1):.0%})'
                 )
 
-                # Add ingredients
-                if 'ingredients' in recipe_data:
-                    ingredients = recipe_data.get('ingredients', [])
-                    for i, ing_data in enumerate(ingredients, 1):
-                        # Get or create ingredient
-                        ingredient, _ = Ingredient.objects.get_or_create(
-                            name=ing_data.get('name', ''),
-                            defaults={'category': 'other'}
-                        )
-
-                        # Get or create unit
-                        unit_name = ing_data.get('unit', 'pieces')
-                        unit, _ = Unit.objects.get_or_create(
-                            name=unit_name,
-                            defaults={
-                                'abbreviation': unit_name[:10],
-                                'unit_type': 'count',
-                                'grams_per_unit': 1.0
-                            }
-                        )
-
-                        # Create recipe ingredient
-                        RecipeIngredient.objects.create(
-                            recipe=recipe,
-                            ingredient=ingredient,
-                            quantity=ing_data.get('quantity', 1),
-                            unit=unit,
-                            order=i
-                        )
-
-                # Add steps
-                if 'instructions' in recipe_data:
-                    instructions = recipe_data['instructions']
-                    for i, step_text in enumerate(instructions, 1):
-                        RecipeStep.objects.create(
-                            recipe=recipe,
-                            step_number=i,
-                            instruction=step_text
-                        )
-
-                # Add tags
-                if 'tags' in recipe_data:
-                    for tag_name in recipe_data['tags']:
-                        tag, _ = Tag.objects.get_or_create(
-                            name=tag_name,
-                            defaults={
-                                'tag_type': 'cuisine',
-                                'color': '#007bff'
-                            }
-                        )
-                        recipe.tags.add(tag)
-
-                # Add difficulty as a tag if provided
-                if 'difficulty' in recipe_data:
-                    difficulty_tag, _ = Tag.objects.get_or_create(
-                        name=recipe_data['difficulty'].title(),
-                        defaults={
-                            'tag_type': 'difficulty',
-                            'color': '#28a745'
-                        }
-                    )
-                    recipe.tags.add(difficulty_tag)
-
-                recipes_created += 1
-                self.stdout.write(f'Created recipe: {recipe.title}')
+            if importer:
+                self.report_bulk(importer)
+                return
 
             self.stdout.write(
                 self.style.SUCCESS(
-                    f'Successfully loaded {recipes_created} recipes'
+                    f'Successfully loaded {self.loaded} recipes'
                 )
             )
 
@@ -129,7 +117,113 @@ class Command(BaseCommand):
             self.stdout.write(
                 self.style.ERROR(f'Invalid JSON in file: {json_file}')
             )
+            self.write_resume_hint()
         except Exception as e:
             self.stdout.write(
                 self.style.ERROR(f'Error loading recipes: {str(e)}')
             )
+            self.write_resume_hint()
+
+    def write_resume_hint(self):
+        """Say where to pick up a load that stopped part-way"""
+        if self.offset:
+            self.stdout.write(
+                f'Loaded {self.loaded} recipes before stopping; '
+                f'resume with --offset {self.offset}'
+            )
+
+    @transaction.atomic
+    def load_record(self, recipe_data, user):
+        """Create one recipe with its ingredients, steps and tags"""
+        # Create recipe
+        recipe = Recipe.objects.create(
+            title=recipe_data.get('title', ''),
+            description=recipe_data.get('description', ''),
+            prep_time=recipe_data.get('prep_time', 15),
+            cook_time=recipe_data.get('cook_time', 30),
+            servings=recipe_data.get('servings', 4),
+            user=user  # Changed from 'author' to 'user'
+        )
+
+        # Add ingredients
+        if 'ingredients' in recipe_data:
+            ingredients = recipe_data.get('ingredients', [])
+            for i, ing_data in enumerate(ingredients, 1):
+                # Get or create ingredient
+                ingredient, _ = Ingredient.objects.get_or_create(
+                    name=ing_data.get('name', ''),
+                    defaults={'category': 'other'}
+                )
+
+                # Get or create unit
+                unit_name = ing_data.get('unit', 'pieces')
+                unit, _ = Unit.objects.get_or_create(
+                    name=unit_name,
+                    defaults={
+                        'abbreviation': unit_name[:10],
+                        'unit_type': 'count',
+                        'grams_per_unit': 1.0
+                    }
+                )
+
+                # Create recipe ingredient
+                RecipeIngredient.objects.create(
+                    recipe=recipe,
+                    ingredient=ingredient,
+                    quantity=ing_data.get('quantity', 1),
+                    unit=unit,
+                    order=i
+                )
+
+        # Add steps
+        if 'instructions' in recipe_data:
+            instructions = recipe_data['instructions']
+            for i, step_text in enumerate(instructions, 1):
+                RecipeStep.objects.create(
+                    recipe=recipe,
+                    step_number=i,
+                    instruction=step_text
+                )
+
+        # Add tags
+        if 'tags' in recipe_data:
+            for tag_name in recipe_data['tags']:
+                tag, _ = Tag.objects.get_or_create(
+                    name=tag_name,
+                    defaults={
+                        'tag_type': 'cuisine',
+                        'color': '#007bff'
+                    }
+                )
+                recipe.tags.add(tag)
+
+        # Add difficulty as a tag if provided
+        if 'difficulty' in recipe_data:
+            difficulty_tag, _ = Tag.objects.get_or_create(
+                name=recipe_data['difficulty'].title(),
+                defaults={
+                    'tag_type': 'difficulty',
+                    'color': '#28a745'
+                }
+            )
+            recipe.tags.add(difficulty_tag)
+
+        return recipe
+
+    def report_bulk(self, importer):
+        """Report what the batched importer inserted and how fast"""
+        elapsed = importer.elapsed or 1e-9
+        counts = importer.counts
+        self.stdout.write(
+            f"Inserted {counts['recipes']} recipes, "
+            f"{counts['ingredients']} ingredients, {counts['steps']} steps, "
+            f"{counts['tags']} tags and {counts['lookups']} new "
+            f"ingredients/units/tags in {importer.elapsed:.2f}s"
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Successfully loaded {counts['recipes']} recipes "
+                f"({counts['recipes'] / elapsed:.0f} recipes/s, "
+                f"{importer.rows / elapsed:.0f} rows/s)"
+            )
+        )
@@ -1,4 +1,6 @@
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes import refdata
 from recipes.models import Ingredient, Tag
 
 
@@ -250,15 +252,17 @@ class Command(BaseCommand):
             # Additional Ingredients
         ]
 
-        print("Starting ingredient population...")
+        self.stdout.write("Starting ingredient population...")
 
-        created_count = 0
-        existing_count = 0
-
-        for name, category, unit, dietary_flags_list, calories, protein, carbs, fat, fiber, sugars, sodium_mg, sat_fat in ingredients_data:
-            ingredient, created = Ingredient.objects.get_or_create(
-                name=name,
-                defaults={
+        with transaction.atomic():
+            dietary_tags = dict(
+                Tag.objects.filter(tag_type='dietary')
+                .values_list('name', 'pk')
+            )
+            rows, links = [], {}
+            for name, category, unit, dietary_flags_list, calories, protein, carbs, fat, fiber, sugars, sodium_mg, sat_fat in ingredients_data:
+                rows.append({
+                    'name': name,
                     'category': category,
                     'common_unit': unit,
                     'calories_per_100g': calories,
@@ -269,29 +273,21 @@ class Command(BaseCommand):
                     'sugars_per_100g': sugars,
                     'sodium_mg_per_100g': sodium_mg,
                     'saturated_fat_per_100g': sat_fat,
-                }
-            )
-            
-            if created:
-                created_count += 1
-                print(f"✓ Created: {name}")
-            else:
-                existing_count += 1
-                print(f"- Already exists: {name}")
-
-            # After ingredient, created = Ingredient.objects.get_or_create(...)
-            if created and dietary_flags_list:
+                })
+                links[name] = []
                 for flag in dietary_flags_list:
-                    try:
-                        tag_obj = Tag.objects.get(name=flag, tag_type='dietary')
-                        ingredient.dietary_tags.add(tag_obj)
-                    except Tag.DoesNotExist:
-                        print(f"Warning: Dietary tag '{flag}' not found for {name}")
-
-        print(f"\nDone! Created {created_count} new ingredients, {existing_count} already existed.")
-        print("Your ingredient database is now ready for recipes!")
-
-
+                    if flag in dietary_tags:
+                        links[name].append(dietary_tags[flag])
+                    else:
+                        self.stdout.write(f"Warning: Dietary tag '{flag}' not found for {name}")
 
+            result = refdata.sync(Ingredient, rows,
+                                  m2m={'dietary_tags': links})
 
+        for name in result.inserted:
+            self.stdout.write(f"✓ Created: {name}")
+        for name in result.updated:
+            self.stdout.write(f"✓ Updated: {name}")
 
+        self.stdout.write(f"\nDone! {result.summary('ingredients')}.")
+        self.stdout.write("Your ingredient database is now ready for recipes!")
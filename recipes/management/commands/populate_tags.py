@@ -1,5 +1,7 @@
 # recipes/management/commands/populate_tags.py
 from django.core.management.base import BaseCommand
+from django.db.models import Count
+from recipes import refdata
 from recipes.models import Tag
 
 class Command(BaseCommand):
@@ -80,45 +82,37 @@ class Command(BaseCommand):
             ('difficulty', 'Expert', '#dc3545'),
         ]
 
-        created_count = 0
-        updated_count = 0
+        types = {name: tag_type for tag_type, name, _ in tags_data}
+        result = refdata.sync(Tag, [
+            {'name': name, 'tag_type': tag_type, 'color': color}
+            for tag_type, name, color in tags_data
+        ])
 
-        for tag_type, name, color in tags_data:
-            tag, created = Tag.objects.get_or_create(
-                name=name,
-                defaults={
-                    'tag_type': tag_type,
-                    'color': color
-                }
+        for name in result.inserted:
+            self.stdout.write(
+                self.style.SUCCESS(f'Created tag: {name} ({types[name]})')
+            )
+        for name in result.updated:
+            self.stdout.write(
+                self.style.WARNING(f'Updated tag: {name} ({types[name]})')
             )
-            
-            if created:
-                created_count += 1
-                self.stdout.write(
-                    self.style.SUCCESS(f'Created tag: {name} ({tag_type})')
-                )
-            else:
-                # Update color if it has changed
-                if tag.color != color or tag.tag_type != tag_type:
-                    tag.color = color
-                    tag.tag_type = tag_type
-                    tag.save()
-                    updated_count += 1
-                    self.stdout.write(
-                        self.style.WARNING(f'Updated tag: {name} ({tag_type})')
-                    )
 
+        counts = dict(
+            Tag.objects.order_by().values_list('tag_type')
+            .annotate(count=Count('pk'))
+        )
         self.stdout.write(
             self.style.SUCCESS(
                 f'\nTag population complete!\n'
-                f'Created: {created_count} tags\n'
-                f'Updated: {updated_count} tags\n'
-                f'Total tags in database: {Tag.objects.count()}'
+                f'Created: {len(result.inserted)} tags\n'
+                f'Updated: {len(result.updated)} tags\n'
+                f'Unchanged: {len(result.unchanged)} tags\n'
+                f'Total tags in database: {sum(counts.values())}'
             )
         )
 
         # Show summary by category
         self.stdout.write('\nTags by category:')
         for tag_type_code, tag_type_name in Tag.TAG_TYPES:
-            count = Tag.objects.filter(tag_type=tag_type_code).count()
+            count = counts.get(tag_type_code, 0)
             self.stdout.write(f'  {tag_type_name}: {count} tags')
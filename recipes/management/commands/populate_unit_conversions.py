@@ -1,5 +1,6 @@
 # recipes/management/commands/populate_unit_conversions.py
 from django.core.management.base import BaseCommand
+from recipes import refdata
 from recipes.models import Unit
 
 
@@ -47,26 +48,27 @@ class Command(BaseCommand):
 
         all_conversions = {**weight_conversions, **volume_conversions, **count_conversions}
 
-        updated_count = 0
-        for unit in Unit.objects.all():
-            if unit.name in all_conversions:
-                unit.grams_per_unit = all_conversions[unit.name]
-                unit.save()
-                updated_count += 1
-                self.stdout.write(
-                    self.style.SUCCESS(
-                        f'Updated {unit.name}: {unit.grams_per_unit}g per unit'
-                    )
-                )
-            else:
-                self.stdout.write(
-                    self.style.WARNING(
-                        f'No conversion found for unit: {unit.name}'
-                    )
+        # Only units that already exist get a conversion
+        result = refdata.sync(Unit, [
+            {'name': name, 'grams_per_unit': grams}
+            for name, grams in all_conversions.items()
+        ], create=False)
+
+        for name in result.updated:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'Updated {name}: {all_conversions[name]}g per unit'
                 )
+            )
+        for name in (Unit.objects.exclude(name__in=all_conversions)
+                     .values_list('name', flat=True)):
+            self.stdout.write(
+                self.style.WARNING(f'No conversion found for unit: {name}')
+            )
 
         self.stdout.write(
             self.style.SUCCESS(
-                f'Successfully updated {updated_count} units with conversion values'
+                f'Successfully updated {len(result.updated)} units with '
+                f'conversion values ({len(result.unchanged)} already set)'
             )
         )
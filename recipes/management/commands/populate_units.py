@@ -1,5 +1,6 @@
 # recipes/management/commands/populate_units.py
 from django.core.management.base import BaseCommand
+from recipes import refdata
 from recipes.models import Unit
 
 class Command(BaseCommand):
@@ -40,24 +41,16 @@ class Command(BaseCommand):
 
         self.stdout.write("Starting units population...")
         
-        created_count = 0
-        existing_count = 0
+        result = refdata.sync(Unit, [
+            {'name': name, 'abbreviation': abbreviation,
+             'unit_type': unit_type}
+            for name, abbreviation, unit_type in units_data
+        ])
 
-        for name, abbreviation, unit_type in units_data:
-            unit, created = Unit.objects.get_or_create(
-                name=name,
-                defaults={
-                    'abbreviation': abbreviation,
-                    'unit_type': unit_type,
-                }
-            )
-            
-            if created:
-                created_count += 1
-                self.stdout.write(self.style.SUCCESS(f"✓ Created: {name} ({abbreviation})"))
-            else:
-                existing_count += 1
-                self.stdout.write(f"- Already exists: {name}")
+        for name in result.inserted:
+            self.stdout.write(self.style.SUCCESS(f"✓ Created: {name}"))
+        for name in result.updated:
+            self.stdout.write(self.style.WARNING(f"✓ Updated: {name}"))
 
-        self.stdout.write(f"\nDone! Created {created_count} new units, {existing_count} already existed.")
-        self.stdout.write(self.style.SUCCESS("Your units database is now ready!"))
\ No newline at end of file
+        self.stdout.write(f"\nDone! {result.summary('units')}.")
+        self.stdout.write(self.style.SUCCESS("Your units database is now ready!"))
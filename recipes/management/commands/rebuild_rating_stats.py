@@ -0,0 +1,36 @@
+"""
+Management command to rebuild the stored rating totals on recipes
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute rating_sum, rating_count and rating_avg for every recipe '
+        'from the Rating table'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipe',
+            action='append',
+            dest='slugs',
+            metavar='SLUG',
+            help='Only rebuild the given recipe (can be repeated)',
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.all()
+        if options['slugs']:
+            recipes = recipes.filter(slug__in=options['slugs'])
+
+        with transaction.atomic():
+            updated = recipes.refresh_rating_stats()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Rebuilt rating totals for {updated} recipes'
+            )
+        )
@@ -0,0 +1,23 @@
+"""
+Management command to rebuild the recipe full-text search index
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes import search
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the search document for every recipe (run after bulk '
+        'imports, which bypass the model signals)'
+    )
+
+    def handle(self, *args, **options):
+        backend = search.get_backend()
+        with transaction.atomic():
+            search.rebuild_index()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Rebuilt search index using {type(backend).__name__}'
+            )
+        )
@@ -0,0 +1,26 @@
+"""
+Management command to fan existing recipes out into followers' feeds
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from recipes.timeline import fan_out_pending
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy recipes that are not yet in home feeds into their followers\' '
+        'timelines (migration 0024 did this for existing recipes; authors '
+        'over the fan-out limit are skipped and stay read on demand)'
+    )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        fanned_out = fan_out_pending()
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Fanned out {fanned_out} recipes in {elapsed:.1f}s'
+            )
+        )
@@ -0,0 +1,48 @@
+"""
+Management command to recompute stored per-serving nutrition
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the stored per-serving nutrition for every recipe '
+        '(run after migrating and after bulk imports, which bypass the '
+        'model signals)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='Recipes per query/bulk update batch',
+        )
+        parser.add_argument(
+            '--missing-only',
+            action='store_true',
+            help='Only compute recipes that have no stored nutrition yet',
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.all()
+        if options['missing_only']:
+            recipes = recipes.filter(calories_per_serving__isnull=True)
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            updated = recipes.refresh_nutrition(
+                batch_size=options['batch_size']
+            )
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Recomputed nutrition for {updated} recipes '
+                f'in {elapsed:.1f}s'
+            )
+        )
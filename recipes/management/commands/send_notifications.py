@@ -0,0 +1,58 @@
+"""
+Management command that drains the notification outbox
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from recipes.notifications import deliver_due_notifications
+
+
+class Command(BaseCommand):
+    help = (
+        'Send queued email notifications, retrying failures with '
+        'exponential backoff. Runs until interrupted unless --once is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Send what is due now, then exit (e.g. from cron)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Notifications claimed per round',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5,
+            help='Seconds to sleep when nothing is due',
+        )
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        try:
+            while True:
+                sent, failed = deliver_due_notifications(
+                    options['batch_size']
+                )
+                total_sent += sent
+                total_failed += failed
+                if sent or failed:
+                    self.stdout.write(f'Sent {sent}, failed {failed}')
+                if sent + failed < options['batch_size']:
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Sent {total_sent} notifications '
+                f'({total_failed} failed attempts)'
+            )
+        )
@@ -0,0 +1,55 @@
+"""
+Management command to send the weekly recipe digest to every user
+"""
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from recipes.digest import CHUNK_SIZE, send_weekly_digests, week_start
+
+
+class Command(BaseCommand):
+    help = (
+        "Email last week's recipe digest to every user (schedule weekly). "
+        'An interrupted run picks up where it stopped when run again.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--week',
+            help='Monday (YYYY-MM-DD) of the week to send; defaults to '
+                 'last week',
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Send to everyone again, ignoring earlier progress',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_SIZE,
+            help='Users rendered and sent per batch (and per checkpoint)',
+        )
+
+    def handle(self, *args, **options):
+        start = week_start()
+        if options['week']:
+            try:
+                start = date.fromisoformat(options['week'])
+            except ValueError:
+                raise CommandError('--week must be a date like 2024-01-01')
+            if start.weekday() != 0:
+                raise CommandError('--week must be a Monday')
+
+        started = time.perf_counter()
+        sent = send_weekly_digests(start, restart=options['restart'],
+                                   chunk_size=options['chunk_size'])
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Sent {sent} digests for the week of {start} '
+                f'in {elapsed:.1f}s'
+            )
+        )
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.23 on 2026-10-17 23:02
+
+from django.db import migrations, models
+from django.db.models import Avg, Count, FloatField, OuterRef, Subquery, Sum
+from django.db.models.functions import Cast, Coalesce
+
+
+def backfill_rating_stats(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Rating = apps.get_model('recipes', 'Rating')
+    ratings = Rating.objects.filter(recipe=OuterRef('pk')).values('recipe')
+    Recipe.objects.update(
+        rating_sum=Coalesce(
+            Subquery(ratings.annotate(total=Sum('rating')).values('total')), 0
+        ),
+        rating_count=Coalesce(
+            Subquery(ratings.annotate(total=Count('id')).values('total')), 0
+        ),
+        rating_avg=Coalesce(
+            Subquery(ratings.annotate(
+                average=Avg(Cast('rating', FloatField()))
+            ).values('average')), 0.0
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_alter_comment_content_alter_recipe_cook_time_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='rating_avg',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-rating_avg', '-created_at'], name='recipe_rating_avg_idx'),
+        ),
+        migrations.RunPython(backfill_rating_stats, migrations.RunPython.noop),
+    ]
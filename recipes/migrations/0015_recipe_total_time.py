@@ -0,0 +1,29 @@
+# Generated by Django 4.2.23 on 2026-10-17 23:05
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_total_time(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Recipe.objects.update(total_time=F('prep_time') + F('cook_time'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_recipe_rating_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='total_time',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['total_time', 'created_at'], name='recipe_total_time_idx'),
+        ),
+        migrations.RunPython(backfill_total_time, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 4.2.23 on 2026-10-17 23:20
+
+from django.db import migrations
+
+
+SQLITE_CREATE = [
+    '''
+    CREATE VIRTUAL TABLE recipes_recipe_fts USING fts5(
+        title, description, tags, ingredients,
+        tokenize = 'porter unicode61'
+    )
+    ''',
+    '''
+    INSERT INTO recipes_recipe_fts
+        (rowid, title, description, tags, ingredients)
+    SELECT r.id, r.title, r.description,
+        COALESCE((SELECT group_concat(t.name, ' ')
+                  FROM recipes_recipe_tags rt
+                  JOIN recipes_tag t ON t.id = rt.tag_id
+                  WHERE rt.recipe_id = r.id), ''),
+        COALESCE((SELECT group_concat(i.name, ' ')
+                  FROM recipes_recipeingredient ri
+                  JOIN recipes_ingredient i ON i.id = ri.ingredient_id
+                  WHERE ri.recipe_id = r.id), '')
+    FROM recipes_recipe r
+    ''',
+]
+
+SQLITE_DROP = ['DROP TABLE IF EXISTS recipes_recipe_fts']
+
+POSTGRES_CREATE = [
+    '''
+    CREATE TABLE recipes_recipe_search (
+        recipe_id bigint PRIMARY KEY
+            REFERENCES recipes_recipe (id)
+            ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+        document tsvector NOT NULL
+    )
+    ''',
+    '''
+    CREATE INDEX recipes_recipe_search_document_gin
+        ON recipes_recipe_search USING GIN (document)
+    ''',
+    '''
+    INSERT INTO recipes_recipe_search (recipe_id, document)
+    SELECT r.id,
+        setweight(to_tsvector('english', r.title), 'A') ||
+        setweight(to_tsvector('english', r.description), 'B') ||
+        setweight(to_tsvector('english', COALESCE(
+            (SELECT string_agg(t.name, ' ')
+             FROM recipes_recipe_tags rt
+             JOIN recipes_tag t ON t.id = rt.tag_id
+             WHERE rt.recipe_id = r.id), '')), 'C') ||
+        setweight(to_tsvector('english', COALESCE(
+            (SELECT string_agg(i.name, ' ')
+             FROM recipes_recipeingredient ri
+             JOIN recipes_ingredient i ON i.id = ri.ingredient_id
+             WHERE ri.recipe_id = r.id), '')), 'C')
+    FROM recipes_recipe r
+    ''',
+]
+
+POSTGRES_DROP = ['DROP TABLE IF EXISTS recipes_recipe_search']
+
+
+def run_for_vendor(statements):
+    def operation(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_recipe_total_time'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor({
+                'sqlite': SQLITE_CREATE,
+                'postgresql': POSTGRES_CREATE,
+            }),
+            run_for_vendor({
+                'sqlite': SQLITE_DROP,
+                'postgresql': POSTGRES_DROP,
+            }),
+        ),
+    ]
@@ -0,0 +1,109 @@
+# Generated by Django 4.2.23 on 2026-10-17 23:10
+
+from django.db import migrations, models
+
+# (Ingredient per-100g field, Recipe per-serving field) as of this
+# migration; recipes.nutrition.NUTRIENTS may change after it
+NUTRIENTS = [
+    ('calories_per_100g', 'calories_per_serving'),
+    ('protein_per_100g', 'protein_per_serving'),
+    ('carbs_per_100g', 'carbs_per_serving'),
+    ('fat_per_100g', 'fat_per_serving'),
+    ('fibre_per_100g', 'fibre_per_serving'),
+    ('sugars_per_100g', 'sugars_per_serving'),
+    ('sodium_mg_per_100g', 'sodium_mg_per_serving'),
+    ('saturated_fat_per_100g', 'saturated_fat_per_serving'),
+]
+SERVING_FIELDS = [serving_field for _, serving_field in NUTRIENTS]
+
+BATCH_SIZE = 2000
+
+
+def backfill_nutrition(apps, schema_editor):
+    # Store per-serving nutrition for existing recipes. Same arithmetic as
+    # recipes.nutrition.calculate_nutrition(), on the historical models.
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    recipe_ids = list(
+        Recipe.objects.filter(calories_per_serving__isnull=True)
+        .values_list('pk', flat=True)
+    )
+    for start in range(0, len(recipe_ids), BATCH_SIZE):
+        batch = recipe_ids[start:start + BATCH_SIZE]
+        totals = {recipe_id: [0] * len(NUTRIENTS) for recipe_id in batch}
+        rows = (
+            RecipeIngredient.objects.filter(recipe_id__in=batch)
+            .order_by('recipe_id', 'order', 'pk')
+            .values_list('recipe_id', 'quantity', 'unit__grams_per_unit',
+                         *[f'ingredient__{field}'
+                           for field, _ in NUTRIENTS])
+        )
+        for recipe_id, quantity, grams_per_unit, *per_100g in rows:
+            grams = float(quantity)
+            if grams_per_unit:
+                grams *= float(grams_per_unit)
+            for i, value in enumerate(per_100g):
+                if value:
+                    totals[recipe_id][i] += (grams / 100) * float(value)
+
+        recipes = []
+        for recipe_id, servings in (Recipe.objects.filter(pk__in=batch)
+                                    .values_list('pk', 'servings')):
+            recipe = Recipe(pk=recipe_id)
+            for (_, serving_field), total in zip(NUTRIENTS,
+                                                 totals[recipe_id]):
+                setattr(recipe, serving_field,
+                        round(total / (servings or 1), 1))
+            recipes.append(recipe)
+        Recipe.objects.bulk_update(recipes, SERVING_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0016_recipe_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='calories_per_serving',
+            field=models.DecimalField(decimal_places=1, editable=False, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='carbs_per_serving',
+            field=models.DecimalField(decimal_places=1, editable=False, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='fat_per_serving',
+            field=models.DecimalField(decimal_places=1, editable=False, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='fibre_per_serving',
+            field=models.DecimalField(decimal_places=1, editable=False, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='protein_per_serving',
+            field=models.DecimalField(decimal_places=1, editable=False, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='saturated_fat_per_serving',
+            field=models.DecimalField(decimal_places=1, editable=False, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='sodium_mg_per_serving',
+            field=models.DecimalField(decimal_places=1, editable=False, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='sugars_per_serving',
+            field=models.DecimalField(decimal_places=1, editable=False, max_digits=10, null=True),
+        ),
+        migrations.RunPython(backfill_nutrition, migrations.RunPython.noop),
+    ]
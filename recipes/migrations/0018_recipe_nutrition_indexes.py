@@ -0,0 +1,29 @@
+# Generated by Django 4.2.23 on 2026-10-17 23:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0017_recipe_nutrition_per_serving'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['calories_per_serving', '-created_at'], name='recipe_calories_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-protein_per_serving', '-created_at'], name='recipe_protein_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['carbs_per_serving'], name='recipe_carbs_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['fat_per_serving'], name='recipe_fat_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.23 on 2026-10-18 10:12
+
+from django.conf import settings
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def fan_out_existing_recipes(apps, schema_editor):
+    """Copy recipes from before timelines into their followers' feeds.
+
+    Mirrors recipes.timeline.fan_out_pending(): authors over the fan-out
+    limit keep their recipes read into feeds on demand.
+    """
+    Follow = apps.get_model('recipes', 'Follow')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    TimelineEntry = apps.get_model('recipes', 'TimelineEntry')
+    limit = getattr(settings, 'RECIPE_FEED_FANOUT_LIMIT', 1000)
+
+    pending = Recipe.objects.filter(fanned_out=False).order_by()
+    author_ids = list(pending.values_list('user_id', flat=True).distinct())
+    for author_id in author_ids:
+        follower_ids = list(Follow.objects.filter(followed_id=author_id)
+                            .values_list('follower_id', flat=True))
+        if len(follower_ids) > limit:
+            continue
+        recipes = list(pending.filter(user_id=author_id)
+                       .values_list('pk', 'created_at'))
+        per_batch = max(1, BATCH_SIZE // len(recipes))
+        for start in range(0, len(follower_ids), per_batch):
+            TimelineEntry.objects.bulk_create([
+                TimelineEntry(user_id=user_id, recipe_id=recipe_id,
+                              author_id=author_id, created_at=created_at)
+                for user_id in follower_ids[start:start + per_batch]
+                for recipe_id, created_at in recipes
+            ], ignore_conflicts=True)
+        Recipe.objects.filter(
+            pk__in=[recipe_id for recipe_id, _ in recipes]
+        ).update(fanned_out=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0023_digest_runs'),
+    ]
+
+    operations = [
+        migrations.RunPython(fan_out_existing_recipes,
+                             migrations.RunPython.noop),
+    ]
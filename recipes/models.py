@@ -1,8 +1,13 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Avg, Case, Count, F, OuterRef, Subquery, Sum, When
+from django.db.models.functions import Cast, Coalesce
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.urls import reverse
 from django.utils.text import slugify
+from django.utils import timezone
 from cloudinary.models import CloudinaryField
 
 
@@ -92,9 +97,36 @@ class Ingredient(models.Model):
         help_text='Dietary restriction tags'
     )
 
+    # Fields recipes' stored nutrition is calculated from
+    NUTRIENT_FIELDS = (
+        'calories_per_100g', 'protein_per_100g', 'carbs_per_100g',
+        'fat_per_100g', 'fibre_per_100g', 'sugars_per_100g',
+        'sodium_mg_per_100g', 'saturated_fat_per_100g',
+    )
+
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored values so saves can tell if they changed
+        instance._stored_nutrients = instance._nutrients()
+        return instance
+
+    def _nutrients(self):
+        return tuple(self.__dict__.get(field)
+                     for field in self.NUTRIENT_FIELDS)
+
+    def nutrients_changed(self):
+        """Whether nutrient values differ from when this was loaded"""
+        stored = getattr(self, '_stored_nutrients', None)
+        return stored is None or stored != self._nutrients()
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._stored_nutrients = self._nutrients()
+
     class Meta:
         ordering = ['name']
 
@@ -126,10 +158,178 @@ class Unit(models.Model):
     def __str__(self):
         return f"{self.name} ({self.abbreviation})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored value so saves can tell if it changed
+        instance._stored_grams_per_unit = (
+            instance.__dict__.get('grams_per_unit', models.DEFERRED)
+        )
+        return instance
+
+    def grams_per_unit_changed(self):
+        """Whether grams_per_unit differs from when this was loaded"""
+        stored = getattr(self, '_stored_grams_per_unit', models.DEFERRED)
+        return stored is models.DEFERRED or stored != self.grams_per_unit
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._stored_grams_per_unit = self.grams_per_unit
+
     class Meta:
         ordering = ['unit_type', 'name']
 
 
+# Distinct base slugs looked up per query by allocate_slugs()
+SLUG_QUERY_BATCH = 100
+# Times Recipe.save() picks a new slug when a concurrent save takes it
+SLUG_ATTEMPTS = 5
+
+
+class RecipeQuerySet(models.QuerySet):
+    """Query helpers shared by the recipe views and recommendations"""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        """Bulk insert recipes, filling in the stored total_time"""
+        objs = list(objs)
+        for recipe in objs:
+            recipe.total_time = recipe.calculate_total_time()
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def update(self, **kwargs):
+        """Update recipes, keeping total_time in step with the timings"""
+        if ('prep_time' in kwargs or 'cook_time' in kwargs) and (
+                'total_time' not in kwargs):
+            kwargs['total_time'] = (
+                kwargs.get('prep_time', F('prep_time')) +
+                kwargs.get('cook_time', F('cook_time'))
+            )
+        return super().update(**kwargs)
+
+    def allocate_slugs(self, titles):
+        """Free slugs for new recipes with the given titles, in order.
+
+        Each title gets the first free slug of title, title-1, title-2,
+        ... One query fetches every taken slug with the same base for up
+        to SLUG_QUERY_BATCH distinct titles, however many copies exist,
+        and titles repeated in the list get successive suffixes.
+        """
+        bases = [slugify(title) for title in titles]
+        taken = {base: set() for base in bases}
+        distinct = sorted(taken)
+        for start in range(0, len(distinct), SLUG_QUERY_BATCH):
+            chunk = distinct[start:start + SLUG_QUERY_BATCH]
+            query = models.Q(slug__in=chunk)
+            for base in chunk:
+                query |= models.Q(slug__startswith=f'{base}-')
+            for slug in self.model.objects.filter(query).values_list(
+                    'slug', flat=True):
+                if slug in taken:
+                    taken[slug].add(0)
+                base, _, suffix = slug.rpartition('-')
+                if base in taken and suffix.isdigit() and (
+                        str(int(suffix)) == suffix):
+                    taken[base].add(int(suffix))
+
+        slugs = []
+        for base in bases:
+            suffix = 0
+            while suffix in taken[base]:
+                suffix += 1
+            taken[base].add(suffix)
+            slugs.append(f'{base}-{suffix}' if suffix else base)
+        return slugs
+
+    def with_all_tags(self, tags):
+        """Keep only recipes that carry every one of the given tags.
+
+        Done as relational division in SQL: the recipe/tag through rows
+        for the wanted tags are grouped per recipe and only recipes whose
+        match count equals the number of tags survive. The result is a
+        single subquery, so the cost does not grow with the number of
+        recipes in the catalogue. Accepts Tag instances or tag ids.
+        """
+        tag_ids = {getattr(tag, 'pk', tag) for tag in tags}
+        if not tag_ids:
+            return self
+
+        matching = (
+            self.model.tags.through.objects
+            .filter(tag_id__in=tag_ids)
+            .values('recipe_id')
+            .annotate(matched=Count('tag_id'))
+            .filter(matched=len(tag_ids))
+            .values('recipe_id')
+        )
+        return self.filter(id__in=matching)
+
+    def apply_rating_change(self, sum_delta, count_delta):
+        """Shift the stored rating totals by the given deltas.
+
+        One UPDATE; every right-hand side sees the pre-update values so the
+        average is derived from the new sum and count in the same statement.
+        """
+        new_sum = F('rating_sum') + sum_delta
+        new_count = F('rating_count') + count_delta
+        return self.update(
+            rating_sum=new_sum,
+            rating_count=new_count,
+            rating_avg=Case(
+                When(rating_count=-count_delta, then=0.0),
+                default=(Cast(new_sum, models.FloatField()) /
+                         Cast(new_count, models.FloatField())),
+                output_field=models.FloatField(),
+            ),
+        )
+
+    def refresh_nutrition(self, batch_size=2000):
+        """Recompute the stored per-serving nutrition for these recipes.
+
+        Works through the recipes in batches: one query loads a batch's
+        ingredient rows, then one bulk UPDATE writes the results.
+        Returns the number of recipes updated.
+        """
+        from .nutrition import (NUTRIENTS, SERVING_FIELDS,
+                                nutrition_for_recipes)
+
+        recipe_ids = list(self.values_list('pk', flat=True))
+        for start in range(0, len(recipe_ids), batch_size):
+            batch = nutrition_for_recipes(self.model.objects.filter(
+                pk__in=recipe_ids[start:start + batch_size]
+            ))
+            recipes = []
+            for recipe_id, values in batch.items():
+                recipe = self.model(pk=recipe_id)
+                for key, _, serving_field in NUTRIENTS:
+                    setattr(recipe, serving_field, values[key])
+                recipes.append(recipe)
+            self.model.objects.bulk_update(recipes, SERVING_FIELDS)
+        return len(recipe_ids)
+
+    def refresh_rating_stats(self):
+        """Recompute the stored rating totals from the Rating table.
+
+        Issues a single UPDATE with correlated subqueries for all recipes
+        in the queryset. Returns the number of recipes updated.
+        """
+        ratings = Rating.objects.filter(recipe=OuterRef('pk')).values('recipe')
+        return self.update(
+            rating_sum=Coalesce(
+                Subquery(ratings.annotate(total=Sum('rating'))
+                         .values('total')), 0
+            ),
+            rating_count=Coalesce(
+                Subquery(ratings.annotate(total=Count('id'))
+                         .values('total')), 0
+            ),
+            rating_avg=Coalesce(
+                Subquery(ratings.annotate(
+                    average=Avg(Cast('rating', models.FloatField()))
+                ).values('average')), 0.0
+            ),
+        )
+
+
 class Recipe(models.Model):
     """Main recipe model"""
     user = models.ForeignKey(User, on_delete=models.CASCADE,
@@ -154,6 +354,9 @@ class Recipe(models.Model):
         help_text='Cooking time in minutes (max 1440 = 24 hours)',
         validators=[MinValueValidator(1), MaxValueValidator(1440)]
     )
+    # prep_time + cook_time, stored so time filters and sorts can use an
+    # index. Maintained by save(), bulk_create() and update().
+    total_time = models.PositiveIntegerField(default=0, editable=False)
     servings = models.PositiveIntegerField(
         default=4,
         help_text='Number of servings (max 100)',
@@ -178,28 +381,72 @@ class Recipe(models.Model):
     # Engagement stats (we'll calculate these)
     view_count = models.PositiveIntegerField(default=0)
 
+    # Rating totals, kept in step by Rating.save() and Rating deletion
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_avg = models.FloatField(default=0, editable=False)
+
+    # Nutrition per serving, derived from the ingredients by
+    # recipes.nutrition and refreshed by recipes.signals
+    calories_per_serving = models.DecimalField(
+        max_digits=10, decimal_places=1, null=True, editable=False)
+    protein_per_serving = models.DecimalField(
+        max_digits=10, decimal_places=1, null=True, editable=False)
+    carbs_per_serving = models.DecimalField(
+        max_digits=10, decimal_places=1, null=True, editable=False)
+    fat_per_serving = models.DecimalField(
+        max_digits=10, decimal_places=1, null=True, editable=False)
+    fibre_per_serving = models.DecimalField(
+        max_digits=10, decimal_places=1, null=True, editable=False)
+    sugars_per_serving = models.DecimalField(
+        max_digits=10, decimal_places=1, null=True, editable=False)
+    sodium_mg_per_serving = models.DecimalField(
+        max_digits=10, decimal_places=1, null=True, editable=False)
+    saturated_fat_per_serving = models.DecimalField(
+        max_digits=10, decimal_places=1, null=True, editable=False)
+
+    # Set when tags, ingredients or likes change; build_related_recipes
+    # rescores flagged recipes and clears it
+    related_stale = models.BooleanField(default=True, editable=False,
+                                        db_index=True)
+    # Set once the recipe has been copied into its followers' timelines;
+    # recipes without it are merged into feeds at read time (see
+    # recipes.timeline)
+    fanned_out = models.BooleanField(default=False, editable=False)
+
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = RecipeQuerySet.as_manager()
+
     def __str__(self):
         return self.title
 
     def save(self, *args, **kwargs):
-        """Auto-generate slug from title"""
-        if not self.slug:
-            base_slug = slugify(self.title)
-            slug = base_slug
-            counter = 1
-
-            # Ensure unique slug
-            while Recipe.objects.filter(slug=slug).exists():
-                slug = f"{base_slug}-{counter}"
-                counter += 1
-
-            self.slug = slug
-
-        super().save(*args, **kwargs)
+        """Auto-generate slug from title and store the total time"""
+        self.total_time = self.calculate_total_time()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and (
+                {'prep_time', 'cook_time'} & set(update_fields)):
+            kwargs['update_fields'] = {*update_fields, 'total_time'}
+
+        if self.slug:
+            super().save(*args, **kwargs)
+            return
+
+        for attempt in range(1, SLUG_ATTEMPTS + 1):
+            self.slug = Recipe.objects.allocate_slugs([self.title])[0]
+            try:
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+                return
+            except IntegrityError:
+                # Retry only if a concurrent save took the slug first
+                taken = Recipe.objects.filter(slug=self.slug).exists()
+                self.slug = ''
+                if not taken or attempt == SLUG_ATTEMPTS:
+                    raise
 
     def get_absolute_url(self):
         return reverse('recipes:recipe_detail', kwargs={'slug': self.slug})
@@ -220,74 +467,26 @@ class Recipe(models.Model):
             return self.image_url
         return static('images/default_recipe.png')
 
-    @property
-    def total_time(self):
+    def calculate_total_time(self):
         """Calculate total cooking time"""
-        return self.prep_time + self.cook_time
+        return (self.prep_time or 0) + (self.cook_time or 0)
 
     @property
     def average_rating(self):
-        """Calculate average rating"""
-        ratings = self.ratings.all()
-        if ratings:
-            return sum(r.rating for r in ratings) / len(ratings)
-        return 0
-
-    @property
-    def rating_count(self):
-        """Count of ratings"""
-        return self.ratings.count()
+        """Average rating, read from the stored rating totals"""
+        return self.rating_avg
 
     @property
     def nutrition_per_serving(self):
-        """Calculate nutritional information per serving"""
-        total_calories = 0
-        total_protein = 0
-        total_carbs = 0
-        total_fat = 0
-        
-        for recipe_ingredient in self.ingredients.all():
-            if recipe_ingredient.ingredient and recipe_ingredient.unit:
-                # Convert quantity to grams using unit conversion
-                if recipe_ingredient.unit.grams_per_unit:
-                    quantity_in_grams = (
-                        float(recipe_ingredient.quantity) * 
-                        float(recipe_ingredient.unit.grams_per_unit)
-                    )
-                else:
-                    # Fallback: assume quantity is already in grams
-                    quantity_in_grams = float(recipe_ingredient.quantity)
-                
-                # Calculate nutrition based on quantity in grams
-                ingredient = recipe_ingredient.ingredient
-                if ingredient.calories_per_100g:
-                    total_calories += (
-                        (quantity_in_grams / 100) * 
-                        float(ingredient.calories_per_100g)
-                    )
-                if ingredient.protein_per_100g:
-                    total_protein += (
-                        (quantity_in_grams / 100) * 
-                        float(ingredient.protein_per_100g)
-                    )
-                if ingredient.carbs_per_100g:
-                    total_carbs += (
-                        (quantity_in_grams / 100) * 
-                        float(ingredient.carbs_per_100g)
-                    )
-                if ingredient.fat_per_100g:
-                    total_fat += (
-                        (quantity_in_grams / 100) * 
-                        float(ingredient.fat_per_100g)
-                    )
-        
-        # Divide by servings
-        servings = self.servings or 1
+        """Nutritional information per serving, read from stored values"""
+        from .nutrition import NUTRIENTS, calculate_nutrition
+
+        if self.calories_per_serving is None:
+            # Not computed yet (e.g. inserted in bulk); work it out live
+            return calculate_nutrition(self)
         return {
-            'calories': round(total_calories / servings, 1),
-            'protein': round(total_protein / servings, 1),
-            'carbs': round(total_carbs / servings, 1),
-            'fat': round(total_fat / servings, 1),
+            key: float(getattr(self, serving_field))
+            for key, _, serving_field in NUTRIENTS
         }
 
     @property
@@ -303,6 +502,22 @@ class Recipe(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-rating_avg', '-created_at'],
+                         name='recipe_rating_avg_idx'),
+            models.Index(fields=['total_time', 'created_at'],
+                         name='recipe_total_time_idx'),
+            models.Index(fields=['calories_per_serving', '-created_at'],
+                         name='recipe_calories_idx'),
+            models.Index(fields=['-protein_per_serving', '-created_at'],
+                         name='recipe_protein_idx'),
+            models.Index(fields=['carbs_per_serving'],
+                         name='recipe_carbs_idx'),
+            models.Index(fields=['fat_per_serving'], name='recipe_fat_idx'),
+            models.Index(fields=['user', '-created_at', '-id'],
+                         condition=models.Q(fanned_out=False),
+                         name='recipe_feed_pull_idx'),
+        ]
 
 
 class RecipeIngredient(models.Model):
@@ -514,11 +729,57 @@ class Rating(models.Model):
                  else self.recipe.title)
         return f"{self.user.username} rated {title}: {self.rating}/5"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored value so save() can apply just the difference
+        instance._stored_rating = instance.__dict__.get('rating')
+        return instance
+
+    def save(self, *args, **kwargs):
+        """Save the rating and update the recipe's rating totals with it"""
+        adding = self._state.adding
+        stored_rating = getattr(self, '_stored_rating', None)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            recipes = Recipe.objects.filter(pk=self.recipe_id)
+            if adding:
+                recipes.apply_rating_change(self.rating, 1)
+            elif stored_rating is None:
+                recipes.refresh_rating_stats()
+            elif stored_rating != self.rating:
+                recipes.apply_rating_change(self.rating - stored_rating, 0)
+        self._stored_rating = self.rating
+        self._sync_recipe_rating_stats()
+
+    def _sync_recipe_rating_stats(self):
+        """Reload the totals on an already loaded recipe instance"""
+        if self._meta.get_field('recipe').is_cached(self):
+            try:
+                self.recipe.refresh_from_db(
+                    fields=['rating_sum', 'rating_count', 'rating_avg']
+                )
+            except Recipe.DoesNotExist:
+                pass
+
     class Meta:
         unique_together = ('recipe', 'user')
         ordering = ['-created_at']
 
 
+@receiver(post_delete, sender=Rating)
+def remove_rating_from_recipe_stats(sender, instance, **kwargs):
+    """Take a deleted rating out of its recipe's rating totals.
+
+    post_delete runs inside the deletion transaction, so this also covers
+    queryset deletes and cascades.
+    """
+    Recipe.objects.filter(pk=instance.recipe_id).apply_rating_change(
+        -instance.rating, -1
+    )
+    instance._sync_recipe_rating_stats()
+
+
 class Comment(models.Model):
     """User comments/reviews for recipes."""
     recipe = models.ForeignKey(
@@ -612,3 +873,186 @@ class RecipeLike(models.Model):
     class Meta:
         unique_together = ('user', 'recipe')
         ordering = ['-created_at']
+
+
+class RelatedRecipe(models.Model):
+    """A recipe's precomputed related recipes, best first.
+
+    Built offline by the build_related_recipes command (see
+    recipes.related).
+    """
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='related_entries'
+    )
+    related = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='related_from'
+    )
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    def __str__(self):
+        return f"{self.recipe.title} -> {self.related.title} ({self.rank})"
+
+    class Meta:
+        ordering = ['recipe', 'rank']
+        unique_together = ('recipe', 'rank')
+
+
+class RecommendedRecipe(models.Model):
+    """A user's precomputed "For You" ranking, best first.
+
+    Built in the background by the build_recommendations command (see
+    recipes.recommendations).
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='recommended_recipes'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='recommended_for'
+    )
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    def __str__(self):
+        return f"{self.recipe.title} for {self.user.username} ({self.rank})"
+
+    class Meta:
+        ordering = ['user', 'rank']
+        unique_together = ('user', 'rank')
+
+
+class TimelineEntry(models.Model):
+    """A recipe copied into a follower's home feed (see recipes.timeline)"""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    # The recipe's created_at, so the feed can be read from one index
+    created_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.recipe.title} in {self.user.username}'s feed"
+
+    class Meta:
+        ordering = ['user', '-created_at', '-recipe']
+        unique_together = ('user', 'recipe')
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-recipe'],
+                         name='timeline_feed_idx'),
+            models.Index(fields=['user', 'author'],
+                         name='timeline_author_idx'),
+        ]
+
+
+class Notification(models.Model):
+    """An email notification waiting in the outbox.
+
+    Requests only insert these; the send_notifications worker renders and
+    delivers them (see recipes.notifications).
+    """
+    COMMENT = 'comment'
+    RATING = 'rating'
+    NEW_FOLLOWER = 'new_follower'
+    KIND_CHOICES = [
+        (COMMENT, 'New comment'),
+        (RATING, 'New rating'),
+        (NEW_FOLLOWER, 'New follower'),
+    ]
+
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    recipient = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='notifications'
+    )
+    # Who caused it (commenter, rater or follower)
+    actor = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    comment = models.ForeignKey(
+        'Comment',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    rating = models.ForeignKey(
+        'Rating',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+
+    # Delivery state, maintained by the worker
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES,
+                              default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return (f"{self.get_kind_display()} for {self.recipient.username} "
+                f"({self.status})")
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'],
+                         name='notification_due_idx'),
+        ]
+
+
+class DigestRun(models.Model):
+    """Progress of one week's digest emails (see recipes.digest)"""
+    week_start = models.DateField(unique=True)
+    # Users are mailed in pk order; everyone up to here has been sent
+    last_user_id = models.PositiveIntegerField(default=0)
+    emails_sent = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Digest for the week of {self.week_start}"
+
+    class Meta:
+        ordering = ['-week_start']
@@ -1,156 +1,295 @@
 # recipes/notifications.py
+"""
+Email notifications.
+
+Comment, rating and new follower emails go through a database outbox:
+the request only inserts a Notification row, and the send_notifications
+worker renders and sends due rows outside the request. A failed send is
+retried with exponential backoff (RETRY_BASE_DELAY doubling per attempt,
+capped at RETRY_MAX_DELAY) and given up on after MAX_ATTEMPTS.
+
+A new row only becomes due NOTIFICATION_COALESCE_WINDOW seconds after it
+is queued. When it does, every pending row for the same recipient, kind
+and recipe is claimed with it and sent as one message ("12 new ratings
+on your recipe"), so a burst of activity doesn't flood an inbox.
+
+Each round renders all claimed messages and sends them through a single
+reused connection with send_messages(), rather than one SMTP handshake
+per email.
+
+Workers claim rows by pushing their next_attempt_at CLAIM_TIMEOUT past
+the end of the coalescing window (under SELECT ... FOR UPDATE SKIP
+LOCKED where the database supports it), so several workers can share
+the outbox and rows claimed by a worker that died become due again.
+Only rows due within the window are coalesced, which leaves out rows
+another worker has already claimed.
+
+The weekly digest is sent in bulk instead; see recipes.digest.
+"""
 import logging
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
+from datetime import timedelta
+
 from django.conf import settings
-from .models import Recipe
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import Notification
 
 logger = logging.getLogger(__name__)
 
+MAX_ATTEMPTS = 6
+RETRY_BASE_DELAY = 60  # seconds
+RETRY_MAX_DELAY = 6 * 3600  # seconds
+CLAIM_TIMEOUT = 600  # seconds
+DEFAULT_COALESCE_WINDOW = 60  # seconds
+
+
+def _coalesce_window():
+    return getattr(settings, 'NOTIFICATION_COALESCE_WINDOW',
+                   DEFAULT_COALESCE_WINDOW)
+
+
+def _queue(**fields):
+    Notification.objects.create(
+        next_attempt_at=timezone.now() + timedelta(
+            seconds=_coalesce_window()
+        ),
+        **fields
+    )
+
 
 def send_comment_notification(comment, recipe_owner):
-    """Send email notification when someone comments on a recipe"""
+    """Queue an email telling a recipe's owner about a new comment"""
     if not recipe_owner.email:
         return
-        
-    subject = f"New comment on your recipe: {comment.recipe.title}"
-    
-    context = {
-        'recipe_owner': recipe_owner,
-        'comment': comment,
-        'recipe': comment.recipe,
-        'commenter': comment.user,
-    }
-    
-    # Render email content
-    html_message = render_to_string(
-        'emails/comment_notification.html', context
-    )
-    plain_message = render_to_string(
-        'emails/comment_notification.txt', context
-    )
-    
-    try:
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            html_message=html_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[recipe_owner.email],
-            fail_silently=True,
-        )
-    except Exception as e:
-        # Log error properly
-        logger.error(f"Failed to send comment notification: {e}")
+    _queue(kind=Notification.COMMENT, recipient=recipe_owner,
+           actor=comment.user, recipe=comment.recipe, comment=comment)
 
 
 def send_rating_notification(rating, recipe_owner):
-    """Send email notification when someone rates a recipe"""
+    """Queue an email telling a recipe's owner about a new rating"""
     if not recipe_owner.email:
         return
-        
-    subject = (
-        f"New {rating.rating}-star rating on your recipe: "
-        f"{rating.recipe.title}"
+    _queue(kind=Notification.RATING, recipient=recipe_owner,
+           actor=rating.user, recipe=rating.recipe, rating=rating)
+
+
+def send_new_follower_notification(followed_user, follower):
+    """Queue an email telling a user about a new follower"""
+    if not followed_user.email:
+        return
+    _queue(kind=Notification.NEW_FOLLOWER, recipient=followed_user,
+           actor=follower)
+
+
+def _single_message(notification):
+    """Subject, template and context for a notification sent on its own"""
+    recipient = notification.recipient
+    if notification.kind == Notification.COMMENT:
+        return (
+            f"New comment on your recipe: {notification.recipe.title}",
+            'emails/comment_notification',
+            {
+                'recipe_owner': recipient,
+                'comment': notification.comment,
+                'recipe': notification.recipe,
+                'commenter': notification.actor,
+            },
+        )
+    if notification.kind == Notification.RATING:
+        return (
+            f"New {notification.rating.rating}-star rating on your recipe: "
+            f"{notification.recipe.title}",
+            'emails/rating_notification',
+            {
+                'recipe_owner': recipient,
+                'rating': notification.rating,
+                'recipe': notification.recipe,
+                'rater': notification.actor,
+            },
+        )
+    return (
+        f"{notification.actor.username} started following you on OnlyPans!",
+        'emails/new_follower',
+        {
+            'followed_user': recipient,
+            'follower': notification.actor,
+        },
     )
-    
-    context = {
-        'recipe_owner': recipe_owner,
-        'rating': rating,
-        'recipe': rating.recipe,
-        'rater': rating.user,
+
+
+def _summary_message(notifications):
+    """Subject, template and context for several coalesced notifications"""
+    first = notifications[0]
+    count = len(notifications)
+    if first.kind == Notification.COMMENT:
+        subject = (f"{count} new comments on your recipe: "
+                   f"{first.recipe.title}")
+        items = [f'{n.actor.username}: "{n.comment.content}"'
+                 for n in notifications]
+    elif first.kind == Notification.RATING:
+        subject = (f"You got {count} new ratings on your recipe: "
+                   f"{first.recipe.title}")
+        items = [f"{n.actor.username} gave it {n.rating.rating} stars"
+                 for n in notifications]
+    else:
+        subject = f"{count} people started following you on OnlyPans!"
+        items = [n.actor.username for n in notifications]
+    return subject, 'emails/notification_summary', {
+        'recipient': first.recipient,
+        'subject': subject,
+        'recipe': first.recipe,
+        'items': items,
     }
-    
-    # Render email content
-    html_message = render_to_string('emails/rating_notification.html', context)
-    plain_message = render_to_string('emails/rating_notification.txt', context)
-    
+
+
+def build_message(notifications):
+    """Render one or more coalesced notifications into an email message"""
+    if len(notifications) == 1:
+        subject, template, context = _single_message(notifications[0])
+    else:
+        subject, template, context = _summary_message(notifications)
+    message = EmailMultiAlternatives(
+        subject=subject,
+        body=render_to_string(f'{template}.txt', context),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[notifications[0].recipient.email],
+    )
+    message.attach_alternative(
+        render_to_string(f'{template}.html', context), 'text/html'
+    )
+    return message
+
+
+def retry_delay(attempts):
+    """Seconds to wait before retrying after the given number of attempts"""
+    return min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+
+
+def _group_key(notification):
+    return (notification.recipient_id, notification.kind,
+            notification.recipe_id)
+
+
+def claim_due_notifications(limit=100):
+    """Claim due notifications for this worker, grouped into messages.
+
+    Up to limit due rows are claimed, along with every other pending row
+    that will be coalesced with them. Returns a list of groups, each a
+    list of notifications for one message, oldest first.
+    """
+    now = timezone.now()
+    window_end = now + timedelta(seconds=_coalesce_window())
+    pending = Notification.objects.filter(status=Notification.PENDING)
+    with transaction.atomic():
+        due = set(
+            pending.filter(next_attempt_at__lte=now)
+            .order_by('next_attempt_at')
+            .select_for_update(skip_locked=True)
+            .values_list('recipient_id', 'kind', 'recipe_id')[:limit]
+        )
+        if not due:
+            return []
+        claimed = [
+            pk for pk, *key in
+            pending.filter(recipient_id__in={key[0] for key in due},
+                           next_attempt_at__lte=window_end)
+            .select_for_update(skip_locked=True)
+            .values_list('pk', 'recipient_id', 'kind', 'recipe_id')
+            if tuple(key) in due
+        ]
+        Notification.objects.filter(pk__in=claimed).update(
+            next_attempt_at=window_end + timedelta(seconds=CLAIM_TIMEOUT)
+        )
+
+    grouped = {}
+    for notification in (
+            Notification.objects.filter(pk__in=claimed)
+            .select_related('recipient', 'actor', 'recipe', 'comment',
+                            'rating')
+            .order_by('created_at', 'pk')):
+        grouped.setdefault(_group_key(notification), []).append(notification)
+    return list(grouped.values())
+
+
+def _record_failure(notifications, error):
+    attempts = max(n.attempts for n in notifications) + 1
+    ids = [n.pk for n in notifications]
+    if attempts >= MAX_ATTEMPTS:
+        status, next_attempt_at = Notification.FAILED, timezone.now()
+        logger.error(f"Giving up on notifications {ids} after {attempts} "
+                     f"attempts: {error}")
+    else:
+        status = Notification.PENDING
+        next_attempt_at = timezone.now() + timedelta(
+            seconds=retry_delay(attempts)
+        )
+        logger.warning(f"Failed to send notifications {ids} "
+                       f"(attempt {attempts}): {error}")
+    Notification.objects.filter(pk__in=ids).update(
+        status=status, attempts=attempts, next_attempt_at=next_attempt_at,
+        last_error=str(error),
+    )
+
+
+def deliver(groups, connection=None):
+    """Send claimed notification groups over one connection.
+
+    Each group becomes one message. Failures are recorded per group and
+    don't stop the rest of the batch. Returns (sent, failed) message
+    counts.
+    """
+    connection = connection or get_connection()
+    sent_ids = []
+    failed = 0
     try:
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            html_message=html_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[recipe_owner.email],
-            fail_silently=True,
+        for notifications in groups:
+            try:
+                message = build_message(notifications)
+                # Reopens the connection if a previous send dropped it
+                connection.open()
+                connection.send_messages([message])
+            except Exception as e:
+                _record_failure(notifications, e)
+                failed += 1
+                connection.close()
+            else:
+                sent_ids.extend(n.pk for n in notifications)
+    finally:
+        connection.close()
+
+    if sent_ids:
+        Notification.objects.filter(pk__in=sent_ids).update(
+            status=Notification.SENT, sent_at=timezone.now(), last_error='',
         )
-    except Exception as e:
-        # Log error properly
-        logger.error(f"Failed to send rating notification: {e}")
+    return len(groups) - failed, failed
+
+
+def deliver_due_notifications(limit=100, connection=None):
+    """Claim and send a batch of due notifications; returns (sent, failed)"""
+    groups = claim_due_notifications(limit)
+    if not groups:
+        return 0, 0
+    return deliver(groups, connection)
 
 
 def send_weekly_recipe_digest(user):
-    """Send weekly digest of new recipes from followed users"""
+    """Send last week's digest to one user.
+
+    The send_weekly_digests command sends it to everyone in one pass.
+    """
+    from .digest import Digest, week_start
+
     if not user.email:
         return
-    
-    # Get recipes from last week from followed users
-    from django.utils import timezone
-    from datetime import timedelta
-    
-    one_week_ago = timezone.now() - timedelta(days=7)
-    
-    # Get users this user follows (we'll need to create a follow system)
-    # For now, just get recent popular recipes
-    recent_recipes = Recipe.objects.filter(
-        created_at__gte=one_week_ago
-    ).order_by('-average_rating', '-created_at')[:5]
-    
-    if not recent_recipes.exists():
+    digest = Digest(week_start())
+    if not digest.recipes:
         return
-    
-    subject = "OnlyPans: This week's delicious recipes!"
-    
-    context = {
-        'user': user,
-        'recipes': recent_recipes,
-        'week_start': one_week_ago.date(),
-        'week_end': timezone.now().date(),
-    }
-    
-    # Render email content
-    html_message = render_to_string('emails/weekly_digest.html', context)
-    plain_message = render_to_string('emails/weekly_digest.txt', context)
-    
+    followed = digest.followed_authors([user.pk]).get(user.pk, ())
     try:
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            html_message=html_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[user.email],
-            fail_silently=True,
-        )
+        digest.message(user, followed).send()
     except Exception as e:
         # Log error in production
         logger.error(f"Failed to send weekly digest: {e}")
-
-
-def send_new_follower_notification(followed_user, follower):
-    """Send notification when someone follows a user"""
-    if not followed_user.email:
-        return
-        
-    subject = f"{follower.username} started following you on OnlyPans!"
-    
-    context = {
-        'followed_user': followed_user,
-        'follower': follower,
-    }
-    
-    # Render email content
-    html_message = render_to_string('emails/new_follower.html', context)
-    plain_message = render_to_string('emails/new_follower.txt', context)
-    
-    try:
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            html_message=html_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[followed_user.email],
-            fail_silently=True,
-        )
-    except Exception as e:
-        # Log error in production
-        logger.error(f"Failed to send follower notification: {e}")
@@ -0,0 +1,142 @@
+# recipes/nutrition.py
+"""
+Per-serving nutrition for recipes.
+
+Ingredient nutrient values are stored per 100g. A recipe ingredient's
+quantity is converted to grams with its unit's grams_per_unit (or taken
+as grams when the unit has no conversion), scaled into each nutrient,
+summed over the recipe and divided by the servings.
+
+The results are stored on Recipe (calories_per_serving and friends) so
+pages never recompute them. recipes.signals refreshes the stored values
+when a recipe's ingredients or servings, an ingredient's nutrient values
+or a unit's grams_per_unit change.
+"""
+import numpy as np
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+
+# (result key, Ingredient per-100g field, Recipe per-serving field)
+NUTRIENTS = [
+    ('calories', 'calories_per_100g', 'calories_per_serving'),
+    ('protein', 'protein_per_100g', 'protein_per_serving'),
+    ('carbs', 'carbs_per_100g', 'carbs_per_serving'),
+    ('fat', 'fat_per_100g', 'fat_per_serving'),
+    ('fibre', 'fibre_per_100g', 'fibre_per_serving'),
+    ('sugars', 'sugars_per_100g', 'sugars_per_serving'),
+    ('sodium_mg', 'sodium_mg_per_100g', 'sodium_mg_per_serving'),
+    ('saturated_fat', 'saturated_fat_per_100g',
+     'saturated_fat_per_serving'),
+]
+
+SERVING_FIELDS = [serving_field for _, _, serving_field in NUTRIENTS]
+
+
+def calculate_nutrition(recipe):
+    """Calculate nutritional information per serving for one recipe.
+
+    Walks the recipe's ingredients in Python; this is the reference
+    calculation nutrition_for_recipes() is checked against.
+    """
+    totals = {key: 0 for key, _, _ in NUTRIENTS}
+
+    for recipe_ingredient in recipe.ingredients.select_related(
+            'ingredient', 'unit'):
+        # Convert quantity to grams using unit conversion
+        if recipe_ingredient.unit.grams_per_unit:
+            quantity_in_grams = (
+                float(recipe_ingredient.quantity) *
+                float(recipe_ingredient.unit.grams_per_unit)
+            )
+        else:
+            # Fallback: assume quantity is already in grams
+            quantity_in_grams = float(recipe_ingredient.quantity)
+
+        # Calculate nutrition based on quantity in grams
+        ingredient = recipe_ingredient.ingredient
+        for key, per_100g_field, _ in NUTRIENTS:
+            per_100g = getattr(ingredient, per_100g_field)
+            if per_100g:
+                totals[key] += (quantity_in_grams / 100) * float(per_100g)
+
+    # Divide by servings
+    servings = recipe.servings or 1
+    return {key: round(total / servings, 1) for key, total in totals.items()}
+
+
+def nutrition_for_recipes(recipes):
+    """Calculate per-serving nutrition for a queryset of recipes at once.
+
+    A single query pulls every recipe with its ingredient rows (LEFT JOIN,
+    so recipes without ingredients are included), each row carrying the
+    quantity, the unit's grams_per_unit and the ingredient's nutrient
+    values. The arithmetic then runs on NumPy arrays: quantity x grams
+    per unit gives grams, grams / 100 x the nutrient matrix gives each
+    row's contribution, and np.bincount sums the rows per recipe.
+
+    bincount adds the contributions one by one in ingredient order, the
+    same order and float operations as calculate_nutrition(), and the
+    final rounding uses Python's round(), so the results are identical.
+
+    Only relies on model fields, so migrations can pass a queryset of
+    the historical Recipe model.
+
+    Returns {recipe_id: {nutrient: value}}.
+    """
+    per_100g_values = [
+        Cast(f'ingredients__ingredient__{field}', FloatField())
+        for _, field, _ in NUTRIENTS
+    ]
+    rows = list(
+        recipes.model._default_manager
+        .filter(pk__in=recipes.values('pk'))
+        .order_by('pk', 'ingredients__order', 'ingredients__pk')
+        .values_list(
+            'pk', 'servings',
+            Cast('ingredients__quantity', FloatField()),
+            Cast('ingredients__unit__grams_per_unit', FloatField()),
+            *per_100g_values,
+        )
+    )
+    if not rows:
+        return {}
+
+    table = np.array(rows, dtype=np.float64)  # None becomes nan
+    recipe_ids, positions = np.unique(table[:, 0], return_inverse=True)
+    servings = np.zeros(len(recipe_ids))
+    servings[positions] = table[:, 1]
+    servings[servings == 0] = 1  # servings or 1
+
+    quantities = table[:, 2]
+    grams_per_unit = table[:, 3]
+    nutrients = table[:, 4:]
+
+    # Rows with no ingredient (recipes without ingredients) add nothing
+    has_ingredient = ~np.isnan(quantities)
+    positions = positions[has_ingredient]
+    quantities = quantities[has_ingredient]
+    grams_per_unit = grams_per_unit[has_ingredient]
+    nutrients = nutrients[has_ingredient]
+
+    # Quantity in grams; fall back to the raw quantity without a conversion
+    has_conversion = ~np.isnan(grams_per_unit) & (grams_per_unit != 0)
+    grams = np.where(has_conversion, quantities * grams_per_unit,
+                     quantities)
+
+    # Missing nutrient values contribute nothing
+    contributions = (grams / 100)[:, np.newaxis] * np.nan_to_num(nutrients)
+
+    per_serving = np.column_stack([
+        np.bincount(positions, weights=contributions[:, column],
+                    minlength=len(recipe_ids))
+        for column in range(len(NUTRIENTS))
+    ]) / servings[:, np.newaxis]
+
+    keys = [key for key, _, _ in NUTRIENTS]
+    return {
+        int(recipe_id): {
+            key: round(value, 1) for key, value in zip(keys, values)
+        }
+        for recipe_id, values in zip(recipe_ids.tolist(),
+                                     per_serving.tolist())
+    }
@@ -0,0 +1,239 @@
+# recipes/pagination.py
+"""
+Keyset (cursor) pagination.
+
+Instead of COUNT(*) plus OFFSET, each page continues from the ordering
+values of the last row on the previous page:
+
+    WHERE (created_at, id) < (last_created_at, last_id)
+    ORDER BY created_at DESC, id DESC
+    LIMIT 13
+
+so a page costs the same however deep it is, as long as the ordering is
+backed by an index. The primary key is always added as the final
+ordering column to make the position unique.
+
+Positions travel as opaque, signed cursor tokens. A token that has been
+tampered with, or that was issued for a different ordering, is ignored
+and the first page is served instead.
+
+Rows with NULL in a nullable ordering column come after every value
+(NULLS LAST), whichever way that column is sorted, and the cursor
+predicate has matching IS NULL branches so those rows aren't skipped.
+
+Orderings that are not plain model fields (such as search relevance) or
+sliced querysets can't be continued by value; for those the token holds
+an offset instead, so callers get the same interface either way.
+"""
+import datetime
+
+from django.core import signing
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q
+
+CURSOR_SALT = 'recipes.pagination.cursor'
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """Keeps full microsecond precision, which positions depend on"""
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+class CursorSerializer(signing.JSONSerializer):
+    """JSON serializer that also handles dates, times and decimals"""
+
+    def dumps(self, obj):
+        return CursorEncoder(separators=(',', ':')).encode(obj).encode(
+            'latin-1'
+        )
+
+
+class CursorPage:
+    """One page of results with tokens for the neighbouring pages"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """Paginate an ordered queryset by cursor tokens."""
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = self._keyset_ordering(queryset)
+
+    def _keyset_ordering(self, queryset):
+        """The (field, descending) pairs to page on, or None."""
+        if queryset.query.is_sliced:
+            return None
+        opts = queryset.model._meta
+        ordering = []
+        for name in queryset.query.order_by or opts.ordering:
+            if not isinstance(name, str):
+                return None
+            descending = name.startswith('-')
+            name = name.lstrip('-')
+            if name == 'pk':
+                name = opts.pk.name
+            try:
+                field = opts.get_field(name)
+            except FieldDoesNotExist:
+                return None
+            if not field.concrete or field.is_relation:
+                return None
+            ordering.append((field, descending))
+            if field.primary_key:
+                return ordering
+        ordering.append((opts.pk, ordering[-1][1] if ordering else False))
+        return ordering
+
+    @property
+    def signature(self):
+        """Identifies the ordering a token belongs to."""
+        if self.ordering is None:
+            return 'offset'
+        return ','.join(('-' if descending else '') + field.name
+                        for field, descending in self.ordering)
+
+    def encode(self, position, direction):
+        return signing.dumps(
+            {'o': self.signature, 'p': position, 'd': direction},
+            salt=CURSOR_SALT, serializer=CursorSerializer, compress=True,
+        )
+
+    def decode(self, cursor):
+        """Return (position, direction) for a token, or (None, 'next')."""
+        if not cursor:
+            return None, 'next'
+        try:
+            data = signing.loads(cursor, salt=CURSOR_SALT)
+        except signing.BadSignature:
+            return None, 'next'
+        if data.get('o') != self.signature or data.get('d') not in (
+                'next', 'previous'):
+            return None, 'next'
+        position = data.get('p')
+        if self.ordering is None:
+            if not isinstance(position, int) or position < 0:
+                return None, 'next'
+            return position, data['d']
+        if not isinstance(position, list) or (
+                len(position) != len(self.ordering)):
+            return None, 'next'
+        try:
+            position = [field.to_python(value) for (field, _), value
+                        in zip(self.ordering, position)]
+        except Exception:
+            return None, 'next'
+        return position, data['d']
+
+    def get_page(self, cursor=None):
+        """Return the CursorPage a token points at (the first by default)."""
+        position, direction = self.decode(cursor)
+        if self.ordering is None:
+            return self._offset_page(position or 0)
+        return self._keyset_page(position, direction)
+
+    def _offset_page(self, offset):
+        rows = list(self.queryset[offset:offset + self.per_page + 1])
+        has_next = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        return CursorPage(
+            rows,
+            next_cursor=(self.encode(offset + self.per_page, 'next')
+                         if has_next else None),
+            previous_cursor=(self.encode(max(offset - self.per_page, 0),
+                                         'next')
+                             if offset else None),
+        )
+
+    def _keyset_page(self, position, direction):
+        backwards = direction == 'previous'
+        queryset = self.queryset
+        if position is not None:
+            queryset = queryset.filter(self._after(position, backwards))
+        queryset = queryset.order_by(*[
+            self._order_by(field, descending != backwards, backwards)
+            for field, descending in self.ordering
+        ])
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+
+        if not rows:
+            return CursorPage(rows)
+        first = self._position(rows[0])
+        last = self._position(rows[-1])
+        # Moving forwards we came from a previous page (if there was a
+        # cursor) and may have more; moving back it's the other way round.
+        has_next = has_more if not backwards else True
+        has_previous = position is not None if not backwards else has_more
+        return CursorPage(
+            rows,
+            next_cursor=self.encode(last, 'next') if has_next else None,
+            previous_cursor=(self.encode(first, 'previous')
+                             if has_previous else None),
+        )
+
+    def _order_by(self, field, descending, backwards):
+        if not field.null:
+            return ('-' if descending else '') + field.attname
+        # NULLs last going forwards, so first when walking back
+        nulls = {'nulls_first': True} if backwards else {'nulls_last': True}
+        if descending:
+            return F(field.attname).desc(**nulls)
+        return F(field.attname).asc(**nulls)
+
+    def _position(self, obj):
+        return [getattr(obj, field.attname) for field, _ in self.ordering]
+
+    def _after(self, position, backwards):
+        """Q for rows strictly beyond position in the paging direction."""
+        nothing = Q(pk__in=[])
+        condition = nothing
+        equal = Q()
+        for (field, descending), value in zip(self.ordering, position):
+            isnull = f'{field.attname}__isnull'
+            if value is None:
+                # Going forwards nothing follows NULL; going back every
+                # value comes before it
+                beyond = Q(**{isnull: False}) if backwards else nothing
+                condition |= equal & beyond
+                equal &= Q(**{isnull: True})
+                continue
+            lookup = 'lt' if descending != backwards else 'gt'
+            beyond = Q(**{f'{field.attname}__{lookup}': value})
+            if field.null and not backwards:
+                beyond |= Q(**{isnull: True})
+            condition |= equal & beyond
+            equal &= Q(**{field.attname: value})
+        return condition
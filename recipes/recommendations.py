@@ -0,0 +1,208 @@
+# recipes/recommendations.py
+"""
+Precomputed "For You" recommendations.
+
+The build_recommendations command ranks the catalogue for each active
+user and stores their best RECOMMENDATIONS_PER_USER recipes as
+RecommendedRecipe rows. UserProfile.get_recommended_recipes() serves
+pages from that ranking, re-checking only the cheap, fast-changing
+conditions (dietary tags, recipes liked since) per request.
+
+A recipe must carry all of the user's dietary tags and must not be the
+user's own or one they already like. Candidates then score on:
+
+* favourite cuisines: carries one of the user's favourite cuisine tags
+* preferred difficulty: carries the user's preferred difficulty tag
+* followed authors: written by someone the user follows
+* like history: the precomputed related-recipe scores (recipes.related)
+  of the recipes the user liked, summed and scaled to 0..1
+* popularity: views and average rating, scaled to 0..1, mostly to order
+  recipes the other signals can't tell apart
+
+The catalogue is loaded once per run into NumPy arrays and SciPy sparse
+matrices, so each user costs a few vector operations over all recipes.
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from scipy import sparse
+
+RECOMMENDATIONS_PER_USER = 100
+# Users who logged in within this many days get a stored ranking
+ACTIVE_DAYS = 30
+WEIGHTS = {
+    'cuisine': 3.0,
+    'difficulty': 1.0,
+    'followed': 2.0,
+    'likes': 4.0,
+    'popularity': 0.5,
+}
+
+
+class Catalogue:
+    """Every recipe's tags, author, popularity and related recipes."""
+
+    def __init__(self):
+        from .models import Recipe, RelatedRecipe
+
+        rows = np.array(
+            Recipe.objects.order_by('pk').values_list(
+                'pk', 'user_id', 'view_count', 'rating_avg'
+            ),
+            dtype=np.float64,
+        ).reshape(-1, 4)
+        self.recipe_ids = rows[:, 0].astype(np.int64)
+        self.author_ids = rows[:, 1].astype(np.int64)
+        views = np.log1p(rows[:, 2])
+        self.popularity = (
+            views / max(views.max(initial=0), 1) + rows[:, 3] / 5
+        ) / 2
+
+        tags = np.array(
+            Recipe.tags.through.objects.values_list('recipe_id', 'tag_id'),
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        # Skip rows for recipes created since the id list was loaded
+        tags = tags[np.isin(tags[:, 0], self.recipe_ids)]
+        self.tag_ids, columns = np.unique(tags[:, 1], return_inverse=True)
+        self.tags = sparse.csc_matrix(
+            (np.ones(len(tags)), (self.rows_for(tags[:, 0]), columns)),
+            shape=(len(self.recipe_ids), len(self.tag_ids)),
+        )
+
+        related = np.array(
+            RelatedRecipe.objects.values_list('recipe_id', 'related_id',
+                                              'score'),
+            dtype=np.float64,
+        ).reshape(-1, 3)
+        related = related[np.isin(related[:, 0], self.recipe_ids) &
+                          np.isin(related[:, 1], self.recipe_ids)]
+        # related[a, b]: how strongly liking a recommends b
+        self.related = sparse.csr_matrix(
+            (related[:, 2], (self.rows_for(related[:, 0]),
+                             self.rows_for(related[:, 1]))),
+            shape=(len(self.recipe_ids), len(self.recipe_ids)),
+        )
+
+    def rows_for(self, recipe_ids):
+        """Rows of the given recipe ids (unknown ids are dropped)."""
+        recipe_ids = np.asarray(list(recipe_ids), dtype=np.int64)
+        return np.searchsorted(
+            self.recipe_ids,
+            recipe_ids[np.isin(recipe_ids, self.recipe_ids)],
+        )
+
+    def tag_counts(self, tag_ids):
+        """How many of the given tags each recipe carries."""
+        columns = np.flatnonzero(np.isin(self.tag_ids, list(tag_ids)))
+        return np.asarray(self.tags[:, columns].sum(axis=1)).ravel()
+
+    def rank_for(self, preferences, limit=RECOMMENDATIONS_PER_USER):
+        """Return the user's best [(recipe id, score)], best first."""
+        dietary = preferences['dietary']
+        allowed = self.tag_counts(dietary) == len(dietary)
+        allowed &= self.author_ids != preferences['user_id']
+        allowed[self.rows_for(preferences['liked'])] = False
+
+        scores = WEIGHTS['popularity'] * self.popularity
+        if preferences['cuisines']:
+            scores += WEIGHTS['cuisine'] * (
+                self.tag_counts(preferences['cuisines']) > 0
+            )
+        if preferences['difficulty']:
+            scores += WEIGHTS['difficulty'] * (
+                self.tag_counts([preferences['difficulty']]) > 0
+            )
+        if preferences['followed']:
+            scores += WEIGHTS['followed'] * np.isin(
+                self.author_ids, list(preferences['followed'])
+            )
+        if preferences['liked']:
+            liked = np.zeros(len(self.recipe_ids))
+            liked[self.rows_for(preferences['liked'])] = 1
+            affinity = self.related.T @ liked
+            if affinity.max(initial=0) > 0:
+                scores += WEIGHTS['likes'] * affinity / affinity.max()
+
+        candidates = np.flatnonzero(allowed)
+        if len(candidates) > limit:
+            cutoff = np.partition(scores[candidates],
+                                  len(candidates) - limit)[-limit]
+            candidates = candidates[scores[candidates] >= cutoff]
+        # Best first; equal scores favour newer recipes
+        order = np.lexsort((-self.recipe_ids[candidates],
+                            -scores[candidates]))[:limit]
+        candidates = candidates[order]
+        return list(zip(self.recipe_ids[candidates].tolist(),
+                        scores[candidates].tolist()))
+
+
+def active_users(days=ACTIVE_DAYS):
+    """Users who logged in recently."""
+    return User.objects.filter(
+        is_active=True,
+        last_login__gte=timezone.now() - timedelta(days=days),
+    )
+
+
+def load_preferences(user_ids):
+    """Everything the ranking needs about each user, in five queries."""
+    from accounts.models import UserProfile
+    from .models import Follow, RecipeLike
+
+    preferences = {
+        user_id: {'user_id': user_id, 'dietary': set(), 'cuisines': set(),
+                  'difficulty': None, 'followed': set(), 'liked': set()}
+        for user_id in user_ids
+    }
+    for user_id, difficulty in UserProfile.objects.filter(
+            user_id__in=user_ids).values_list('user_id',
+                                              'preferred_difficulty_id'):
+        preferences[user_id]['difficulty'] = difficulty
+    for key, field in (('dietary', 'dietary_tags'),
+                       ('cuisines', 'favorite_cuisines')):
+        through = getattr(UserProfile, field).through
+        for user_id, tag_id in through.objects.filter(
+                userprofile__user_id__in=user_ids).values_list(
+                    'userprofile__user_id', 'tag_id'):
+            preferences[user_id][key].add(tag_id)
+    for user_id, followed_id in Follow.objects.filter(
+            follower_id__in=user_ids).values_list('follower_id',
+                                                  'followed_id'):
+        preferences[user_id]['followed'].add(followed_id)
+    for user_id, recipe_id in RecipeLike.objects.filter(
+            user_id__in=user_ids).values_list('user_id', 'recipe_id'):
+        preferences[user_id]['liked'].add(recipe_id)
+    return preferences
+
+
+def build_recommendations(users=None, batch_size=500):
+    """Rank and store recommendations for users (default: active users).
+
+    Returns the number of users updated.
+    """
+    from .models import RecommendedRecipe
+
+    if users is None:
+        users = active_users()
+    user_ids = list(users.order_by('pk').values_list('pk', flat=True))
+    catalogue = Catalogue()
+
+    for start in range(0, len(user_ids), batch_size):
+        batch = user_ids[start:start + batch_size]
+        rankings = {
+            user_id: catalogue.rank_for(preferences)
+            for user_id, preferences in load_preferences(batch).items()
+        }
+        with transaction.atomic():
+            RecommendedRecipe.objects.filter(user_id__in=batch).delete()
+            RecommendedRecipe.objects.bulk_create([
+                RecommendedRecipe(user_id=user_id, recipe_id=recipe_id,
+                                  score=score, rank=rank)
+                for user_id, ranking in rankings.items()
+                for rank, (recipe_id, score) in enumerate(ranking, 1)
+            ])
+    return len(user_ids)
@@ -0,0 +1,167 @@
+# recipes/refdata.py
+"""
+Syncing reference data (tags, units, ingredients) for the populate_*
+commands.
+
+sync() takes the rows a command wants as dicts keyed by a unique field
+and makes the table match them with a fixed number of queries however
+many rows there are:
+
+1. one SELECT of the existing rows with those keys
+2. one bulk_create(update_conflicts=True) for the missing rows, which
+   also makes a concurrent run of the same command harmless
+3. one bulk_update of just the fields that differ, for the rows that do
+4. for many-to-many fields, one SELECT of the existing links and one
+   bulk_create of the missing ones. Links are only ever added, so ones
+   made by hand in the admin are kept.
+
+Re-running a command that has already been applied therefore costs two
+or three SELECTs and writes nothing.
+
+Bulk writes skip the post_save signals, so sync() refreshes what they
+would have: stored nutrition for recipes using an updated ingredient or
+unit, and the cached facet counts and carousel. Search documents only
+hold names, which are the keys here and never change.
+"""
+from decimal import Decimal
+
+from django.db import models, transaction
+
+from . import carousel, facets
+
+
+class SyncResult:
+    """The keys of the rows sync() inserted, updated and left alone."""
+
+    def __init__(self):
+        self.inserted = []
+        self.updated = []
+        self.unchanged = []
+        # Rows with no existing match when creating is turned off
+        self.skipped = []
+
+    def summary(self, noun):
+        return (f'{len(self.inserted)} {noun} inserted, '
+                f'{len(self.updated)} updated, '
+                f'{len(self.unchanged)} unchanged')
+
+
+def _normalise(model_field, value):
+    """A value as it reads back from the database, for comparison"""
+    value = model_field.to_python(value)
+    if isinstance(model_field, models.DecimalField) and value is not None:
+        value = value.quantize(Decimal(1).scaleb(-model_field.decimal_places))
+    return value
+
+
+def sync(model, rows, key='name', create=True, m2m=None):
+    """Make model's rows match rows, a list of {field: value} dicts.
+
+    Each dict must include key. m2m maps a many-to-many field name to
+    {key value: related pks} for the links each row should have.
+    Returns a SyncResult.
+    """
+    m2m = m2m or {}
+    rows = {row[key]: row for row in rows}
+    fields = sorted({name for row in rows.values() for name in row} - {key})
+    result = SyncResult()
+
+    with transaction.atomic():
+        existing = model.objects.only(key, *fields).in_bulk(
+            list(rows), field_name=key
+        )
+        new, changed, changed_fields = [], [], set()
+        for name, row in rows.items():
+            obj = existing.get(name)
+            if obj is None:
+                if create:
+                    new.append(model(**row))
+                    result.inserted.append(name)
+                else:
+                    result.skipped.append(name)
+                continue
+            differs = [
+                field_name for field_name in fields
+                if field_name in row and
+                _normalise(model._meta.get_field(field_name),
+                           row[field_name]) != getattr(obj, field_name)
+            ]
+            if differs:
+                for field_name in differs:
+                    setattr(obj, field_name, row[field_name])
+                changed.append(obj)
+                changed_fields.update(differs)
+                result.updated.append(name)
+
+        if new:
+            if fields:
+                model.objects.bulk_create(
+                    new, update_conflicts=True, unique_fields=[key],
+                    update_fields=fields,
+                )
+            else:
+                model.objects.bulk_create(new, ignore_conflicts=True)
+            if m2m:
+                # Conflict-updating inserts don't return ids everywhere
+                existing.update(model.objects.only(key).in_bulk(
+                    result.inserted, field_name=key
+                ))
+        if changed:
+            model.objects.bulk_update(changed, sorted(changed_fields))
+
+        for field_name, links in m2m.items():
+            relinked = _add_links(model, field_name, existing, links)
+            result.updated.extend(
+                name for name in relinked
+                if name not in result.inserted and name not in result.updated
+            )
+
+        result.unchanged = [
+            name for name in existing
+            if name not in result.inserted and name not in result.updated
+        ]
+        _refresh_derived(model, changed, bool(new or changed))
+    return result
+
+
+def _add_links(model, field_name, objects, links):
+    """Add missing many-to-many links; returns the keys that gained any"""
+    m2m_field = model._meta.get_field(field_name)
+    through = m2m_field.remote_field.through
+    source = m2m_field.m2m_field_name() + '_id'
+    target = m2m_field.m2m_reverse_field_name() + '_id'
+
+    ids = {objects[name].pk: name for name in links if name in objects}
+    existing = set(through.objects.filter(
+        **{f'{source}__in': list(ids)}
+    ).values_list(source, target))
+    wanted = [
+        (pk, related_pk)
+        for pk, name in ids.items()
+        for related_pk in links[name]
+        if (pk, related_pk) not in existing
+    ]
+    through.objects.bulk_create(
+        [through(**{source: pk, target: related_pk})
+         for pk, related_pk in wanted],
+        ignore_conflicts=True,
+    )
+    return {ids[pk] for pk, _ in wanted}
+
+
+def _refresh_derived(model, changed, wrote):
+    """Do what post_save would have done for the synced rows"""
+    from .models import Ingredient, Recipe, Tag, Unit
+
+    if changed and model is Ingredient:
+        Recipe.objects.filter(
+            ingredients__ingredient__in=changed
+        ).distinct().refresh_nutrition()
+    elif changed and model is Unit:
+        Recipe.objects.filter(
+            ingredients__unit__in=changed
+        ).distinct().refresh_nutrition()
+    if wrote:
+        facets.invalidate()
+        if model is Tag:
+            carousel.invalidate()
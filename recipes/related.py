@@ -0,0 +1,197 @@
+# recipes/related.py
+"""
+Precomputed "related recipes".
+
+The build_related_recipes command scores recipe pairs and stores each
+recipe's best RELATED_PER_RECIPE matches as RelatedRecipe rows, which
+recipe_detail reads with one indexed query. A pair scores on:
+
+* tag overlap: the Jaccard index of the two tag sets
+* shared ingredients: the Jaccard index of the two ingredient sets
+* co-likes: the cosine similarity of the sets of users who liked them
+
+Each signal is a sparse recipe x feature incidence matrix, so multiplying
+a batch of rows by the transposed matrix gives the overlap of every pair
+in the batch at once.
+
+recipes.signals flags recipes whose tags, ingredients or likes change as
+related_stale. An incremental build rescores those recipes, plus every
+other recipe whose stored list a changed score could enter or leave. A
+pair's score depends only on the two recipes, so no other list can move.
+"""
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, Min
+from scipy import sparse
+
+RELATED_PER_RECIPE = 8
+WEIGHTS = {
+    'tags': 0.5,
+    'ingredients': 0.3,
+    'likes': 0.2,
+}
+# Rows scored at a time; a batch's score matrix can hold up to
+# BATCH_SIZE x catalogue size entries
+BATCH_SIZE = 200
+
+
+class Similarity:
+    """Pairwise recipe scores over the whole catalogue."""
+
+    def __init__(self):
+        from .models import Recipe, RecipeIngredient, RecipeLike
+
+        self.recipe_ids = np.array(
+            Recipe.objects.order_by('pk').values_list('pk', flat=True),
+            dtype=np.int64,
+        )
+        self.features = {
+            'tags': self._incidence(
+                Recipe.tags.through.objects.values_list('recipe_id',
+                                                        'tag_id')
+            ),
+            'ingredients': self._incidence(
+                RecipeIngredient.objects.values_list('recipe_id',
+                                                     'ingredient_id')
+            ),
+            'likes': self._incidence(
+                RecipeLike.objects.values_list('recipe_id', 'user_id')
+            ),
+        }
+
+    def rows_for(self, recipe_ids):
+        """Matrix rows of the given recipe ids (unknown ids are dropped)."""
+        recipe_ids = np.asarray(list(recipe_ids), dtype=np.int64)
+        rows = np.searchsorted(self.recipe_ids, recipe_ids)
+        known = rows < len(self.recipe_ids)
+        known[known] = self.recipe_ids[rows[known]] == recipe_ids[known]
+        return np.unique(rows[known])
+
+    def _incidence(self, pairs):
+        """A binary recipe x feature CSR matrix and each row's size."""
+        pairs = np.array(list(pairs), dtype=np.int64).reshape(-1, 2)
+        # Skip rows for recipes created since the id list was loaded
+        pairs = pairs[np.isin(pairs[:, 0], self.recipe_ids)]
+        rows = np.searchsorted(self.recipe_ids, pairs[:, 0])
+        _, columns = np.unique(pairs[:, 1], return_inverse=True)
+        matrix = sparse.csr_matrix(
+            (np.ones(len(rows)), (rows, columns)),
+            shape=(len(self.recipe_ids), columns.max(initial=-1) + 1),
+        )
+        # Repeated pairs (an ingredient listed twice) count once
+        matrix.data[:] = 1
+        sizes = np.asarray(matrix.sum(axis=1)).ravel()
+        return matrix, sizes
+
+    def scores(self, rows):
+        """Sparse len(rows) x catalogue matrix of combined pair scores."""
+        shape = (len(rows), len(self.recipe_ids))
+        total = sparse.csr_matrix(shape)
+        for name, (matrix, sizes) in self.features.items():
+            overlap = (matrix[rows] @ matrix.T).tocoo()
+            size_a = sizes[rows][overlap.row]
+            size_b = sizes[overlap.col]
+            if name == 'likes':
+                similarity = overlap.data / np.sqrt(size_a * size_b)
+            else:
+                similarity = overlap.data / (size_a + size_b - overlap.data)
+            total = total + sparse.csr_matrix(
+                (WEIGHTS[name] * similarity, (overlap.row, overlap.col)),
+                shape=shape,
+            )
+        # A recipe isn't related to itself
+        total = total.tocoo()
+        keep = total.col != np.asarray(rows)[total.row]
+        return sparse.csr_matrix(
+            (total.data[keep], (total.row[keep], total.col[keep])),
+            shape=shape,
+        )
+
+    def top(self, scores, limit=RELATED_PER_RECIPE):
+        """Yield the best (related recipe id, score) pairs for each row.
+
+        Equal scores are broken in favour of the newer (higher id) recipe
+        so rebuilds are deterministic.
+        """
+        for row in range(scores.shape[0]):
+            start, end = scores.indptr[row], scores.indptr[row + 1]
+            data = scores.data[start:end]
+            related_ids = self.recipe_ids[scores.indices[start:end]]
+            if len(data) > limit:
+                # Only sort the entries that can make the cut
+                cutoff = np.partition(data, len(data) - limit)[-limit]
+                candidates = data >= cutoff
+                data, related_ids = data[candidates], related_ids[candidates]
+            order = np.lexsort((-related_ids, -data))[:limit]
+            yield list(zip(related_ids[order].tolist(),
+                           data[order].tolist()))
+
+
+def _affected_recipes(similarity, stale_ids):
+    """Recipes whose stored lists may change because stale_ids changed."""
+    from .models import RelatedRecipe
+
+    affected = set(
+        RelatedRecipe.objects.filter(related_id__in=stale_ids)
+        .values_list('recipe_id', flat=True)
+    )
+    # A recipe with a full list only takes scores that beat its worst
+    # entry; one with a short (or no) list takes any score
+    full_lists = np.array(
+        RelatedRecipe.objects.values('recipe_id')
+        .annotate(worst=Min('score'), count=Count('pk'))
+        .filter(count__gte=RELATED_PER_RECIPE)
+        .order_by('recipe_id').values_list('recipe_id', 'worst'),
+    ).reshape(-1, 2)
+    thresholds = np.zeros(len(similarity.recipe_ids))
+    known = np.isin(similarity.recipe_ids, full_lists[:, 0])
+    thresholds[known] = full_lists[
+        np.isin(full_lists[:, 0], similarity.recipe_ids), 1
+    ]
+
+    rows = similarity.rows_for(stale_ids)
+    for start in range(0, len(rows), BATCH_SIZE):
+        scores = similarity.scores(rows[start:start + BATCH_SIZE]).tocoo()
+        enters = scores.data >= thresholds[scores.col]
+        affected.update(similarity.recipe_ids[scores.col[enters]].tolist())
+    return affected - set(stale_ids)
+
+
+def build_related_recipes(full=False):
+    """Rescore stale recipes (or every recipe) and store their lists.
+
+    Returns the number of recipes whose lists were rebuilt.
+    """
+    from .models import Recipe, RelatedRecipe
+
+    similarity = Similarity()
+    if full:
+        recipe_ids = similarity.recipe_ids.tolist()
+    else:
+        stale_ids = list(
+            Recipe.objects.filter(related_stale=True)
+            .values_list('pk', flat=True)
+        )
+        recipe_ids = stale_ids + sorted(
+            _affected_recipes(similarity, stale_ids)
+        )
+
+    rows = similarity.rows_for(recipe_ids)
+    for start in range(0, len(rows), BATCH_SIZE):
+        batch = rows[start:start + BATCH_SIZE]
+        batch_ids = similarity.recipe_ids[batch].tolist()
+        scores = similarity.scores(batch)
+        entries = [
+            RelatedRecipe(recipe_id=recipe_id, related_id=related_id,
+                          score=score, rank=rank)
+            for recipe_id, related in zip(batch_ids,
+                                          similarity.top(scores))
+            for rank, (related_id, score) in enumerate(related, 1)
+        ]
+        with transaction.atomic():
+            RelatedRecipe.objects.filter(recipe_id__in=batch_ids).delete()
+            RelatedRecipe.objects.bulk_create(entries)
+            Recipe.objects.filter(pk__in=batch_ids).update(
+                related_stale=False
+            )
+    return len(rows)
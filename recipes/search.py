@@ -0,0 +1,293 @@
+# recipes/search.py
+"""
+Full-text recipe search.
+
+Each recipe has a search document built from its title, description, tag
+names and ingredient names. The document lives in a side table owned by
+the active backend:
+
+* PostgreSQL: recipes_recipe_search, a weighted tsvector with a GIN index
+* SQLite: recipes_recipe_fts, an FTS5 table using the porter stemmer
+
+Both rank matches by relevance (title > description > tags/ingredients)
+and treat the last word typed as a prefix. A query with no words in it
+(only punctuation, say) filters nothing. Other databases fall back to
+the old icontains lookups. Set RECIPE_SEARCH_BACKEND to a dotted path to
+plug in a different backend.
+
+Documents are rebuilt with INSERT ... SELECT straight from the recipe,
+tag and ingredient tables, so indexing never loads rows into Python.
+The signal handlers in recipes.signals keep them up to date.
+
+The side tables are created by migration 0016. Databases built without
+running migrations (the test settings turn them off) get them from
+create_index(), which runs after every migrate.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+# Maximum ids per IN (...) clause when reindexing
+INDEX_BATCH_SIZE = 500
+
+_backend = None
+
+
+def get_search_terms(query):
+    """Split a search box string into lowercase word terms."""
+    return re.findall(r'\w+', query.lower())
+
+
+def get_backend():
+    """Return the search backend for the default database."""
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'RECIPE_SEARCH_BACKEND', None)
+        if path:
+            backend_class = import_string(path)
+        else:
+            backend_class = BACKENDS_BY_VENDOR.get(
+                connection.vendor, BasicSearchBackend
+            )
+        _backend = backend_class()
+    return _backend
+
+
+def search_recipes(queryset, query):
+    """Filter a Recipe queryset to matches, best matches first."""
+    return get_backend().search(queryset, query)
+
+
+def index_recipes(recipe_ids):
+    """(Re)build the search documents for the given recipes."""
+    recipe_ids = list(recipe_ids)
+    backend = get_backend()
+    for start in range(0, len(recipe_ids), INDEX_BATCH_SIZE):
+        backend.index_recipes(recipe_ids[start:start + INDEX_BATCH_SIZE])
+
+
+def remove_recipes(recipe_ids):
+    """Drop the search documents for the given recipes."""
+    recipe_ids = list(recipe_ids)
+    backend = get_backend()
+    for start in range(0, len(recipe_ids), INDEX_BATCH_SIZE):
+        backend.remove_recipes(recipe_ids[start:start + INDEX_BATCH_SIZE])
+
+
+def create_index():
+    """Create and fill the search table if the database lacks it."""
+    backend = get_backend()
+    if (backend.table and backend.table not in
+            connection.introspection.table_names()):
+        with connection.cursor() as cursor:
+            for statement in backend.create_sql:
+                cursor.execute(statement)
+        backend.rebuild()
+
+
+def rebuild_index():
+    """Rebuild every search document from scratch."""
+    get_backend().rebuild()
+
+
+class BasicSearchBackend:
+    """Unindexed icontains search, for databases without full-text search"""
+
+    table = None
+
+    def search(self, queryset, query):
+        return queryset.filter(
+            Q(title__icontains=query) |
+            Q(description__icontains=query) |
+            Q(tags__name__icontains=query) |
+            Q(ingredients__ingredient__name__icontains=query)
+        ).distinct()
+
+    def index_recipes(self, recipe_ids):
+        pass
+
+    def remove_recipes(self, recipe_ids):
+        pass
+
+    def rebuild(self):
+        pass
+
+
+class SQLiteSearchBackend:
+    """SQLite FTS5 search, used for local development and tests"""
+
+    table = 'recipes_recipe_fts'
+    create_sql = ['''
+        CREATE VIRTUAL TABLE IF NOT EXISTS recipes_recipe_fts USING fts5(
+            title, description, tags, ingredients,
+            tokenize = 'porter unicode61'
+        )
+    ''']
+    # bm25() column weights: title, description, tags, ingredients
+    weights = '10.0, 4.0, 2.0, 2.0'
+
+    document_sql = '''
+        INSERT INTO recipes_recipe_fts
+            (rowid, title, description, tags, ingredients)
+        SELECT r.id, r.title, r.description,
+            COALESCE((SELECT group_concat(t.name, ' ')
+                      FROM recipes_recipe_tags rt
+                      JOIN recipes_tag t ON t.id = rt.tag_id
+                      WHERE rt.recipe_id = r.id), ''),
+            COALESCE((SELECT group_concat(i.name, ' ')
+                      FROM recipes_recipeingredient ri
+                      JOIN recipes_ingredient i ON i.id = ri.ingredient_id
+                      WHERE ri.recipe_id = r.id), '')
+        FROM recipes_recipe r
+    '''
+
+    def match_expression(self, terms):
+        # Every term must match; the last one may still be being typed
+        quoted = [f'"{term}"' for term in terms]
+        quoted[-1] += '*'
+        return ' '.join(quoted)
+
+    def search(self, queryset, query):
+        terms = get_search_terms(query)
+        if not terms:
+            # Nothing to match on, like a blank search
+            return queryset
+        return queryset.extra(
+            tables=[self.table],
+            where=[
+                f'{self.table}.rowid = recipes_recipe.id',
+                f'{self.table} MATCH %s',
+            ],
+            params=[self.match_expression(terms)],
+            # bm25 is lower for better matches; negate it so both
+            # backends sort by descending search_rank
+            select={'search_rank': f'-bm25({self.table}, {self.weights})'},
+        ).order_by('-search_rank', '-created_at')
+
+    def index_recipes(self, recipe_ids):
+        if not recipe_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {self.table} WHERE rowid IN ({placeholders})',
+                recipe_ids
+            )
+            cursor.execute(
+                f'{self.document_sql} WHERE r.id IN ({placeholders})',
+                recipe_ids
+            )
+
+    def remove_recipes(self, recipe_ids):
+        if not recipe_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {self.table} WHERE rowid IN ({placeholders})',
+                recipe_ids
+            )
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute(self.document_sql)
+
+
+class PostgresSearchBackend:
+    """PostgreSQL tsvector search backed by a GIN index"""
+
+    table = 'recipes_recipe_search'
+    create_sql = [
+        '''
+        CREATE TABLE IF NOT EXISTS recipes_recipe_search (
+            recipe_id bigint PRIMARY KEY
+                REFERENCES recipes_recipe (id)
+                ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+            document tsvector NOT NULL
+        )
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS recipes_recipe_search_document_gin
+            ON recipes_recipe_search USING GIN (document)
+        ''',
+    ]
+
+    document_sql = '''
+        INSERT INTO recipes_recipe_search (recipe_id, document)
+        SELECT r.id,
+            setweight(to_tsvector('english', r.title), 'A') ||
+            setweight(to_tsvector('english', r.description), 'B') ||
+            setweight(to_tsvector('english', COALESCE(
+                (SELECT string_agg(t.name, ' ')
+                 FROM recipes_recipe_tags rt
+                 JOIN recipes_tag t ON t.id = rt.tag_id
+                 WHERE rt.recipe_id = r.id), '')), 'C') ||
+            setweight(to_tsvector('english', COALESCE(
+                (SELECT string_agg(i.name, ' ')
+                 FROM recipes_recipeingredient ri
+                 JOIN recipes_ingredient i ON i.id = ri.ingredient_id
+                 WHERE ri.recipe_id = r.id), '')), 'C')
+        FROM recipes_recipe r
+    '''
+
+    upsert_sql = '''
+        ON CONFLICT (recipe_id) DO UPDATE SET document = EXCLUDED.document
+    '''
+
+    def tsquery(self, terms):
+        # Every term must match; the last one may still be being typed
+        parts = list(terms)
+        parts[-1] += ':*'
+        return ' & '.join(parts)
+
+    def search(self, queryset, query):
+        terms = get_search_terms(query)
+        if not terms:
+            # Nothing to match on, like a blank search
+            return queryset
+        tsquery = "to_tsquery('english', %s)"
+        return queryset.extra(
+            tables=[self.table],
+            where=[
+                f'{self.table}.recipe_id = recipes_recipe.id',
+                f'{self.table}.document @@ {tsquery}',
+            ],
+            params=[self.tsquery(terms)],
+            select={
+                'search_rank': f'ts_rank({self.table}.document, {tsquery})'
+            },
+            select_params=[self.tsquery(terms)],
+        ).order_by('-search_rank', '-created_at')
+
+    def index_recipes(self, recipe_ids):
+        if not recipe_ids:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'{self.document_sql} WHERE r.id = ANY(%s) {self.upsert_sql}',
+                [list(recipe_ids)]
+            )
+
+    def remove_recipes(self, recipe_ids):
+        if not recipe_ids:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {self.table} WHERE recipe_id = ANY(%s)',
+                [list(recipe_ids)]
+            )
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE {self.table}')
+            cursor.execute(self.document_sql)
+
+
+BACKENDS_BY_VENDOR = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
@@ -0,0 +1,272 @@
+# recipes/signals.py
+"""
+Signal handlers that keep derived recipe data in step with its sources.
+Connected from RecipesConfig.ready().
+"""
+from django.core.management import call_command
+from django.db.models.signals import (m2m_changed, post_delete,
+                                      post_migrate, post_save, pre_delete)
+from django.dispatch import receiver
+
+from accounts.models import UserProfile
+
+from . import carousel, facets, likes, search, timeline
+from .models import (Follow, Ingredient, Rating, Recipe, RecipeIngredient,
+                     RecipeLike, RecommendedRecipe, RelatedRecipe, Tag, Unit)
+
+
+# Cache table --------------------------------------------------------------
+
+@receiver(post_migrate)
+def create_cache_table(sender, using='default', **kwargs):
+    """Create the database cache's table if settings use one"""
+    if sender.name == 'recipes':
+        call_command('createcachetable', database=using, verbosity=0)
+
+
+# Search documents ---------------------------------------------------------
+
+@receiver(post_migrate)
+def create_search_index(sender, **kwargs):
+    """Create the search table in databases built without migrations"""
+    if sender.name == 'recipes':
+        search.create_index()
+
+
+@receiver(post_save, sender=Recipe)
+def index_saved_recipe(sender, instance, raw=False, **kwargs):
+    """Reindex a recipe whose title or description may have changed"""
+    if not raw:
+        search.index_recipes([instance.pk])
+
+
+@receiver(post_delete, sender=Recipe)
+def unindex_deleted_recipe(sender, instance, **kwargs):
+    search.remove_recipes([instance.pk])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def index_retagged_recipes(sender, instance, action, reverse, pk_set,
+                           **kwargs):
+    """Reindex recipes gaining or losing tags, from either side"""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            search.index_recipes([instance.pk])
+    elif action == 'pre_clear':
+        # Remember which recipes lose the tag before the rows disappear
+        instance._cleared_recipe_ids = list(
+            instance.recipe_set.values_list('pk', flat=True)
+        )
+    elif action == 'post_clear':
+        search.index_recipes(getattr(instance, '_cleared_recipe_ids', []))
+    elif action in ('post_add', 'post_remove'):
+        search.index_recipes(pk_set)
+
+
+@receiver(post_save, sender=Tag)
+def index_renamed_tag_recipes(sender, instance, created, raw=False,
+                              **kwargs):
+    if not created and not raw:
+        search.index_recipes(
+            instance.recipe_set.values_list('pk', flat=True)
+        )
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_deleted_tag_recipes(sender, instance, **kwargs):
+    instance._tagged_recipe_ids = list(
+        instance.recipe_set.values_list('pk', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Tag)
+def index_deleted_tag_recipes(sender, instance, **kwargs):
+    search.index_recipes(getattr(instance, '_tagged_recipe_ids', []))
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def index_recipe_ingredients(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_recipes([instance.recipe_id])
+
+
+@receiver(post_save, sender=Ingredient)
+def index_renamed_ingredient_recipes(sender, instance, created, raw=False,
+                                     **kwargs):
+    if not created and not raw:
+        search.index_recipes(
+            RecipeIngredient.objects.filter(ingredient=instance)
+            .values_list('recipe_id', flat=True).distinct()
+        )
+
+
+# Stored nutrition ---------------------------------------------------------
+
+@receiver(post_save, sender=Recipe)
+def refresh_saved_recipe_nutrition(sender, instance, raw=False, **kwargs):
+    """Servings may have changed, which changes every per-serving value"""
+    if not raw:
+        Recipe.objects.filter(pk=instance.pk).refresh_nutrition()
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def refresh_recipe_ingredient_nutrition(sender, instance, raw=False,
+                                        **kwargs):
+    if not raw:
+        Recipe.objects.filter(pk=instance.recipe_id).refresh_nutrition()
+
+
+@receiver(post_save, sender=Ingredient)
+def refresh_ingredient_nutrition(sender, instance, created, raw=False,
+                                 **kwargs):
+    """Nutrient values per 100g may have changed"""
+    if not created and not raw and instance.nutrients_changed():
+        Recipe.objects.filter(
+            ingredients__ingredient=instance
+        ).distinct().refresh_nutrition()
+
+
+@receiver(post_save, sender=Unit)
+def refresh_unit_nutrition(sender, instance, created, raw=False, **kwargs):
+    """The grams_per_unit conversion may have changed"""
+    if not created and not raw and instance.grams_per_unit_changed():
+        Recipe.objects.filter(
+            ingredients__unit=instance
+        ).distinct().refresh_nutrition()
+
+
+# Facet counts -------------------------------------------------------------
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=Unit)
+def invalidate_facets(sender, raw=False, **kwargs):
+    """Anything that can change which recipes match a filter"""
+    if not raw:
+        facets.invalidate()
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_retagged_facets(sender, action, **kwargs):
+    if action.startswith('post_'):
+        facets.invalidate()
+
+
+# Homepage carousel --------------------------------------------------------
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+def invalidate_carousel(sender, raw=False, **kwargs):
+    """Carousel cards show titles, images, times and ratings"""
+    if not raw:
+        carousel.invalidate()
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_retagged_carousel(sender, action, **kwargs):
+    if action.startswith('post_'):
+        carousel.invalidate()
+
+
+# Cached liked ids ---------------------------------------------------------
+
+@receiver(post_save, sender=RecipeLike)
+@receiver(post_delete, sender=RecipeLike)
+def invalidate_liked_ids(sender, instance, raw=False, **kwargs):
+    if not raw:
+        likes.invalidate(instance.user_id)
+
+
+# Related recipes ----------------------------------------------------------
+
+def mark_related_stale(recipe_ids):
+    """Queue recipes for the next build_related_recipes run"""
+    recipe_ids = list(recipe_ids)
+    if recipe_ids:
+        Recipe.objects.filter(pk__in=recipe_ids).update(related_stale=True)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def stale_retagged_recipes(sender, instance, action, reverse, pk_set,
+                           **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            mark_related_stale([instance.pk])
+    elif action == 'post_clear':
+        # Recorded by index_retagged_recipes on pre_clear
+        mark_related_stale(getattr(instance, '_cleared_recipe_ids', []))
+    elif action in ('post_add', 'post_remove'):
+        mark_related_stale(pk_set)
+
+
+@receiver(post_delete, sender=Tag)
+def stale_deleted_tag_recipes(sender, instance, **kwargs):
+    # Recorded by remember_deleted_tag_recipes on pre_delete
+    mark_related_stale(getattr(instance, '_tagged_recipe_ids', []))
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+@receiver(post_save, sender=RecipeLike)
+@receiver(post_delete, sender=RecipeLike)
+def stale_recipe_features(sender, instance, raw=False, **kwargs):
+    if not raw:
+        mark_related_stale([instance.recipe_id])
+
+
+@receiver(pre_delete, sender=Recipe)
+def stale_lists_of_deleted_recipe(sender, instance, **kwargs):
+    """Lists that include the recipe lose an entry with it"""
+    mark_related_stale(
+        RelatedRecipe.objects.filter(related=instance)
+        .values_list('recipe_id', flat=True)
+    )
+
+
+# "For You" recommendations ------------------------------------------------
+# Dietary tags are re-checked on every request; a new set of favourite
+# cuisines needs a re-rank, so drop the stored one and let the live query
+# serve the user until the next build_recommendations run.
+
+@receiver(m2m_changed, sender=UserProfile.favorite_cuisines.through)
+def drop_recommendations_for_new_cuisines(sender, instance, action, reverse,
+                                          pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        RecommendedRecipe.objects.filter(user_id=instance.user_id).delete()
+    elif pk_set:
+        RecommendedRecipe.objects.filter(
+            user__profile__in=pk_set
+        ).delete()
+
+
+# Home feeds ---------------------------------------------------------------
+
+@receiver(post_save, sender=Recipe)
+def fan_out_new_recipe(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        timeline.fan_out(instance.user_id, [instance])
+
+
+@receiver(post_save, sender=Follow)
+def backfill_followed_recipes(sender, instance, created, raw=False,
+                              **kwargs):
+    if created and not raw:
+        timeline.follow(instance.follower_id, instance.followed_id)
+
+
+@receiver(post_delete, sender=Follow)
+def remove_unfollowed_recipes(sender, instance, **kwargs):
+    timeline.unfollow(instance.follower_id, instance.followed_id)
@@ -0,0 +1,37 @@
+# recipes/templatetags/assets.py
+"""
+{% asset 'css/styles.css' %}: the URL of a static asset's minified,
+content-hashed build from scripts/build.py.
+
+Paths are looked up in the build manifest (settings.ASSET_MANIFEST),
+which is read once per process. With DEBUG on, or for assets the
+manifest doesn't list, the source file is served instead, so edits show
+up without a rebuild.
+"""
+import json
+from functools import lru_cache
+
+from django import template
+from django.conf import settings
+from django.templatetags.static import static
+
+register = template.Library()
+
+
+@lru_cache(maxsize=1)
+def load_manifest(path):
+    """{source path: built path}, empty if the assets aren't built"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            assets = json.load(f)['assets']
+    except (OSError, ValueError, KeyError):
+        return {}
+    return {source: entry['output'] for source, entry in assets.items()}
+
+
+@register.simple_tag
+def asset(path):
+    manifest_path = getattr(settings, 'ASSET_MANIFEST', None)
+    if not settings.DEBUG and manifest_path:
+        path = load_manifest(str(manifest_path)).get(path, path)
+    return static(path)
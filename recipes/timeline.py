@@ -0,0 +1,177 @@
+# recipes/timeline.py
+"""
+Home feeds: new recipes from the authors a user follows, newest first.
+
+Fan-out on write: when a recipe is created, one TimelineEntry per
+follower is bulk inserted, so reading a feed is one indexed range scan
+of the reader's own entries however many authors they follow.
+
+Authors with more than RECIPE_FEED_FANOUT_LIMIT followers would make
+every new recipe write that many rows, so their recipes are left with
+fanned_out unset and merged into feeds at read time instead (fan-out on
+read). Each such author followed costs the reader one more small indexed
+query. The ids of those authors are kept in the shared cache (see
+CACHES in settings) and dropped whenever one is added or fanned out.
+Recipes created before timelines existed were fanned out by migration
+0024; the rebuild_timelines command fans out any left behind, such as
+those of an author who has since dropped under the limit.
+
+Following someone copies their recent recipes into the follower's
+timeline and unfollowing removes them again (see recipes.signals).
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+from . import likes
+from .pagination import CursorPaginator
+
+DEFAULT_FANOUT_LIMIT = 1000  # followers
+# Recipes copied into a timeline when its owner follows someone
+BACKFILL_RECIPES = 50
+BATCH_SIZE = 1000
+PULL_AUTHORS_KEY = 'recipe-feed:pull-authors'
+PULL_AUTHORS_TIMEOUT = 3600  # seconds
+
+
+def _fanout_limit():
+    return getattr(settings, 'RECIPE_FEED_FANOUT_LIMIT', DEFAULT_FANOUT_LIMIT)
+
+
+def fan_out(author_id, recipes):
+    """Copy an author's recipes into their followers' timelines.
+
+    Returns False, leaving the recipes to be read on demand, when the
+    author has too many followers.
+    """
+    from .models import Follow, Recipe, TimelineEntry
+
+    followers = Follow.objects.filter(followed_id=author_id)
+    if followers.count() > _fanout_limit():
+        cache.delete(PULL_AUTHORS_KEY)
+        return False
+    follower_ids = list(followers.values_list('follower_id', flat=True))
+    recipes = list(recipes)
+    with transaction.atomic():
+        for start in range(0, len(follower_ids), BATCH_SIZE):
+            TimelineEntry.objects.bulk_create([
+                TimelineEntry(user_id=user_id, recipe_id=recipe.pk,
+                              author_id=author_id,
+                              created_at=recipe.created_at)
+                for user_id in follower_ids[start:start + BATCH_SIZE]
+                for recipe in recipes
+            ], ignore_conflicts=True)
+        Recipe.objects.filter(
+            pk__in=[recipe.pk for recipe in recipes]
+        ).update(fanned_out=True)
+    return True
+
+
+def fan_out_pending():
+    """Fan out every recipe not yet in timelines, author by author.
+
+    Returns the number of recipes fanned out.
+    """
+    from .models import Recipe
+
+    pending = Recipe.objects.filter(fanned_out=False)
+    fanned_out = 0
+    for author_id in pull_author_ids():
+        recipes = pending.filter(user_id=author_id).only('pk', 'created_at')
+        count = len(recipes)
+        if fan_out(author_id, recipes):
+            fanned_out += count
+    cache.delete(PULL_AUTHORS_KEY)
+    return fanned_out
+
+
+def pull_author_ids():
+    """Ids of authors with recipes that are read into feeds on demand."""
+    from .models import Recipe
+
+    author_ids = cache.get(PULL_AUTHORS_KEY)
+    if author_ids is None:
+        author_ids = sorted(
+            Recipe.objects.filter(fanned_out=False).order_by()
+            .values_list('user_id', flat=True).distinct()
+        )
+        cache.set(PULL_AUTHORS_KEY, author_ids, PULL_AUTHORS_TIMEOUT)
+    return author_ids
+
+
+def follow(user_id, author_id):
+    """Copy the author's recent fanned-out recipes into a timeline."""
+    from .models import Recipe, TimelineEntry
+
+    recipes = (
+        Recipe.objects.filter(user_id=author_id, fanned_out=True)
+        .order_by('-created_at', '-id')
+        .values_list('pk', 'created_at')[:BACKFILL_RECIPES]
+    )
+    TimelineEntry.objects.bulk_create([
+        TimelineEntry(user_id=user_id, recipe_id=recipe_id,
+                      author_id=author_id, created_at=created_at)
+        for recipe_id, created_at in recipes
+    ], ignore_conflicts=True)
+
+
+def unfollow(user_id, author_id):
+    """Remove an author's recipes from a timeline."""
+    from .models import TimelineEntry
+
+    TimelineEntry.objects.filter(user_id=user_id,
+                                 author_id=author_id).delete()
+
+
+def _beyond(position, backwards, pk_name):
+    """Q for rows after position in (created_at, pk) descending order."""
+    created_at, pk = position
+    lookup = 'gt' if backwards else 'lt'
+    return (Q(**{f'created_at__{lookup}': created_at}) |
+            Q(created_at=created_at, **{f'{pk_name}__{lookup}': pk}))
+
+
+def feed_page(user, cursor=None, per_page=12):
+    """Return a CursorPage of the user's feed.
+
+    Takes the next per_page + 1 candidates from the timeline and from
+    each followed fan-out-on-read author, then pages over just those, so
+    the cost depends on the page size rather than on how many authors
+    the user follows or how long their timeline is. The recipes are
+    annotated with the user's liked flag (see recipes.likes).
+    """
+    from .models import Follow, Recipe, TimelineEntry
+
+    ordered = Recipe.objects.order_by('-created_at', '-id')
+    position, direction = CursorPaginator(ordered, per_page).decode(cursor)
+    backwards = direction == 'previous'
+    descending = '' if backwards else '-'
+
+    timeline = TimelineEntry.objects.filter(user=user)
+    if position is not None:
+        timeline = timeline.filter(_beyond(position, backwards, 'recipe_id'))
+    recipe_ids = list(
+        timeline.order_by(f'{descending}created_at', f'{descending}recipe_id')
+        .values_list('recipe_id', flat=True)[:per_page + 1]
+    )
+
+    pull_authors = pull_author_ids()
+    if pull_authors:
+        followed = Follow.objects.filter(
+            follower=user, followed_id__in=pull_authors
+        ).values_list('followed_id', flat=True)
+        for author_id in followed:
+            recipes = Recipe.objects.filter(user_id=author_id,
+                                            fanned_out=False)
+            if position is not None:
+                recipes = recipes.filter(_beyond(position, backwards, 'id'))
+            recipe_ids.extend(
+                recipes.order_by(f'{descending}created_at', f'{descending}id')
+                .values_list('pk', flat=True)[:per_page + 1]
+            )
+
+    candidates = likes.with_liked(
+        ordered.filter(pk__in=recipe_ids).select_related('user'), user
+    )
+    return CursorPaginator(candidates, per_page).get_page(cursor)
@@ -12,6 +12,7 @@ urlpatterns = [
     path('', views.recipe_list, name='recipe_list'),  # Homepage
     path('test/', views.test_view, name='test_view'),  # Test view
     path('api/ingredients/', views.ingredients_api, name='ingredients_api'),
+    path('api/recipes/', views.recipe_list_api, name='recipe_list_api'),
     path('recipes/<slug:slug>/', views.recipe_detail, name='recipe_detail'),
     path('recipes/<slug:slug>/edit/', views.recipe_edit, name='recipe_edit'),
     path(
@@ -22,6 +23,8 @@ urlpatterns = [
     path('recipes/<slug:slug>/like/', views.toggle_like, name='toggle_like'),
     path('create/', views.recipe_create, name='recipe_create'),
     path('liked/', views.liked_recipes, name='liked_recipes'),
+    path('feed/', views.feed, name='feed'),
+    path('api/feed/', views.feed_api, name='feed_api'),
     path('follow/<str:username>/', views.toggle_follow, name='toggle_follow'),
     path('comment/<int:comment_id>/delete/', views.comment_delete, name='comment_delete'),
 ]
@@ -0,0 +1,123 @@
+# recipes/view_counter.py
+"""
+Buffered recipe view counting.
+
+Page views are tallied in process memory and written to the database in
+batches: one UPDATE ... SET view_count = view_count + CASE ... statement
+covers every recipe viewed since the last flush. Using F() expressions
+means concurrent workers never lose each other's increments, and update()
+leaves the rest of the row (including updated_at) alone.
+
+A flush happens when the buffer is older than VIEW_COUNT_FLUSH_INTERVAL
+seconds, when it holds VIEW_COUNT_MAX_PENDING recipes, and when the worker
+process exits. The first view buffered after a flush starts a daemon
+timer that flushes once the interval has passed, so an idle worker
+doesn't sit on its counted views.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, models
+from django.db.models import Case, F, Value, When
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_INTERVAL = 10  # seconds
+DEFAULT_MAX_PENDING = 250  # distinct recipes
+
+_lock = threading.Lock()
+_pending = Counter()
+_last_flush = time.monotonic()
+_timer = None
+
+
+def _flush_interval():
+    return getattr(settings, 'VIEW_COUNT_FLUSH_INTERVAL',
+                   DEFAULT_FLUSH_INTERVAL)
+
+
+def _max_pending():
+    return getattr(settings, 'VIEW_COUNT_MAX_PENDING', DEFAULT_MAX_PENDING)
+
+
+def record_view(recipe_id):
+    """Count one view of a recipe, flushing the buffer when it is due."""
+    global _timer
+    with _lock:
+        _pending[recipe_id] += 1
+        due = (len(_pending) >= _max_pending() or
+               time.monotonic() - _last_flush >= _flush_interval())
+        if not due and _timer is None:
+            _timer = threading.Timer(_flush_interval(), _flush_on_timer)
+            _timer.daemon = True
+            _timer.start()
+    if due:
+        flush()
+
+
+def _flush_on_timer():
+    try:
+        flush()
+    finally:
+        # The timer thread's database connection isn't reused
+        connection.close()
+
+
+def pending_views(recipe_id):
+    """Views of a recipe recorded but not yet written to the database."""
+    with _lock:
+        return _pending[recipe_id]
+
+
+def flush():
+    """Write all buffered views to the database.
+
+    Returns the number of recipe rows updated.
+    """
+    global _last_flush, _timer
+    with _lock:
+        counts = dict(_pending)
+        _pending.clear()
+        _last_flush = time.monotonic()
+        if _timer is not None:
+            _timer.cancel()
+            _timer = None
+    if not counts:
+        return 0
+
+    try:
+        return _apply_counts(counts)
+    except Exception as e:
+        # Keep the views for the next flush rather than dropping them
+        logger.error(f"Failed to flush recipe view counts: {e}")
+        with _lock:
+            _pending.update(counts)
+        return 0
+
+
+def _apply_counts(counts):
+    """Add the counts to view_count in a single UPDATE statement."""
+    from .models import Recipe
+
+    # Group recipes by increment so the CASE stays short: most recipes
+    # in a batch share the same small number of views.
+    by_increment = {}
+    for recipe_id, views in counts.items():
+        by_increment.setdefault(views, []).append(recipe_id)
+
+    increment = Case(
+        *[When(pk__in=recipe_ids, then=Value(views))
+          for views, recipe_ids in by_increment.items()],
+        default=Value(0),
+        output_field=models.PositiveIntegerField(),
+    )
+    return Recipe.objects.filter(pk__in=counts).update(
+        view_count=F('view_count') + increment
+    )
+
+
+atexit.register(flush)
@@ -3,12 +3,13 @@ from django.views.decorators.http import require_POST
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.core.paginator import Paginator
-from django.db.models import Q
 from django.http import HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 
 from .forms import (RecipeForm, RecipeIngredientFormSet, RecipeStepFormSet,
                     CommentForm, RatingForm, RecipeSearchForm)
+from . import carousel, facets, likes, search, timeline, view_counter
+from .pagination import CursorPage, CursorPaginator
 from .models import Recipe, Tag, Comment, Rating, Ingredient
 from .notifications import send_comment_notification, send_rating_notification
 
@@ -16,6 +17,8 @@ from .notifications import send_comment_notification, send_rating_notification
 Views for the recipes app.
 """
 
+RECIPES_PER_PAGE = 12
+
 
 @login_required
 @require_POST
@@ -33,11 +36,12 @@ def test_view(request):
     """Simple test view for debugging."""
     return HttpResponse("Test view works!")
 
-def recipe_list(request):
-    """Display all recipes with advanced filtering and pagination."""
-    
-    # Initialize the search form with GET data
-    search_form = RecipeSearchForm(request.GET or None)
+def _filter_recipes(request, search_form):
+    """Apply the search form, recommendations and dietary restrictions.
+
+    Returns the recipes and a tuple describing the per-user filtering
+    applied on top of the form (empty when there was none).
+    """
     
     # Start with all recipes
     recipes = Recipe.objects.all()
@@ -48,13 +52,8 @@ def recipe_list(request):
         
         # Text search
         if form_data.get('search'):
-            search_query = form_data['search']
-            recipes = recipes.filter(
-                Q(title__icontains=search_query) |
-                Q(description__icontains=search_query) |
-                Q(tags__name__icontains=search_query) |
-                Q(ingredients__ingredient__name__icontains=search_query)
-            ).distinct()
+            # Full-text search, ordered by relevance unless a sort is chosen
+            recipes = search.search_recipes(recipes, form_data['search'])
         
         # Tags filter
         if form_data.get('tags'):
@@ -87,7 +86,19 @@ def recipe_list(request):
         if form_data.get('max_servings'):
             recipes = recipes.filter(servings__lte=form_data['max_servings'])
         
-        # Difficulty filter (based on total time)
+        # Nutrition filters (against the stored per-serving columns)
+        for nutrient in ('calories', 'protein', 'carbs', 'fat'):
+            field = f'{nutrient}_per_serving'
+            if form_data.get(f'min_{nutrient}') is not None:
+                recipes = recipes.filter(
+                    **{f'{field}__gte': form_data[f'min_{nutrient}']}
+                )
+            if form_data.get(f'max_{nutrient}') is not None:
+                recipes = recipes.filter(
+                    **{f'{field}__lte': form_data[f'max_{nutrient}']}
+                )
+        
+        # Difficulty filter (based on the stored total time)
         difficulty = form_data.get('difficulty')
         if difficulty == 'easy':
             recipes = recipes.filter(total_time__lt=30)
@@ -96,82 +107,109 @@ def recipe_list(request):
         elif difficulty == 'hard':
             recipes = recipes.filter(total_time__gt=60)
         
-        # Sorting
-        sort_by = form_data.get('sort_by', '-created_at')
+        # Sorting (an empty choice keeps search relevance order, otherwise
+        # falls back to newest first)
+        sort_by = form_data.get('sort_by')
         if sort_by == '-average_rating':
-            # Sort by average rating
-            from django.db.models import Avg
-            recipes = recipes.annotate(
-                avg_rating=Avg('ratings__rating')
-            ).order_by('-avg_rating', '-created_at')
-        else:
+            # Sort by the stored average rating (indexed with created_at)
+            recipes = recipes.order_by('-rating_avg', '-created_at')
+        elif sort_by in ('calories_per_serving', '-protein_per_serving'):
+            # Nutrition sorts, newest first among equals (both indexed)
+            recipes = recipes.order_by(sort_by, '-created_at')
+        elif sort_by:
             recipes = recipes.order_by(sort_by)
+        elif not form_data.get('search'):
+            recipes = recipes.order_by('-created_at')
     else:
         # Default sorting if no form or invalid form
         recipes = recipes.order_by('-created_at')
     
     # Check if user wants personalized recommendations
+    showing_recommendations = False
+    scope = ()
     if request.user.is_authenticated and request.GET.get('for_you') == '1':
         # Get personalized recommendations
         recommended_recipes = request.user.profile.get_recommended_recipes(
             limit=50)
         if recommended_recipes:
             recipes = recommended_recipes
+            showing_recommendations = True
+            scope = ('for_you', request.user.pk)
     
-    # Apply dietary restrictions for authenticated users
-    if (request.user.is_authenticated and
-            request.user.profile.dietary_tags.exists() and
+    # Apply dietary restrictions for authenticated users (recommendations
+    # are already filtered by them)
+    if (request.user.is_authenticated and not showing_recommendations and
             not request.GET.get('tags') and not request.GET.get('dietary') and
             not request.GET.get('search')):
-        # Filter out recipes that don't match user's dietary restrictions
-        compatible_recipes = []
-        for recipe in recipes:
-            if request.user.profile.matches_dietary_restrictions(recipe):
-                compatible_recipes.append(recipe.id)
-        if compatible_recipes:
-            recipes = recipes.filter(id__in=compatible_recipes)
+        dietary_tag_ids = request.user.profile.get_dietary_tag_ids()
+        if dietary_tag_ids:
+            # Filter out recipes that don't match user's dietary restrictions
+            compatible_recipes = recipes.with_all_tags(dietary_tag_ids)
+            if compatible_recipes.exists():
+                recipes = compatible_recipes
+                scope = ('dietary', *sorted(dietary_tag_ids))
     
-    # Pagination - 12 recipes per page
-    paginator = Paginator(recipes, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    return recipes, scope
+
+
+def _paginate(request, queryset):
+    """Paginate by page number, or by cursor when ?cursor= is given."""
+    if 'cursor' in request.GET:
+        paginator = CursorPaginator(queryset, RECIPES_PER_PAGE)
+        return paginator.get_page(request.GET.get('cursor'))
+    paginator = Paginator(queryset, RECIPES_PER_PAGE)
+    return paginator.get_page(request.GET.get('page'))
+
+
+def _cursor_query(request, cursor):
+    """The current query string with the cursor replaced."""
+    params = request.GET.copy()
+    params.pop('page', None)
+    params['cursor'] = cursor
+    return params.urlencode()
+
+
+def _cursor_links(request, page_obj):
+    """Query strings for the next/previous links of a cursor page."""
+    if not isinstance(page_obj, CursorPage):
+        return {}
+    return {
+        'next_query': (_cursor_query(request, page_obj.next_cursor)
+                       if page_obj.has_next() else None),
+        'previous_query': (_cursor_query(request, page_obj.previous_cursor)
+                           if page_obj.has_previous() else None),
+    }
+
+
+def recipe_list(request):
+    """Display all recipes with advanced filtering and pagination."""
     
-    # Add liked status for authenticated users
-    if request.user.is_authenticated:
-        from .models import RecipeLike
-        liked_recipe_ids = set(RecipeLike.objects.filter(
-            user=request.user
-        ).values_list('recipe_id', flat=True))
-        
-        # Add is_liked attribute to each recipe
-        for recipe in page_obj:
-            recipe.is_liked = recipe.id in liked_recipe_ids
-    else:
-        # For anonymous users, no recipes are liked
-        for recipe in page_obj:
-            recipe.is_liked = False
+    # Initialize the search form with GET data
+    search_form = RecipeSearchForm(request.GET or None)
+    recipes, scope = _filter_recipes(request, search_form)
     
-    # Get all tags for filtering
-    all_tags = Tag.objects.all()
-    dietary_tags = Tag.objects.filter(tag_type='dietary')
+    # Pagination - 12 recipes per page, with each card's liked status
+    page_obj = _paginate(request, likes.with_liked(recipes, request.user))
+    likes.mark_liked(page_obj, request.user)
     
-    # Get cuisine tags for carousel (use any tags as cuisines)
-    cuisine_tags = Tag.objects.filter(
-        recipe__isnull=False
-    ).distinct()[:5]  # Get 5 tags that have recipes
-    carousel_data = []
-    for cuisine in cuisine_tags:
-        cuisine_recipes = Recipe.objects.filter(tags=cuisine)[:6]
-        if cuisine_recipes.exists():
-            carousel_data.append({
-                'cuisine': cuisine,
-                'recipes': cuisine_recipes
-            })
+    # Get all tags for filtering, with how many results each would give
+    facet_counts = facets.facet_counts(
+        recipes, facets.filter_signature(search_form, scope)
+    )
+    all_tags = list(Tag.objects.all())
+    for tag in all_tags:
+        tag.result_count = facet_counts['tags'].get(tag.pk, 0)
+    dietary_tags = [tag for tag in all_tags if tag.tag_type == 'dietary']
+    
+    # Cuisine carousel (use any tags that have recipes as cuisines)
+    carousel_data = carousel.get_carousel()
 
     context = {
         'page_obj': page_obj,
+        'cursor_links': _cursor_links(request, page_obj),
         'all_tags': all_tags,
         'dietary_tags': dietary_tags,
+        'facet_counts': facet_counts,
         'carousel_data': carousel_data,
         'search_form': search_form,
         'for_you': request.GET.get('for_you') == '1',
@@ -189,9 +227,10 @@ def recipe_detail(request, slug):
     """Display individual recipe details with comments and ratings"""
     recipe = get_object_or_404(Recipe, slug=slug)
     
-    # Increment view count
-    recipe.view_count += 1
-    recipe.save()
+    # Count the view; the buffer is written to the database in batches,
+    # so add the unflushed views for display
+    view_counter.record_view(recipe.pk)
+    recipe.view_count += view_counter.pending_views(recipe.pk)
     
     # Get comments for this recipe (only approved top-level comments)
     comments = Comment.objects.filter(
@@ -213,12 +252,8 @@ def recipe_detail(request, slug):
             pass
         
         # Check if user has liked this recipe
-        from .models import RecipeLike, Follow
-        is_liked = (
-            RecipeLike.objects
-            .filter(user=request.user, recipe=recipe)
-            .exists()
-        )
+        from .models import Follow
+        is_liked = likes.has_liked(request.user, recipe)
         
         # Check if user is following the recipe author
         is_following = (
@@ -313,10 +348,15 @@ def recipe_detail(request, slug):
     comment_form = CommentForm()
     rating_form = RatingForm()
     
-    # Get related recipes (same tags)
-    related_recipes = Recipe.objects.filter(
-        tags__in=recipe.tags.all()
-    ).exclude(id=recipe.id).distinct()[:4]
+    # Get related recipes, precomputed by build_related_recipes; recipes
+    # it hasn't scored yet fall back to any recipes sharing a tag
+    related_recipes = list(Recipe.objects.filter(
+        related_from__recipe=recipe
+    ).order_by('related_from__rank')[:4])
+    if not related_recipes and recipe.related_stale:
+        related_recipes = Recipe.objects.filter(
+            tags__in=recipe.tags.all()
+        ).exclude(id=recipe.id).distinct()[:4]
     
     context = {
         'recipe': recipe,
@@ -574,16 +614,74 @@ def toggle_follow(request, username):
 @login_required
 def liked_recipes(request):
     """Display user's liked recipes."""
-    liked_recipe_objects = request.user.profile.get_liked_recipes()
-    recipes = [like.recipe for like in liked_recipe_objects]
+    liked = request.user.profile.get_liked_recipes().order_by(
+        '-created_at', '-id'
+    )
     
-    # Paginate results
-    paginator = Paginator(recipes, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Paginate the likes (newest first), then show their recipes
+    page_obj = _paginate(request, liked)
+    page_obj.object_list = [like.recipe for like in page_obj.object_list]
     
     return render(request, 'recipes/liked_recipes.html', {
         'page_obj': page_obj,
-        'total_liked': len(recipes)
+        'cursor_links': _cursor_links(request, page_obj),
+        'total_liked': likes.like_count(request.user)
     })
 
+
+def recipe_list_api(request):
+    """Cursor-paginated recipe list as JSON, for infinite scrolling.
+
+    Accepts the same filters as recipe_list. Pass the returned next
+    cursor as ?cursor= to fetch the following page.
+    """
+    search_form = RecipeSearchForm(request.GET or None)
+    recipes, _ = _filter_recipes(request, search_form)
+    page_obj = CursorPaginator(
+        recipes.select_related('user'), RECIPES_PER_PAGE
+    ).get_page(request.GET.get('cursor'))
+    return _cursor_page_json(page_obj)
+
+
+def _cursor_page_json(page_obj):
+    """JSON response for a CursorPage of recipes."""
+    return JsonResponse({
+        'results': [
+            {
+                'id': recipe.id,
+                'title': recipe.title,
+                'url': recipe.get_absolute_url(),
+                'image_url': recipe.get_image_url(),
+                'author': recipe.user.username,
+                'created_at': recipe.created_at,
+                'total_time': recipe.total_time,
+                'servings': recipe.servings,
+                'average_rating': recipe.rating_avg,
+                'rating_count': recipe.rating_count,
+            }
+            for recipe in page_obj
+        ],
+        'next': page_obj.next_cursor,
+        'previous': page_obj.previous_cursor,
+    })
+
+
+@login_required
+def feed(request):
+    """New recipes from the authors the user follows, newest first."""
+    page_obj = timeline.feed_page(request.user, request.GET.get('cursor'),
+                                  RECIPES_PER_PAGE)
+    likes.mark_liked(page_obj, request.user)
+    return render(request, 'recipes/feed.html', {
+        'page_obj': page_obj,
+        'cursor_links': _cursor_links(request, page_obj),
+    })
+
+
+@login_required
+def feed_api(request):
+    """The user's feed as JSON; pass the returned next cursor as ?cursor=."""
+    page_obj = timeline.feed_page(request.user, request.GET.get('cursor'),
+                                  RECIPES_PER_PAGE)
+    return _cursor_page_json(page_obj)
+
@@ -1,48 +1,263 @@
 #!/usr/bin/env python3
 """
 Build script for OnlyPans production optimization
-Minifies CSS and JavaScript files for better performance
+
+Minifies every stylesheet and script under static/css and static/js
+(mangling the scripts' local names) into static/dist/, under
+content-hashed names such as
+dist/css/styles.1a2b3c4d5e6f.min.css that can be cached forever, and
+records them in static/dist/manifest.json for the {% asset %} template
+tag.
+
+The manifest also stores a hash of each source, so a rebuild only
+minifies files that changed (all of them when the minifiers themselves
+change, or with --force). Changed files are minified in parallel across
+CPU cores, and outputs no longer in the manifest are deleted.
+
+Every text asset under static/ (the builds, the sources, the older
+*.min.* files, favicons, ...) then gets .gz and .br siblings at maximum
+compression, for WhiteNoise to serve as they are. Variants are only
+kept when they save at least 5%, and are only rebuilt when older than
+the file they compress. Brotli variants need the Brotli package.
+
+Usage: python scripts/build.py [--force]
 """
+import argparse
+import functools
+import gzip
+import hashlib
+import json
 import os
-import subprocess
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from minify_css import minify_css
+from minify_js import minify_js
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+STATIC_DIR = SCRIPTS_DIR.parent / 'static'
+SOURCE_DIRS = ['css', 'js']
+DIST_DIR = STATIC_DIR / 'dist'
+MANIFEST = DIST_DIR / 'manifest.json'
+MINIFIERS = {'.css': minify_css,
+             '.js': functools.partial(minify_js, mangle_names=True)}
+# Scripts whose changes invalidate every built asset
+TOOLS = ['build.py', 'minify_css.py', 'minify_js.py']
+HASH_LENGTH = 12
+COMPRESSIBLE = {'.css', '.js', '.svg', '.webmanifest', '.json', '.txt',
+                '.xml', '.html', '.map'}
+# Compressed variants bigger than this fraction of the original aren't
+# worth serving (the same cut-off WhiteNoise uses)
+MAX_COMPRESSION_RATIO = 0.95
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def discover_sources():
+    """Paths, relative to static/, of every file there is to minify"""
+    sources = []
+    for directory in SOURCE_DIRS:
+        for path in sorted((STATIC_DIR / directory).rglob('*')):
+            name = path.name
+            # Skip the outputs of the standalone minify_*.py scripts
+            if (path.is_file() and path.suffix in MINIFIERS and
+                    not name.endswith(('.min.css', '.min.js'))):
+                sources.append(path.relative_to(STATIC_DIR).as_posix())
+    return sources
+
 
+def tools_hash():
+    return sha256(b''.join(
+        (SCRIPTS_DIR / name).read_bytes() for name in TOOLS
+    ))
 
-def run_minifiers():
-    """Run CSS and JavaScript minification"""
+
+def load_manifest():
     try:
-        # Minify CSS
-        print("Minifying CSS...")
-        result_css = subprocess.run([sys.executable, "minify_css.py"], 
-                                   capture_output=True, text=True)
-        if result_css.returncode == 0:
-            print(result_css.stdout)
+        with open(MANIFEST, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {'tools': None, 'assets': {}}
+
+
+def output_name(source, content):
+    """css/styles.css -> dist/css/styles.<content hash>.min.css"""
+    path = Path(source)
+    digest = sha256(content)[:HASH_LENGTH]
+    return (Path('dist') / path.parent /
+            f'{path.stem}.{digest}.min{path.suffix}').as_posix()
+
+
+def build_asset(source):
+    """Minify one source file; runs in a worker process"""
+    original = (STATIC_DIR / source).read_text(encoding='utf-8')
+    minified = MINIFIERS[Path(source).suffix](original).encode('utf-8')
+    return source, len(original.encode('utf-8')), minified
+
+
+def build(force=False):
+    """Build changed assets and rewrite the manifest; returns it"""
+    manifest = load_manifest()
+    tools = tools_hash()
+    if manifest.get('tools') != tools:
+        force = True
+    previous = manifest.get('assets', {})
+
+    assets, changed = {}, []
+    for source in discover_sources():
+        source_hash = sha256((STATIC_DIR / source).read_bytes())
+        entry = previous.get(source)
+        if (not force and entry and entry['source'] == source_hash and
+                (STATIC_DIR / entry['output']).exists()):
+            assets[source] = entry
         else:
-            print(f"CSS minification failed: {result_css.stderr}")
-            
-        # Minify JavaScript
-        print("Minifying JavaScript...")
-        result_js = subprocess.run([sys.executable, "minify_js.py"], 
-                                  capture_output=True, text=True)
-        if result_js.returncode == 0:
-            print(result_js.stdout)
+            assets[source] = {'source': source_hash}
+            changed.append(source)
+
+    if changed:
+        with ProcessPoolExecutor() as pool:
+            for source, size, minified in pool.map(build_asset, changed):
+                output = output_name(source, minified)
+                path = STATIC_DIR / output
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_bytes(minified)
+                assets[source].update(output=output, source_size=size,
+                                      size=len(minified))
+                reduction = (1 - len(minified) / size) * 100 if size else 0
+                print(f"✅ {source} -> {output} "
+                      f"({size:,} -> {len(minified):,} bytes, "
+                      f"{reduction:.1f}% smaller)")
+
+    manifest = {'tools': tools, 'assets': assets}
+    DIST_DIR.mkdir(parents=True, exist_ok=True)
+    with open(MANIFEST, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+    # Drop outputs of sources that have changed or gone away
+    current = {entry['output'] for entry in assets.values()}
+    for path in DIST_DIR.rglob('*.min.*'):
+        name = path.relative_to(STATIC_DIR).as_posix()
+        if path.suffix in MINIFIERS and name not in current:
+            path.unlink()
+            print(f"🗑️  Removed {name}")
+
+    print(f"\n🚀 Built {len(changed)} of {len(assets)} assets "
+          f"({len(assets) - len(changed)} unchanged) on "
+          f"{os.cpu_count()} cores")
+    return manifest
+
+
+def compress_gzip(data):
+    # mtime=0 keeps the output identical from build to build
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def compress_brotli(data):
+    return brotli.compress(data, quality=11, mode=brotli.MODE_TEXT)
+
+
+ENCODERS = {'.gz': compress_gzip}
+if brotli:
+    ENCODERS['.br'] = compress_brotli
+
+
+def discover_compressible():
+    """Paths, relative to static/, of every text asset"""
+    return [
+        path.relative_to(STATIC_DIR).as_posix()
+        for path in sorted(STATIC_DIR.rglob('*'))
+        if (path.is_file() and path.suffix in COMPRESSIBLE and
+            path != MANIFEST)
+    ]
+
+
+def needs_compressing(name):
+    path = STATIC_DIR / name
+    modified = path.stat().st_mtime
+    for suffix in ENCODERS:
+        variant = path.with_name(path.name + suffix)
+        if not variant.exists() or variant.stat().st_mtime < modified:
+            return True
+    return False
+
+
+def compress_asset(name):
+    """Write one file's compressed variants; runs in a worker process.
+
+    Returns the name, its size and {suffix: variant size, or None when
+    compressing didn't pay off}.
+    """
+    path = STATIC_DIR / name
+    data = path.read_bytes()
+    sizes = {}
+    for suffix, compress in ENCODERS.items():
+        variant = path.with_name(path.name + suffix)
+        compressed = compress(data)
+        if len(compressed) <= len(data) * MAX_COMPRESSION_RATIO:
+            variant.write_bytes(compressed)
+            sizes[suffix] = len(compressed)
         else:
-            print(f"JavaScript minification failed: {result_js.stderr}")
-            
-        print("\n🚀 Build optimization complete!")
-        print("✅ CSS minified for production")
-        print("✅ JavaScript minified for production")
-        print("✅ Critical CSS inlined")
-        print("✅ Resources set to defer/preload")
-        
-    except Exception as e:
-        print(f"Build script error: {e}")
+            variant.unlink(missing_ok=True)
+            sizes[suffix] = None
+    return name, len(data), sizes
+
+
+def compress(force=False):
+    """Compress new and changed text assets; returns bytes saved"""
+    if not brotli:
+        print("⚠️  Brotli isn't installed; writing .gz variants only")
+    pending = [name for name in discover_compressible()
+               if force or needs_compressing(name)]
+    saved = dict.fromkeys(ENCODERS, 0)
+    if pending:
+        with ProcessPoolExecutor() as pool:
+            for name, size, sizes in pool.map(compress_asset, pending):
+                results = []
+                for suffix, compressed in sizes.items():
+                    if compressed is None:
+                        results.append(f"{suffix} skipped")
+                    else:
+                        saved[suffix] += size - compressed
+                        results.append(f"{suffix} {compressed:,}")
+                print(f"🗜️  {name} ({size:,} bytes): "
+                      f"{', '.join(results)}")
+
+    # Drop variants of files that have gone away
+    for suffix in ('.gz', '.br'):
+        for variant in STATIC_DIR.rglob(f'*{suffix}'):
+            if not variant.with_name(variant.name[:-len(suffix)]).exists():
+                variant.unlink()
+
+    print(f"\n📦 Compressed {len(pending)} assets, saving " + ', '.join(
+        f"{count:,} bytes as {suffix}" for suffix, count in saved.items()
+    ))
+    return saved
 
 
 def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--force', action='store_true',
+                        help='Rebuild and recompress every asset, '
+                             'changed or not')
+    args = parser.parse_args()
+
     print("🔧 OnlyPans Production Build Script")
     print("===================================")
-    run_minifiers()
+    try:
+        build(force=args.force)
+        compress(force=args.force)
+    except Exception as e:
+        print(f"Build script error: {e}")
+        sys.exit(1)
 
 
 if __name__ == "__main__":
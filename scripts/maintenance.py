@@ -9,22 +9,7 @@ import os
 def minify_css():
     """Minify CSS files for production"""
     print("🔧 Minifying CSS...")
-    # Minify CSS using Python
-    minify_cmd = """
-    python -c "
-import re
-with open('static/css/styles.css', 'r') as f:
-    css = f.read()
-css = re.sub(r'/\\*.*?\\*/', '', css, flags=re.DOTALL)
-css = re.sub(r'\\s+', ' ', css)
-css = re.sub(r';\\s*}', '}', css)
-css = re.sub(r'{\\s*', '{', css)
-css = re.sub(r';\\s*', ';', css)
-with open('static/css/styles.min.css', 'w') as f:
-    f.write(css.strip())
-"
-    """
-    os.system(minify_cmd.strip())
+    os.system("python scripts/minify_css.py")
     print("✅ CSS minified successfully")
 
 
@@ -1,46 +1,127 @@
 #!/usr/bin/env python3
 """
-Simple CSS minifier to reduce file size for performance optimization
+CSS minifier for OnlyPans static assets
+
+tokenize() splits a stylesheet into strings, url()s, comments,
+whitespace and everything else in a single pass, so quoted text and
+url()s are copied through untouched. Comments become whitespace, and
+whitespace is dropped only where the tokens around it can't run
+together, which depends on where it is:
+
+* in declarations, around : ; , { } ! and inside ( ), but never around
+  + or -, which calc() needs spaces around
+* in selectors, also around the > + ~ combinators, but not before :,
+  since "a :hover" and "a:hover" select different things
+* in at-rule preludes such as @media, never before (, since
+  "and (...)" would become a function
+
+The last ; of each block is dropped too.
+
+Usage: python scripts/minify_css.py
 """
 import re
 import os
 
+TOKEN = re.compile(r'''
+    (?P<comment> /\*.*?\*/ )
+  | (?P<space> \s+ )
+  | (?P<string> "(?:[^"\\\n]|\\[\s\S])*" | '(?:[^'\\\n]|\\[\s\S])*' )
+  | (?P<url> url\(\s*[^\s"'()]*\s*\) )
+  | (?P<punct> [{}:;,()>+~!] )
+  | (?P<other> (?:\\[\s\S]|/(?!\*)|[^\s{}:;,()>+~!"'/\\])+ )
+''', re.S | re.X | re.I)
+# At-rules whose blocks hold rules rather than declarations
+GROUPING_RULES = ('@media', '@supports', '@container', '@layer',
+                  '@document', '@-moz-document', '@scope', '@keyframes',
+                  '@-webkit-keyframes', '@starting-style')
+
+# Characters whitespace can be dropped after and before, by context
+DROP_AFTER = {
+    'declarations': '{};:,(!',
+    'selector': '{};,(>+~',
+    'prelude': '{};,(:',
+}
+DROP_BEFORE = {
+    'declarations': '{};:,)!',
+    'selector': '{};,)>+~',
+    'prelude': '{};,):',
+}
+
+
+def tokenize(css):
+    """Yield (kind, text) for each token in css"""
+    position = 0
+    while position < len(css):
+        match = TOKEN.match(css, position)
+        if not match:
+            raise ValueError(f'Unterminated {css[position]!r} at {position}')
+        yield match.lastgroup, match.group()
+        position = match.end()
+
+
 def minify_css(css_content):
-    """Basic CSS minification"""
-    # Remove comments
-    css_content = re.sub(r'/\*.*?\*/', '', css_content, flags=re.DOTALL)
-    
-    # Remove extra whitespace
-    css_content = re.sub(r'\s+', ' ', css_content)
-    
-    # Remove space around certain characters
-    css_content = re.sub(r'\s*([{}:;,>+~])\s*', r'\1', css_content)
-    
-    # Remove trailing semicolons before closing braces
-    css_content = re.sub(r';\s*}', '}', css_content)
-    
-    # Remove leading/trailing whitespace
-    css_content = css_content.strip()
-    
-    return css_content
+    """Minify CSS without changing what it means"""
+    out = []
+    blocks = []  # 'rules' or 'declarations' for each open {
+    statement = []  # tokens since the last { } or ; at this level
+    space = False
+    for kind, text in tokenize(css_content):
+        if kind in ('comment', 'space'):
+            space = True
+            continue
+        if kind == 'url':
+            text = f'{text[:4]}{text[4:-1].strip()})'
+
+        if blocks and blocks[-1] == 'declarations':
+            context = 'declarations'
+        elif (statement or [text])[0].startswith('@'):
+            context = 'prelude'
+        else:
+            context = 'selector'
+        if (space and out and
+                out[-1][-1] not in DROP_AFTER[context] and
+                text[0] not in DROP_BEFORE[context]):
+            out.append(' ')
+        space = False
+
+        if text == '{':
+            prelude = ''.join(statement).lower()
+            blocks.append('rules' if prelude.startswith(GROUPING_RULES)
+                          else 'declarations')
+            statement = []
+        elif text == '}':
+            if out and out[-1] == ';':
+                out.pop()
+            if blocks:
+                blocks.pop()
+            statement = []
+        elif text == ';':
+            statement = []
+            if not out or out[-1] in ('{', ';'):
+                continue
+        else:
+            statement.append(text)
+        out.append(text)
+    return ''.join(out)
+
 
 def main():
     css_file = 'static/css/styles.css'
     minified_file = 'static/css/styles.min.css'
-    
+
     if os.path.exists(css_file):
         with open(css_file, 'r', encoding='utf-8') as f:
             original_css = f.read()
-        
+
         minified_css = minify_css(original_css)
-        
+
         with open(minified_file, 'w', encoding='utf-8') as f:
             f.write(minified_css)
-        
+
         original_size = len(original_css)
         minified_size = len(minified_css)
         reduction = ((original_size - minified_size) / original_size) * 100
-        
+
         print(f"CSS minification complete!")
         print(f"Original size: {original_size:,} bytes")
         print(f"Minified size: {minified_size:,} bytes")
@@ -48,5 +129,6 @@ def main():
     else:
         print(f"CSS file not found: {css_file}")
 
+
 if __name__ == "__main__":
     main()
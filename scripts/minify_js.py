@@ -1,49 +1,564 @@
 #!/usr/bin/env python3
 """
-Simple JavaScript minifier to reduce file size for performance optimization
+JavaScript minifier for OnlyPans static assets
+
+tokenize() reads the source in a single pass. A / starts a regex literal
+or is division depending on the token before it, and template literals
+are followed through their ${...} substitutions with a stack of open
+braces, so strings, regexes and templates are copied through untouched.
+Comments and whitespace are then dropped except where two tokens would
+run together, and a line break is only kept where automatic semicolon
+insertion could depend on it.
+
+With mangle_names=True, names declared inside functions and blocks
+(parameters, var, let and const, catch bindings and nested function
+declarations) are renamed to the shortest names free in their scope.
+Every occurrence of a name within a scope is renamed the same way, so
+inner bindings that shadow it stay shadowing. Top-level names are left
+alone, since templates and other scripts may use them, as is any scope
+that contains eval, with or a class.
+
+Usage: python scripts/minify_js.py [--mangle]
 """
-import re
+import itertools
 import os
+import re
+import string
+import sys
+
+KEYWORDS = frozenset('''
+    arguments async await break case catch class const continue debugger
+    default delete do else enum eval export extends false finally for
+    function get if implements import in instanceof interface let new null
+    of package private protected public return set static super switch
+    this throw true try typeof undefined var void while with yield
+    Infinity NaN
+'''.split())
+# Keywords after which a / starts a regex and a { an object literal
+EXPRESSION_KEYWORDS = frozenset('''
+    return typeof instanceof in of new delete void throw case do else
+    yield await
+'''.split())
+# Scopes containing these are never mangled
+UNSAFE_NAMES = frozenset(['eval', 'with', 'class'])
+
+WHITESPACE = re.compile(r'(?:\s|//[^\n\r\u2028\u2029]*|/\*.*?\*/)+', re.S)
+LINE_BREAK = re.compile(r'[\n\r\u2028\u2029]')
+NAME = re.compile(r'(?:[^\W\d]|\$)[\w$]*')
+NUMBER = re.compile(r'''
+    (?: 0[xXoObB][\da-fA-F_]+
+      | (?: \d[\d_]*(?:\.[\d_]*)? | \.\d[\d_]* ) (?:[eE][+-]?\d[\d_]*)?
+    ) n?
+''', re.X)
+STRING = re.compile(r'''
+    "(?:[^"\\\n\r]|\\(?:\r\n|[\s\S]))*"
+  | '(?:[^'\\\n\r]|\\(?:\r\n|[\s\S]))*'
+''', re.X)
+REGEX = re.compile(r'/(?:[^/\\\[\n\r]|\\.|\[(?:[^\]\\\n\r]|\\.)*\])+/[\w$]*')
+DIVISION = re.compile(r'/=?')
+# The rest of a template literal from just after ` or }
+TEMPLATE = re.compile(r'(?:[^`\\$]|\\[\s\S]|\$(?!\{))*(?:`|\$\{)')
+PUNCTUATOR = re.compile(r'\?\.(?!\d)|' + '|'.join(
+    re.escape(punctuator) for punctuator in sorted('''
+        >>>= ... === !== **= <<= >>= >>> &&= ||= ??= => == != <= >= && ||
+        ?? ++ -- += -= *= %= &= |= ^= ** << >> { } ( ) [ ] ; , < > + -
+        * % & | ^ ! ~ ? : = . @ #
+    '''.split(), key=len, reverse=True)
+))
+
+
+class Token:
+    """One token, and whether a line break came before it."""
+
+    __slots__ = ('kind', 'value', 'newline', 'key')
+
+    def __init__(self, kind, value, newline):
+        self.kind = kind  # name, number, string, template, regex or punct
+        self.value = value
+        self.newline = newline
+        # The property name of a mangled shorthand property ({name})
+        self.key = None
+
+    def __repr__(self):
+        return f'Token({self.kind!r}, {self.value!r})'
+
+    def text(self):
+        return f'{self.key}:{self.value}' if self.key else self.value
+
+    def is_punct(self, *values):
+        return self.kind == 'punct' and self.value in values
+
+    def opens(self):
+        return (self.is_punct('(', '[', '{') or
+                self.kind == 'template' and self.value.endswith('${'))
+
+    def closes(self):
+        return (self.is_punct(')', ']', '}') or
+                self.kind == 'template' and self.value.startswith('}'))
+
+
+def regex_allowed(prev):
+    """Whether a / after prev starts a regex rather than dividing"""
+    if prev is None:
+        return True
+    if prev.kind == 'name':
+        return prev.value in EXPRESSION_KEYWORDS
+    if prev.kind == 'punct':
+        return prev.value not in (')', ']', '++', '--')
+    if prev.kind == 'template':
+        return prev.value.endswith('${')
+    return False
+
+
+def tokenize(js):
+    """Split js into a list of Tokens, dropping comments and whitespace"""
+    tokens, braces = [], []
+    position, newline, prev = 0, False, None
+    if js.startswith('\ufeff'):
+        position = 1
+    while position < len(js):
+        match = WHITESPACE.match(js, position)
+        if match:
+            newline = newline or bool(LINE_BREAK.search(match.group()))
+            position = match.end()
+            continue
+
+        if js.startswith('/*', position):
+            raise ValueError(f'Unterminated comment at {position}')
+        char = js[position]
+        if char == '`' or (char == '}' and braces and braces[-1] == '`'):
+            if char == '}':
+                braces.pop()
+            match = TEMPLATE.match(js, position + 1)
+            if not match:
+                raise ValueError(f'Unterminated template at {position}')
+            kind = 'template'
+            if match.group().endswith('${'):
+                braces.append('`')
+        elif char in '"\'':
+            match = STRING.match(js, position)
+            if not match:
+                raise ValueError(f'Unterminated string at {position}')
+            kind = 'string'
+        elif char == '/' and regex_allowed(prev):
+            match = REGEX.match(js, position)
+            if not match:
+                raise ValueError(f'Unterminated regex at {position}')
+            kind = 'regex'
+        elif char == '/':
+            match = DIVISION.match(js, position)
+            kind = 'punct'
+        else:
+            for kind, pattern in (('number', NUMBER), ('name', NAME),
+                                  ('punct', PUNCTUATOR)):
+                match = pattern.match(js, position)
+                if match:
+                    break
+            else:
+                raise ValueError(f'Unexpected {char!r} at {position}')
+            if match.group() == '{':
+                braces.append('{')
+            elif match.group() == '}' and braces:
+                braces.pop()
+
+        prev = Token(kind, js[position:match.end()], newline)
+        tokens.append(prev)
+        position, newline = match.end(), False
+    return tokens
+
+
+def is_word(char):
+    return char.isalnum() or char in '_$\\' or ord(char) > 127
+
+
+def ends_statement(token):
+    if token.kind == 'template':
+        return token.value.endswith('`')
+    if token.kind == 'punct':
+        return token.value in (')', ']', '}', '++', '--')
+    return True
+
+
+def starts_statement(token):
+    if token.kind == 'template':
+        return token.value.startswith('`')
+    if token.kind == 'punct':
+        return token.value in ('(', '[', '{', '+', '-', '++', '--', '!',
+                               '~', '#', '@')
+    return True
+
+
+def needs_space(prev, token, before, after):
+    """Whether the texts of two tokens would run together"""
+    a, b = before[-1], after[0]
+    return (is_word(a) and is_word(b) or
+            a in '+-' and b == a or
+            a == '/' and b in '/*' or
+            a == '<' and b == '!' or
+            before.endswith('--') and b == '>' or
+            prev.kind == 'number' and b == '.' and before.isdigit())
 
 
-def minify_js(js_content):
-    """Basic JavaScript minification"""
-    # Remove single-line comments (but preserve URLs)
-    js_content = re.sub(r'//(?![^\n]*:)[^\n]*\n', '\n', js_content)
-    
-    # Remove multi-line comments
-    js_content = re.sub(r'/\*.*?\*/', '', js_content, flags=re.DOTALL)
-    
-    # Remove extra whitespace but preserve line breaks for better debugging
-    js_content = re.sub(r'[ \t]+', ' ', js_content)
-    
-    # Remove blank lines
-    js_content = re.sub(r'\n\s*\n', '\n', js_content)
-    
-    # Remove leading/trailing whitespace from lines
-    lines = [line.strip() for line in js_content.split('\n')]
-    js_content = '\n'.join(lines)
-    
-    return js_content
+def emit(tokens):
+    """Join tokens back up into JavaScript"""
+    out, prev, before = [], None, ''
+    for token in tokens:
+        text = token.text()
+        if prev is not None:
+            if (token.newline and ends_statement(prev) and
+                    starts_statement(token)):
+                out.append('\n')
+            elif needs_space(prev, token, before, text):
+                out.append(' ')
+        out.append(text)
+        prev, before = token, text
+    return ''.join(out)
+
+
+def short_names():
+    """a, b, ... Z, $, _, aa, ab, ... skipping keywords"""
+    first = string.ascii_letters + '$_'
+    rest = first + string.digits
+    for size in itertools.count(1):
+        for chars in itertools.product(first, *[rest] * (size - 1)):
+            name = ''.join(chars)
+            if name not in KEYWORDS:
+                yield name
+
+
+class Scopes:
+    """Bracket structure and declaration scopes of a token list."""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.closing = {}  # opening bracket -> its closing bracket
+        self.opening = {}  # and back
+        self.parent = []  # token -> innermost open bracket around it
+        self.objects = set()  # { of object literals and patterns
+        stack = []
+        for i, token in enumerate(tokens):
+            if token.closes():
+                if not stack:
+                    raise ValueError(f'Unmatched {token.value!r}')
+                open_ = stack.pop()
+                self.closing[open_], self.opening[i] = i, open_
+            self.parent.append(stack[-1] if stack else None)
+            if token.opens():
+                if token.value == '{' and self.is_object(i):
+                    self.objects.add(i)
+                stack.append(i)
+        if stack:
+            raise ValueError(f'Unclosed {tokens[stack[-1]].value!r}')
+
+    def prev(self, i):
+        return self.tokens[i - 1] if i else None
+
+    def next(self, i):
+        return self.tokens[i + 1] if i + 1 < len(self.tokens) else None
+
+    def level(self, start, end):
+        """Indexes from start to end, skipping over bracketed groups"""
+        i = start
+        while i <= end:
+            yield i
+            i = self.closing[i] + 1 if self.tokens[i].opens() else i + 1
+
+    def statement_start(self, i):
+        """The first token of the statement containing token i"""
+        start = self.parent[i] + 1 if self.parent[i] is not None else 0
+        j = i - 1
+        while j >= start:
+            token = self.tokens[j]
+            if token.is_punct(';') or (token.is_punct('}') and
+                                       self.opening[j] not in self.objects):
+                break
+            j = self.opening.get(j, j) - 1
+        return j + 1
+
+    def at_statement_start(self, i):
+        prev = self.prev(i)
+        return (prev is None or prev.is_punct(';', '}') or
+                prev.is_punct('{') and i - 1 not in self.objects)
+
+    def is_object(self, i):
+        """Whether the { at i opens an object literal or pattern"""
+        prev = self.prev(i)
+        if prev is None:
+            return False
+        if prev.kind == 'template':
+            return True
+        if prev.kind == 'name':
+            return (prev.value in EXPRESSION_KEYWORDS - {'do', 'else'} or
+                    prev.value in ('const', 'let', 'var'))
+        if prev.kind != 'punct':
+            return False
+        if prev.value in (')', ']', '}', ';', '{', '=>'):
+            return False
+        if prev.value == ':':
+            colon = i - 1
+            enclosing = self.parent[colon]
+            if enclosing in self.objects:
+                return True
+            # Case clauses and labels are followed by blocks
+            start = self.statement_start(colon)
+            return not (self.tokens[start].value in ('case', 'default') or
+                        start == colon - 1 and
+                        self.tokens[start].kind == 'name')
+        return True
+
+    def is_reference(self, i):
+        """Whether the name at i refers to a variable.
+
+        Returns 'shorthand' for a shorthand property ({name}).
+        """
+        token, prev, next_ = self.tokens[i], self.prev(i), self.next(i)
+        if token.value in KEYWORDS:
+            return False
+        if prev is not None and (prev.is_punct('.', '?.', '#') or
+                                 prev.value in ('break', 'continue')):
+            return False
+        if self.parent[i] in self.objects:
+            key_position = prev.is_punct('{', ',') or (
+                prev.value in ('get', 'set', 'async', 'static') and
+                i > 1 and self.prev(i - 1).is_punct('{', ',')
+            )
+            if key_position and next_ is not None:
+                if next_.is_punct(':', '('):
+                    return False
+                if next_.is_punct(',', '}', '='):
+                    return 'shorthand'
+        elif (next_ is not None and next_.is_punct(':') and
+                self.at_statement_start(i)):
+            return False  # a label
+        return True
+
+    def params(self, open_):
+        """Indexes of the names a parameter list declares"""
+        names = []
+        close = self.closing[open_]
+        for i in self.level(open_ + 1, close - 1):
+            token = self.tokens[i]
+            if (token.kind == 'name' and
+                    self.prev(i).is_punct('(', ',', '...') and
+                    self.next(i).is_punct(',', '=', ')') and
+                    token.value not in KEYWORDS):
+                names.append(i)
+        return names
+
+    def declarations(self, start, end, keywords):
+        """Names declared by keywords at the top level of start..end"""
+        names = []
+        indexes = list(self.level(start, end))
+        for n, i in enumerate(indexes):
+            if self.tokens[i].value not in keywords:
+                continue
+            if self.tokens[i].value == 'function':
+                if self.at_statement_start(i):
+                    names.extend(
+                        j for j in indexes[n + 1:n + 2]
+                        if self.tokens[j].kind == 'name'
+                    )
+                continue
+            # let a = 1, b, c = 2;
+            expect_name = True
+            for j in indexes[n + 1:]:
+                token = self.tokens[j]
+                if token.is_punct(';') or (token.newline and
+                                           j != indexes[n + 1]):
+                    break
+                if expect_name and token.kind == 'name':
+                    nxt = self.next(j)
+                    if nxt is None or nxt.is_punct('=', ',', ';'):
+                        names.append(j)
+                expect_name = token.is_punct(',')
+        return names
+
+    def var_declarations(self, start, end, nested):
+        """Names declared with var anywhere in start..end outside nested"""
+        names = []
+        for i in range(start, end + 1):
+            if self.tokens[i].value != 'var' or any(
+                    s < i <= e for s, e in nested):
+                continue
+            j = i + 1
+            if j <= end and self.tokens[j].kind == 'name':
+                names.append(j)
+        return names
+
+    def find(self):
+        """(start, end, declaring token indexes) for each scope"""
+        tokens, scopes, bodies = self.tokens, [], set()
+        functions = []
+        for i, token in enumerate(tokens):
+            prev = self.prev(i)
+            if prev is not None and prev.is_punct('.', '?.'):
+                continue
+            if token.value == 'function' and token.kind == 'name':
+                j = i + 1
+                if j < len(tokens) and tokens[j].is_punct('*'):
+                    j += 1
+                if j < len(tokens) and tokens[j].kind == 'name':
+                    j += 1
+                if not (j < len(tokens) and tokens[j].is_punct('(')):
+                    continue
+                body = self.closing[j] + 1
+                if body < len(tokens) and tokens[body].is_punct('{'):
+                    functions.append((j, self.closing[body], j, body))
+            elif token.is_punct('=>') and prev is not None:
+                if prev.is_punct(')'):
+                    params = self.opening[i - 1]
+                elif prev.kind == 'name':
+                    params = i - 1
+                else:
+                    continue
+                end = self.arrow_end(i)
+                if end is not None:
+                    body = i + 1 if tokens[i + 1].is_punct('{') else None
+                    functions.append((params, end, params, body))
+
+        ranges = [(start, end) for start, end, _, _ in functions]
+        for start, end, params, body in functions:
+            declared = (self.params(params) if tokens[params].is_punct('(')
+                        else [params])
+            if body is not None:
+                bodies.add(body)
+                nested = [(s, e) for s, e in ranges
+                          if start < s and e <= end and (s, e) != (start,
+                                                                   end)]
+                local = (self.declarations(
+                             body + 1, self.closing[body] - 1,
+                             ('let', 'const', 'function')) +
+                         self.var_declarations(body + 1, end, nested))
+                # A body name also used in a default value would capture it
+                if tokens[params].is_punct('('):
+                    in_params = {
+                        tokens[k].value
+                        for k in range(params, self.closing[params])
+                    }
+                    local = [k for k in local
+                             if tokens[k].value not in in_params]
+                declared += local
+            scopes.append((start, end, declared))
+
+        skip = self.objects | bodies
+        for i, token in enumerate(tokens):
+            if token.is_punct('{') and i not in skip:
+                declared = self.declarations(
+                    i + 1, self.closing[i] - 1, ('let', 'const')
+                )
+                scopes.append((i, self.closing[i], declared))
+            elif (token.value in ('for', 'catch') and
+                    token.kind == 'name' and self.next(i) is not None and
+                    self.next(i).is_punct('(')):
+                open_ = i + 1
+                body = self.closing[open_] + 1
+                if not (body < len(tokens) and tokens[body].is_punct('{')):
+                    continue
+                if token.value == 'catch':
+                    declared = [k for k in (open_ + 1,)
+                                if tokens[k].kind == 'name' and
+                                tokens[k + 1].is_punct(')')]
+                else:
+                    declared = [k + 1 for k in (open_ + 1,)
+                                if tokens[k].value in ('let', 'const') and
+                                tokens[k + 1].kind == 'name']
+                scopes.append((open_, self.closing[body], declared))
+        return scopes
+
+    def arrow_end(self, arrow):
+        """The last token of an arrow function's body, if certain"""
+        tokens = self.tokens
+        if arrow + 1 >= len(tokens):
+            return None
+        if tokens[arrow + 1].is_punct('{'):
+            return self.closing[arrow + 1]
+        i, last = arrow + 1, None
+        while i < len(tokens):
+            token = tokens[i]
+            if token.closes() or token.is_punct(',', ';'):
+                break
+            if (token.newline and last is not None and
+                    ends_statement(tokens[last]) and
+                    starts_statement(token)):
+                # Automatic semicolon insertion might end it here
+                return None
+            last = self.closing[i] if token.opens() else i
+            i = last + 1
+        return last
+
+
+def mangle(tokens):
+    """Rename locally declared names in place"""
+    scopes = Scopes(tokens)
+    for start, end, declared in sorted(scopes.find(),
+                                       key=lambda s: (s[0], -s[1])):
+        if not declared:
+            continue
+        references, unsafe = {}, False
+        for i in range(start, end + 1):
+            token = tokens[i]
+            if token.kind != 'name':
+                continue
+            if token.value in UNSAFE_NAMES:
+                unsafe = True
+                break
+            kind = scopes.is_reference(i)
+            if kind:
+                references.setdefault(token.value, []).append((i, kind))
+        if unsafe:
+            continue
+
+        # Most used first, then in order of appearance
+        names = sorted(
+            {tokens[i].value for i in declared} & set(references),
+            key=lambda name: (-len(references[name]),
+                              references[name][0][0])
+        )
+        used = set(references)
+        fresh = short_names()
+        for name in names:
+            if name in KEYWORDS:
+                continue
+            new = next(fresh)
+            while new in used:
+                new = next(fresh)
+            if len(new) >= len(name):
+                continue
+            for i, kind in references.pop(name):
+                if kind == 'shorthand' and tokens[i].key is None:
+                    tokens[i].key = name
+                tokens[i].value = new
+            used.discard(name)
+            used.add(new)
+    return tokens
+
+
+def minify_js(js_content, mangle_names=False):
+    """Minify JavaScript, optionally renaming local variables"""
+    tokens = tokenize(js_content)
+    if mangle_names:
+        mangle(tokens)
+    return emit(tokens)
 
 
 def main():
     js_file = 'static/js/app.js'
     minified_file = 'static/js/app.min.js'
-    
+
     if os.path.exists(js_file):
         with open(js_file, 'r', encoding='utf-8') as f:
             original_js = f.read()
-        
-        minified_js = minify_js(original_js)
-        
+
+        minified_js = minify_js(original_js,
+                                mangle_names='--mangle' in sys.argv[1:])
+
         with open(minified_file, 'w', encoding='utf-8') as f:
             f.write(minified_js)
-        
+
         original_size = len(original_js)
         minified_size = len(minified_js)
         reduction = ((original_size - minified_size) / original_size) * 100
-        
+
         print(f"JavaScript minification complete!")
         print(f"Original size: {original_size:,} bytes")
         print(f"Minified size: {minified_size:,} bytes")
@@ -0,0 +1,8 @@
+const tagTypeMap={cooking_method:["Air Frying","Baking","Braising","Frying","Grilling","No Cook","One Pot","Poaching","Pressure Cooking","Roasting","Sautéing","Slow Cooking","Smoking","Steaming",],cuisine:["American","Brazilian","British","Caribbean","Chinese","French","German","Greek","Indian","Italian","Japanese","Korean","Mediterranean","Mexican","Middle Eastern","Moroccan","Russian","Spanish","Thai","Vietnamese","asian","asian-inspired","baking","banana","beans","beef","bread","breakfast","chicken","creamy","dessert","dinner","fish","healthy","italian","mexican","pasta","quick","salmon","stir-fry","tacos","vegetables","vegetarian",],dietary:["Dairy-Free","Diabetic-Friendly","Gluten-Free","Heart-Healthy","Keto","Low-Carb","Low-Sodium","Nut-Free","Paleo","Sugar-Free","Vegan","Vegetarian",],difficulty:["Advanced","Beginner","Easy","Expert","Intermediate","Medium",],meal_type:["Appetizer","Beverage","Breakfast","Brunch","Dessert","Dinner","Late Night","Lunch","Side Dish","Snack",],};function getTagType(a){for(const[type,tagNames]of Object.entries(tagTypeMap)){if(tagNames.includes(a)){return type;}}
+return null;}
+function applyTagColor(a,b){a.classList.remove("tag-cooking-method-js","tag-cuisine-js","tag-dietary-js","tag-difficulty-js","tag-meal-type-js");switch(b){case"cooking_method":a.classList.add("tag-cooking-method-js");break;case"cuisine":a.classList.add("tag-cuisine-js");break;case"dietary":a.classList.add("tag-dietary-js");break;case"difficulty":a.classList.add("tag-difficulty-js");break;case"meal_type":a.classList.add("tag-meal-type-js");break;}}
+function colorRecipeListTags(){const a=document.querySelectorAll(".recipe-tags .tag-small:not([title])");a.forEach((a)=>{const c=a.textContent.trim();const b=getTagType(c);if(b){applyTagColor(a,b);}});}
+function colorDropdownTags(){const a=document.querySelectorAll(".dropdown-item .tag-small:not([title])");a.forEach((a)=>{const c=a.textContent.trim();const b=getTagType(c);if(b){applyTagColor(a,b);}});}
+function initTagColoring(){colorRecipeListTags();colorDropdownTags();}
+if(document.readyState==="loading"){document.addEventListener("DOMContentLoaded",initTagColoring);}else{initTagColoring();}
+document.addEventListener("htmx:afterRequest",initTagColoring);document.addEventListener("htmx:afterSettle",initTagColoring);
\ No newline at end of file
@@ -41,6 +41,7 @@ def run_all_tests():
         ['test', 'tests.test_views', '--verbosity=2'],
         ['test', 'tests.test_forms', '--verbosity=2'],
         ['test', 'tests.test_integration', '--verbosity=2'],
+        ['test', 'tests.test_minify', '--verbosity=2'],
     ]
     
     print("🚀 Running OnlyPans Test Suite")
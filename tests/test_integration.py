@@ -199,6 +199,409 @@ class UserInteractionTest(TestCase):
         )
 
 
+class NotificationOutboxTest(TestCase):
+    """Test queued email notifications and the delivery worker"""
+
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            username='owner', email='owner@example.com', password='pass123'
+        )
+        self.reader = User.objects.create_user(
+            username='reader', email='reader@example.com',
+            password='pass123'
+        )
+        self.recipe = Recipe.objects.create(
+            title='Notified Recipe', user=self.owner, prep_time=5,
+            cook_time=5
+        )
+        self.client = Client()
+        self.client.login(username='reader', password='pass123')
+
+    def post(self, data):
+        return self.client.post(
+            reverse('recipes:recipe_detail', args=[self.recipe.slug]), data
+        )
+
+    def test_requests_only_queue_notifications(self):
+        """Commenting and rating queue emails the worker then sends"""
+        from io import StringIO
+        from django.core import mail
+        from django.core.management import call_command
+        from recipes.models import Notification
+        with self.settings(NOTIFICATION_COALESCE_WINDOW=0):
+            self.post({'content': 'Lovely!', 'comment_submit': '1'})
+            self.post({'rating': '5', 'rating_submit': '1'})
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(
+            list(Notification.objects.values_list('kind', 'status')),
+            [(Notification.COMMENT, Notification.PENDING),
+             (Notification.RATING, Notification.PENDING)]
+        )
+
+        call_command('send_notifications', '--once', stdout=StringIO())
+        self.assertEqual(
+            [message.subject for message in mail.outbox],
+            ['New comment on your recipe: Notified Recipe',
+             'New 5-star rating on your recipe: Notified Recipe']
+        )
+        self.assertEqual(mail.outbox[0].to, ['owner@example.com'])
+        self.assertIn('Lovely!', mail.outbox[0].body)
+        self.assertFalse(
+            Notification.objects.exclude(status=Notification.SENT).exists()
+        )
+
+    def test_failed_sends_back_off_then_give_up(self):
+        """Failures are retried later, with the delay doubling each time"""
+        from datetime import timedelta
+        from unittest import mock
+        from django.core import mail
+        from django.utils import timezone
+        from recipes import notifications
+        from recipes.models import Notification
+        with self.settings(NOTIFICATION_COALESCE_WINDOW=0):
+            notifications.send_new_follower_notification(self.owner,
+                                                         self.reader)
+
+        delays = []
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.'
+                        'send_messages',
+                        side_effect=OSError('connection refused')):
+            for attempt in range(notifications.MAX_ATTEMPTS):
+                before = timezone.now()
+                self.assertEqual(
+                    notifications.deliver_due_notifications(), (0, 1)
+                )
+                notification = Notification.objects.get()
+                delays.append(round(
+                    (notification.next_attempt_at - before).total_seconds()
+                ))
+                # Nothing is due again until the backoff has passed
+                self.assertEqual(
+                    notifications.deliver_due_notifications(), (0, 0)
+                )
+                Notification.objects.update(
+                    next_attempt_at=notification.next_attempt_at -
+                    timedelta(seconds=delays[-1])
+                )
+        self.assertEqual(delays[:-1], [60, 120, 240, 480, 960])
+        self.assertEqual(notification.status, Notification.FAILED)
+        self.assertEqual(notification.last_error, 'connection refused')
+        self.assertEqual(notifications.deliver_due_notifications(), (0, 0))
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_burst_is_coalesced_and_sent_over_one_connection(self):
+        """Events within the window become one message per recipient"""
+        from datetime import timedelta
+        from unittest import mock
+        from django.core import mail
+        from django.utils import timezone
+        from recipes import notifications
+        from recipes.models import Notification
+        raters = [User.objects.create_user(f'rater{i}') for i in range(3)]
+        for i, rater in enumerate(raters):
+            notifications.send_rating_notification(
+                Rating.objects.create(recipe=self.recipe, user=rater,
+                                      rating=3 + i),
+                self.owner
+            )
+        notifications.send_new_follower_notification(self.reader,
+                                                     self.owner)
+        # Nothing is sent until the window has passed
+        self.assertEqual(notifications.deliver_due_notifications(), (0, 0))
+
+        Notification.objects.update(next_attempt_at=timezone.now() -
+                                    timedelta(seconds=1))
+        with mock.patch('recipes.notifications.get_connection',
+                        wraps=notifications.get_connection) as connections:
+            self.assertEqual(notifications.deliver_due_notifications(),
+                             (2, 0))
+        self.assertEqual(connections.call_count, 1)
+        self.assertEqual(
+            sorted(message.subject for message in mail.outbox),
+            ['You got 3 new ratings on your recipe: Notified Recipe',
+             'owner started following you on OnlyPans!']
+        )
+        summary = next(message for message in mail.outbox
+                       if message.to == ['owner@example.com'])
+        self.assertIn('rater2 gave it 5 stars', summary.body)
+
+
+    def test_claimed_rows_are_not_coalesced_again(self):
+        """A later claim leaves rows another worker holds alone"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from recipes import notifications
+        from recipes.models import Notification
+        raters = [User.objects.create_user(f'rater{i}') for i in range(3)]
+
+        def rate(rater):
+            notifications.send_rating_notification(
+                Rating.objects.create(recipe=self.recipe, user=rater,
+                                      rating=4),
+                self.owner
+            )
+            return Notification.objects.latest('pk')
+
+        first, second = rate(raters[0]), rate(raters[1])
+        Notification.objects.filter(pk=first.pk).update(
+            next_attempt_at=timezone.now() - timedelta(seconds=1)
+        )
+        claimed = notifications.claim_due_notifications()
+        self.assertEqual([[n.pk for n in group] for group in claimed],
+                         [[first.pk, second.pk]])
+
+        # A new rating falls due while the first worker is still sending
+        third = rate(raters[2])
+        Notification.objects.filter(pk=third.pk).update(
+            next_attempt_at=timezone.now() - timedelta(seconds=1)
+        )
+        claimed = notifications.claim_due_notifications()
+        self.assertEqual([[n.pk for n in group] for group in claimed],
+                         [[third.pk]])
+        self.assertEqual(notifications.claim_due_notifications(), [])
+
+
+class WeeklyDigestTest(TestCase):
+    """Test the weekly digest pipeline"""
+
+    def setUp(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from recipes.digest import week_start
+        from recipes.models import Follow
+        self.week = week_start()
+        self.chef = User.objects.create_user('chef')
+        self.star = User.objects.create_user('star')
+        last_week = timezone.now() - timedelta(
+            days=timezone.localdate().weekday() + 4
+        )
+        for author, title, rating in [(self.star, 'Popular 1', 5.0),
+                                      (self.star, 'Popular 2', 4.5),
+                                      (self.chef, 'Chef Special', 2.0)]:
+            recipe = Recipe.objects.create(title=title, user=author,
+                                           prep_time=5, cook_time=5)
+            Recipe.objects.filter(pk=recipe.pk).update(
+                created_at=last_week, rating_avg=rating
+            )
+        self.readers = [
+            User.objects.create_user(f'reader{i}', f'reader{i}@example.com')
+            for i in range(5)
+        ]
+        User.objects.create_user('no-email')
+        Follow.objects.create(follower=self.readers[0], followed=self.chef)
+
+    def titles(self, message):
+        return [line[2:].split(' by ')[0]
+                for line in message.body.splitlines() if line.startswith('- ')]
+
+    def test_personalised_digest_for_every_user(self):
+        """Followed authors come first; users without email are skipped"""
+        from io import StringIO
+        from django.core import mail
+        from django.core.management import call_command
+        call_command('send_weekly_digests', '--chunk-size', '2',
+                     stdout=StringIO())
+        self.assertEqual(
+            [message.to[0] for message in mail.outbox],
+            [user.email for user in self.readers]
+        )
+        self.assertEqual(self.titles(mail.outbox[0]),
+                         ['Chef Special', 'Popular 1', 'Popular 2'])
+        self.assertEqual(self.titles(mail.outbox[1]),
+                         ['Popular 1', 'Popular 2', 'Chef Special'])
+
+    def test_interrupted_run_resumes_after_last_chunk(self):
+        """A rerun only mails users after the last completed chunk"""
+        from unittest import mock
+        from django.core import mail
+        from django.core.mail.backends.locmem import EmailBackend
+        from recipes.digest import send_weekly_digests
+        from recipes.models import DigestRun
+        send_messages = EmailBackend.send_messages
+        calls = []
+
+        def fail_second_chunk(backend, messages):
+            calls.append(len(messages))
+            if len(calls) == 2:
+                raise OSError('connection lost')
+            return send_messages(backend, messages)
+
+        with mock.patch.object(EmailBackend, 'send_messages',
+                               fail_second_chunk):
+            with self.assertRaises(OSError):
+                send_weekly_digests(self.week, chunk_size=2)
+        run = DigestRun.objects.get(week_start=self.week)
+        self.assertEqual(run.last_user_id, self.readers[1].pk)
+        self.assertIsNone(run.finished_at)
+
+        self.assertEqual(send_weekly_digests(self.week, chunk_size=2), 3)
+        self.assertEqual(
+            [message.to[0] for message in mail.outbox],
+            [user.email for user in self.readers]
+        )
+        # Finished runs aren't sent again unless restarted
+        self.assertEqual(send_weekly_digests(self.week), 0)
+        self.assertEqual(send_weekly_digests(self.week, restart=True), 5)
+
+
+class BulkImportTest(TestCase):
+    """Test streaming and bulk loads with load_recipes"""
+
+    def setUp(self):
+        Recipe.objects.create(title='Pancakes', prep_time=5, cook_time=5,
+                              user=User.objects.create_user('cook'))
+        Tag.objects.create(name='French', tag_type='cuisine')
+        self.records = [
+            {
+                'title': 'Pancakes',
+                'prep_time': 10,
+                'cook_time': 20,
+                'ingredients': [
+                    {'name': 'Flour', 'quantity': 200, 'unit': 'grams'},
+                    {'name': 'Egg', 'quantity': 2},
+                ],
+                'instructions': ['Mix', 'Fry'],
+                'tags': ['French'],
+                'difficulty': 'easy',
+            },
+            {
+                'title': 'Pancakes',
+                'ingredients': [{'name': 'Flour', 'unit': 'grams'}],
+                'instructions': ['Mix'],
+                'tags': ['French', 'Breakfast'],
+            },
+        ]
+
+    def load(self, *args, ndjson=False):
+        import json
+        import tempfile
+        from io import StringIO
+        from django.core.management import call_command
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as f:
+            if ndjson:
+                f.writelines(json.dumps(record) + '\n'
+                             for record in self.records)
+            else:
+                json.dump(self.records, f, indent=2)
+            f.flush()
+            out = StringIO()
+            call_command('load_recipes', f.name, *args, stdout=out)
+        return out.getvalue()
+
+    def test_bulk_import_matches_row_by_row_import(self):
+        """Lookups are shared, slugs unique and derived data refreshed"""
+        from recipes.models import Ingredient, Unit
+        from recipes.search import search_recipes
+        output = self.load('--bulk', '--batch-size', '1')
+        self.assertIn('Successfully loaded 2 recipes', output)
+        self.assertIn('rows/s', output)
+
+        first, second = Recipe.objects.filter(
+            user__username='admin').order_by('pk')
+        self.assertEqual((first.slug, second.slug),
+                         ('pancakes-1', 'pancakes-2'))
+        self.assertEqual(first.total_time, 30)
+        self.assertEqual(
+            [(ri.ingredient.name, ri.unit.name, ri.quantity, ri.order)
+             for ri in first.ingredients.order_by('order')],
+            [('Flour', 'grams', 200, 1), ('Egg', 'pieces', 2, 2)]
+        )
+        self.assertEqual(
+            list(second.steps.values_list('instruction', flat=True)),
+            ['Mix']
+        )
+        self.assertEqual(sorted(first.tags.values_list('name', flat=True)),
+                         ['Easy', 'French'])
+        self.assertEqual(Tag.objects.get(name='Easy').tag_type, 'difficulty')
+        self.assertEqual(Tag.objects.filter(name='French').count(), 1)
+        self.assertEqual(Ingredient.objects.filter(name='Flour').count(), 1)
+        self.assertEqual(Unit.objects.filter(name='grams').count(), 1)
+        self.assertEqual(
+            search_recipes(Recipe.objects.all(), 'pancakes').count(), 3
+        )
+
+    def test_stream_resumes_from_reported_offset(self):
+        """A failed load reports an offset that picks up where it stopped"""
+        import re
+        self.records[1]['difficulty'] = 3
+        self.records.append({'title': 'Crêpes', 'tags': ['French']})
+        for args, ndjson in [(['--bulk'], False), ([], True)]:
+            Recipe.objects.filter(user__username='admin').delete()
+            output = self.load('--batch-size', '1', *args, ndjson=ndjson)
+            self.assertIn('Error loading recipes', output)
+            offset = re.search(r'--offset (\d+)', output).group(1)
+            self.assertEqual(
+                list(Recipe.objects.filter(user__username='admin')
+                     .values_list('title', flat=True)),
+                ['Pancakes']
+            )
+
+            # Skip the bad record and load the rest
+            output = self.load('--offset', offset, '--skip', '1', *args,
+                               ndjson=ndjson)
+            self.assertIn('Successfully loaded 1 recipes', output)
+            self.assertEqual(
+                list(Recipe.objects.filter(user__username='admin')
+                     .order_by('pk').values_list('title', flat=True)),
+                ['Pancakes', 'Crêpes']
+            )
+
+
+class PrecompressedStaticFilesTest(TestCase):
+    """Test collectstatic reusing the build's compressed variants"""
+
+    def test_collectstatic_reuses_matching_variants(self):
+        import gzip
+        import tempfile
+        from io import StringIO
+        from pathlib import Path
+        from django.core.management import call_command
+        from django.test import override_settings
+
+        css = b'body { color: red; }\n' * 50
+        with tempfile.TemporaryDirectory() as tmp:
+            source, root = Path(tmp) / 'static', Path(tmp) / 'root'
+            (source / 'css').mkdir(parents=True)
+            (source / 'css' / 'app.css').write_bytes(css)
+            # A variant the storage would never write itself, and a stale one
+            reused = gzip.compress(css, compresslevel=1)
+            (source / 'css' / 'app.css.gz').write_bytes(reused)
+            (source / 'css' / 'old.css').write_bytes(css + css)
+            (source / 'css' / 'old.css.gz').write_bytes(reused)
+
+            storage = ('onlypans.storage.'
+                       'PrecompressedManifestStaticFilesStorage')
+            with override_settings(
+                STATICFILES_DIRS=[source], STATIC_ROOT=root,
+                STATICFILES_FINDERS=[
+                    'django.contrib.staticfiles.finders.FileSystemFinder'
+                ],
+                STORAGES={
+                    'default': {'BACKEND':
+                                'django.core.files.storage.FileSystemStorage'},
+                    'staticfiles': {'BACKEND': storage},
+                },
+            ):
+                call_command('collectstatic', '--noinput', stdout=StringIO())
+
+            collected = sorted(path.name for path in (root / 'css').iterdir())
+            hashed = next(name for name in collected
+                          if name.startswith('app.') and
+                          name.endswith('.css'))
+            # Variants sit next to collected files instead of being hashed
+            self.assertTrue(all(name[:-3] in collected
+                                for name in collected
+                                if name.endswith(('.gz', '.br'))))
+            self.assertEqual((root / 'css' / (hashed + '.gz')).read_bytes(),
+                             reused)
+            self.assertEqual((root / 'css' / 'app.css.gz').read_bytes(),
+                             reused)
+
+            # The stale variant is replaced by a freshly compressed one
+            old = root / 'css' / 'old.css.gz'
+            self.assertEqual(gzip.decompress(old.read_bytes()), css + css)
+
+
 class SearchIntegrationTest(TestCase):
     """Test search functionality across the application"""
 
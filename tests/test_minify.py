@@ -0,0 +1,206 @@
+"""
+Minifier Tests for OnlyPans Static Assets
+Tests for the tokenizing CSS and JavaScript minifiers in scripts/
+"""
+
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from unittest import skipUnless
+
+from django.test import SimpleTestCase
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'scripts'))
+
+from minify_css import minify_css  # noqa: E402
+from minify_js import minify_js  # noqa: E402
+
+NODE = shutil.which('node')
+
+# Exercises the cases the minifier has to get right; each line's output
+# must be the same before and after minifying
+PROGRAM = r'''
+var a = 10, b = 2, g = 5;
+console.log(a / b / g, "x/y".split(/\//), /[/]/.test("/"), a /b/ g);
+console.log(`t${a + `in${b}ner`}x${ {k: 1}.k }` + '//no' + "/* no */");
+console.log(a + +b, a - -b, a++ + +b, a-- - -b, 1 .toString(), .5);
+function outer(value, list) {
+    const total = value + 1;
+    let items = list.map(item => item * total);
+    const obj = { total, items, value: value, nested: { total } };
+    const { total: t2, items: [first] } = obj;
+    function inner(total) { return total * 2; }
+    const fns = [];
+    for (let i = 0; i < 3; i++) { fns.push(() => i); }
+    try { throw new Error("boom"); } catch (err) { items.push(err.message); }
+    switch (value) {
+        case 1: { const total = 99; items.push(total); break; }
+        default: items.push(value > 1 ? { total } : { t: total });
+    }
+    return [obj, t2, first, inner(total), fns.map(f => f()), items];
+}
+console.log(JSON.stringify(outer(1, [1, 2])), JSON.stringify(outer(2, [3])));
+function hoisted() {
+    var before = later(3);
+    var later2 = 1;
+    function later(n) { return n + later2; }
+    return before;
+}
+console.log(hoisted())
+var x = 1
+var y = x
++ 1
+console.log(y)
+function ret() {
+    return
+    1
+}
+console.log(ret())
+if (a) { x = 3 }
+(function () { console.log('after if', x) })()
+var re = a ? /x/g : /y/; console.log(re.source)
+console.log(`multi
+line ${`nested ${a}`}`)
+function elses(flag) {
+    let count = 0;
+    function bump() { count++; }
+    if (flag) { bump(); } else { bump(); bump(); count = count * 10; }
+    do { bump(); } while (count < 3)
+    return count;
+}
+console.log(elses(true), elses(false))
+'''
+
+
+class MinifyJSTest(SimpleTestCase):
+    """Test the JavaScript minifier's output"""
+
+    def assertMinifies(self, source, expected, mangle_names=False):
+        self.assertEqual(minify_js(source, mangle_names), expected)
+
+    def test_newlines_kept_where_asi_needs_them(self):
+        """Line breaks that end a statement survive"""
+        self.assertMinifies('var x = 1\nvar y = x\n+ 1\n',
+                            'var x=1\nvar y=x\n+1')
+        self.assertMinifies('function f() {\n    return\n    1\n}\n',
+                            'function f(){return\n1}')
+        self.assertMinifies('a++\nb\n', 'a++\nb')
+        self.assertMinifies('if (a) { x = 3 }\n(function () { h() })()\n',
+                            'if(a){x=3}\n(function(){h()})()')
+        self.assertMinifies('if (a) { b() }\n[1, 2].forEach(n => c(n))\n',
+                            'if(a){b()}\n[1,2].forEach(n=>c(n))')
+
+    def test_regex_and_division(self):
+        """A / is read as a regex or division from what precedes it"""
+        self.assertMinifies('var q = a / b / g, r = a /b/ g;\n',
+                            'var q=a/b/g,r=a/b/g;')
+        self.assertMinifies(
+            "var s = 'x/y'.split(/\\//), t = /[/]/.test('/'), "
+            "u = a ? /x/g : /y/;\n",
+            "var s='x/y'.split(/\\//),t=/[/]/.test('/'),u=a?/x/g:/y/;"
+        )
+        self.assertMinifies('if (x) /re/.test(y)\nreturn /a/\n',
+                            'if(x)/re/.test(y)\nreturn/a/')
+
+    def test_strings_templates_and_comments(self):
+        """Quoted text is copied through, comments are dropped"""
+        self.assertMinifies(
+            "var t = `t${a + `in${b}ner`}x${ {k: 1}.k }` + '//no' + "
+            "\"/* no */\";\n",
+            "var t=`t${a+`in${b}ner`}x${{k:1}.k}`+'//no'+\"/* no */\";"
+        )
+        self.assertMinifies("var m = `multi\nline ${`nested ${a}`}`;\n",
+                            "var m=`multi\nline ${`nested ${a}`}`;")
+        self.assertMinifies('/* c */ var a = 1; // trailing\n'
+                            '/* keep\n lines */ var b = 2;\n',
+                            'var a=1;var b=2;')
+
+    def test_spaces_kept_between_operators_that_would_merge(self):
+        """a + +b must not become a++b"""
+        self.assertMinifies('f(a + +b, a - -b, a++ + +b, a-- - -b);\n',
+                            'f(a+ +b,a- -b,a++ + +b,a-- - -b);')
+        self.assertMinifies('f(1 .toString(), 1.5.toFixed(1), .5);\n',
+                            'f(1 .toString(),1.5.toFixed(1),.5);')
+
+    def test_mangling_keeps_property_names(self):
+        """Shorthand properties are expanded before their value is renamed"""
+        self.assertMinifies(
+            'function outer(total, items) {\n'
+            '    const obj = { total, items, value: total };\n'
+            '    return obj;\n'
+            '}\n',
+            'function outer(a,b){const c={total:a,items:b,value:a};'
+            'return c;}',
+            mangle_names=True,
+        )
+
+    def test_mangling_hoisted_and_shadowing_names(self):
+        """Hoisted functions and vars are renamed before their use"""
+        self.assertMinifies(
+            'function g() {\n'
+            '    inner(total);\n'
+            '    var total = 1;\n'
+            '    function inner(value) { return value * 2; }\n'
+            '}\n',
+            'function g(){a(b);var b=1;function a(a){return a*2;}}',
+            mangle_names=True,
+        )
+        self.assertMinifies('const shadow = (document) => document + 1;\n',
+                            'const shadow=(a)=>a+1;', mangle_names=True)
+
+    @skipUnless(NODE, 'node is not installed')
+    def test_minified_program_behaves_the_same(self):
+        """Node prints the same output for the source and minified code"""
+        outputs = []
+        with tempfile.TemporaryDirectory() as directory:
+            for name, code in [
+                ('source.js', PROGRAM),
+                ('minified.js', minify_js(PROGRAM)),
+                ('mangled.js', minify_js(PROGRAM, mangle_names=True)),
+            ]:
+                path = Path(directory) / name
+                path.write_text(code, encoding='utf-8')
+                outputs.append(subprocess.run(
+                    [NODE, str(path)], capture_output=True, text=True,
+                    check=True, timeout=30,
+                ).stdout)
+        self.assertIn('after if 3', outputs[0])
+        self.assertEqual(outputs[1], outputs[0])
+        self.assertEqual(outputs[2], outputs[0])
+
+
+class MinifyCSSTest(SimpleTestCase):
+    """Test the CSS minifier's output"""
+
+    def test_declarations(self):
+        """Whitespace goes around punctuation but stays inside calc()"""
+        self.assertEqual(minify_css('a { width: calc(100% - 2 * 10px); }\n'),
+                         'a{width:calc(100% - 2 * 10px)}')
+        self.assertEqual(
+            minify_css('a { color: red ! important; /* c */ '
+                       'margin: 0 auto; }'),
+            'a{color:red!important;margin:0 auto}'
+        )
+
+    def test_selectors_and_at_rules(self):
+        """Descendant spaces and media query spaces are kept"""
+        self.assertEqual(
+            minify_css('a :hover , b > c + d ~ e { color : red ; }\n'),
+            'a :hover,b>c+d~e{color:red}'
+        )
+        self.assertEqual(
+            minify_css('@media screen and (max-width: 600px) '
+                       '{ a { color: red; } }\n'),
+            '@media screen and (max-width:600px){a{color:red}}'
+        )
+
+    def test_strings_and_urls(self):
+        """Quoted text is copied through and url()s are trimmed"""
+        self.assertEqual(
+            minify_css('a::after { content: "a  ;  b"; '
+                       "background: url( 'x y.png' ) , url( img.png ); }"),
+            'a::after{content:"a  ;  b";'
+            "background:url('x y.png'),url(img.png)}"
+        )
@@ -3,16 +3,23 @@ Model Tests for OnlyPans Recipe App
 Tests for Recipe, UserProfile, Ingredient, Tag models
 """
 
+from io import StringIO
+
+from django.core.management import call_command
 from django.test import TestCase
 from django.contrib.auth.models import User
 from django.db import IntegrityError
 from recipes.models import (
     Recipe,
+    RecipeIngredient,
     Ingredient,
     Tag,
     Rating,
     Comment,
+    Follow,
+    Unit,
 )
+from recipes.nutrition import calculate_nutrition, nutrition_for_recipes
 from accounts.models import UserProfile
 
 
@@ -66,6 +73,43 @@ class RecipeModelTest(TestCase):
         )
         self.assertEqual(recipe.slug, 'my-amazing-recipe')
 
+    def test_slug_allocation_takes_one_query(self):
+        """Copies of a title get the first free suffix from one lookup"""
+        Recipe.objects.bulk_create(
+            [Recipe(title='Cookies', slug='cookies', user=self.user,
+                    prep_time=1, cook_time=1)] +
+            [Recipe(title='Cookies', slug=f'cookies-{n}', user=self.user,
+                    prep_time=1, cook_time=1)
+             for n in range(1, 200) if n != 7] +
+            [Recipe(title='Cookies Recipe', slug='cookies-recipe',
+                    user=self.user, prep_time=1, cook_time=1)]
+        )
+        with self.assertNumQueries(1):
+            slugs = Recipe.objects.allocate_slugs(
+                ['Cookies', 'Cookies', 'Cake', 'Cookies Recipe', 'Cake']
+            )
+        self.assertEqual(slugs, ['cookies-7', 'cookies-200', 'cake',
+                                 'cookies-recipe-1', 'cake-1'])
+
+        recipe = Recipe.objects.create(title='Cookies', user=self.user,
+                                       prep_time=1, cook_time=1)
+        self.assertEqual(recipe.slug, 'cookies-7')
+
+    def test_slug_taken_concurrently_is_retried(self):
+        """A save that loses a slug race picks the next free slug"""
+        from unittest import mock
+        from recipes.models import RecipeQuerySet
+        Recipe.objects.create(title='Stew', user=self.user, prep_time=1,
+                              cook_time=1)
+        # The first allocation misses the recipe created above
+        with mock.patch.object(RecipeQuerySet, 'allocate_slugs',
+                               side_effect=[['stew'], ['stew-1']]) as allocate:
+            recipe = Recipe.objects.create(title='Stew', user=self.user,
+                                           prep_time=1, cook_time=1)
+        self.assertEqual(allocate.call_count, 2)
+        self.assertEqual(recipe.slug, 'stew-1')
+        self.assertEqual(Recipe.objects.filter(title='Stew').count(), 2)
+
     def test_recipe_total_time_calculation(self):
         """Test total_time property"""
         recipe = Recipe.objects.create(
@@ -77,6 +121,29 @@ class RecipeModelTest(TestCase):
         )
         self.assertEqual(recipe.total_time, 60)
 
+    def test_recipe_total_time_kept_in_sync(self):
+        """Stored total_time follows saves, updates and bulk inserts"""
+        recipe = Recipe.objects.create(
+            title='Test Recipe',
+            user=self.user,
+            prep_time=15,
+            cook_time=45,
+        )
+        recipe.cook_time = 5
+        recipe.save(update_fields=['cook_time'])
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.total_time, 20)
+
+        Recipe.objects.filter(pk=recipe.pk).update(prep_time=30)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.total_time, 35)
+
+        Recipe.objects.bulk_create([
+            Recipe(title='Bulk', slug='bulk', user=self.user,
+                   prep_time=2, cook_time=3)
+        ])
+        self.assertEqual(Recipe.objects.get(slug='bulk').total_time, 5)
+
     def test_recipe_average_rating(self):
         """Test average rating calculation"""
         recipe = Recipe.objects.create(
@@ -99,6 +166,312 @@ class RecipeModelTest(TestCase):
         self.assertEqual(recipe.average_rating, 4.0)
 
 
+class RecipeQuerySetTest(TestCase):
+    """Test Recipe queryset helpers"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('testuser', 'test@example.com',
+                                             'pass123')
+        self.vegan = Tag.objects.create(name='Vegan', tag_type='dietary')
+        self.gluten_free = Tag.objects.create(name='Gluten-Free',
+                                              tag_type='dietary')
+        self.both = Recipe.objects.create(
+            title='Both', user=self.user, prep_time=1, cook_time=1
+        )
+        self.both.tags.set([self.vegan, self.gluten_free])
+        self.vegan_only = Recipe.objects.create(
+            title='Vegan Only', user=self.user, prep_time=1, cook_time=1
+        )
+        self.vegan_only.tags.set([self.vegan])
+
+    def test_with_all_tags_requires_every_tag(self):
+        """Only recipes carrying all requested tags are returned"""
+        recipes = Recipe.objects.with_all_tags([self.vegan, self.gluten_free])
+        self.assertEqual(list(recipes), [self.both])
+
+    def test_with_all_tags_accepts_ids(self):
+        """Tag ids work as well as Tag instances"""
+        recipes = Recipe.objects.with_all_tags([self.vegan.id])
+        self.assertEqual(set(recipes), {self.both, self.vegan_only})
+
+    def test_with_all_tags_empty(self):
+        """No tags means no filtering"""
+        self.assertEqual(Recipe.objects.with_all_tags([]).count(), 2)
+
+    def test_matches_dietary_restrictions(self):
+        """Profile dietary check uses the same tag matching"""
+        profile = self.user.profile
+        self.assertTrue(profile.matches_dietary_restrictions(self.vegan_only))
+        profile.dietary_tags.set([self.vegan, self.gluten_free])
+        self.assertTrue(profile.matches_dietary_restrictions(self.both))
+        self.assertFalse(profile.matches_dietary_restrictions(self.vegan_only))
+
+
+class RecipeNutritionTest(TestCase):
+    """Test stored per-serving nutrition"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('testuser', 'test@example.com',
+                                             'pass123')
+        self.cup = Unit.objects.create(name='Cup', abbreviation='cup',
+                                       unit_type='volume',
+                                       grams_per_unit=240)
+        self.gram = Unit.objects.create(name='Gram', abbreviation='g',
+                                        unit_type='weight')
+        self.rice = Ingredient.objects.create(
+            name='Rice', calories_per_100g=130, protein_per_100g=2.7,
+            carbs_per_100g=28.2, fat_per_100g=0.3, fibre_per_100g=0.4,
+            sodium_mg_per_100g=1,
+        )
+        self.butter = Ingredient.objects.create(
+            name='Butter', calories_per_100g=717, fat_per_100g=81.1,
+            saturated_fat_per_100g=51.4,
+        )
+        self.recipe = Recipe.objects.create(
+            title='Buttered Rice', user=self.user, prep_time=5,
+            cook_time=20, servings=3,
+        )
+        RecipeIngredient.objects.create(recipe=self.recipe,
+                                        ingredient=self.rice, unit=self.cup,
+                                        quantity=1.5, order=1)
+        RecipeIngredient.objects.create(recipe=self.recipe,
+                                        ingredient=self.butter,
+                                        unit=self.gram, quantity=25, order=2)
+
+    def test_stored_nutrition_matches_calculation(self):
+        """Stored values equal the per-recipe reference calculation"""
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        with self.assertNumQueries(0):
+            nutrition = recipe.nutrition_per_serving
+        self.assertEqual(nutrition, calculate_nutrition(recipe))
+        self.assertEqual(nutrition['calories'], 215.8)
+        self.assertEqual(nutrition['saturated_fat'], 4.3)
+
+    def test_nutrition_refreshes_on_source_changes(self):
+        """Servings, ingredient and unit changes update stored values"""
+        self.recipe.servings = 6
+        self.recipe.save()
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.nutrition_per_serving['calories'], 107.9)
+
+        self.cup.grams_per_unit = 200
+        self.cup.save()
+        self.butter.calories_per_100g = 700
+        self.butter.save()
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.nutrition_per_serving,
+                         calculate_nutrition(self.recipe))
+        self.assertEqual(self.recipe.nutrition_per_serving['calories'], 94.2)
+
+    def test_nutrition_not_refreshed_for_other_edits(self):
+        """Renaming an ingredient or unit leaves stored values alone"""
+        from unittest import mock
+        from recipes.models import RecipeQuerySet
+        butter = Ingredient.objects.get(pk=self.butter.pk)
+        cup = Unit.objects.get(pk=self.cup.pk)
+        with mock.patch.object(RecipeQuerySet,
+                               'refresh_nutrition') as refresh:
+            butter.name = 'Salted Butter'
+            butter.calories_per_100g = 717  # same value, differently typed
+            butter.save()
+            cup.name = 'US Cup'
+            cup.save()
+            self.assertFalse(refresh.called)
+
+            butter.fat_per_100g = 80
+            butter.save()
+            cup.grams_per_unit = 236
+            cup.save()
+            self.assertEqual(refresh.call_count, 2)
+
+    def test_batch_nutrition_matches_calculation(self):
+        """The vectorised batch engine agrees exactly with the reference"""
+        empty = Recipe.objects.create(title='Nothing Yet', user=self.user,
+                                      prep_time=1, cook_time=1, servings=0)
+        halved = Recipe.objects.create(title='Rice Bowl', user=self.user,
+                                       prep_time=1, cook_time=1, servings=2)
+        RecipeIngredient.objects.create(recipe=halved, ingredient=self.rice,
+                                        unit=self.gram, quantity=333,
+                                        order=1)
+        RecipeIngredient.objects.create(recipe=halved,
+                                        ingredient=self.butter,
+                                        unit=self.cup, quantity=0.1, order=2)
+
+        with self.assertNumQueries(1):
+            batch = nutrition_for_recipes(Recipe.objects.all())
+        self.assertEqual(set(batch), {self.recipe.pk, empty.pk, halved.pk})
+        for recipe in Recipe.objects.all():
+            self.assertEqual(batch[recipe.pk], calculate_nutrition(recipe))
+        self.assertEqual(batch[empty.pk]['calories'], 0)
+
+    def test_recompute_nutrition_command(self):
+        """The bulk command fills in recipes missing stored values"""
+        Recipe.objects.update(calories_per_serving=None)
+        call_command('recompute_nutrition', '--missing-only', stdout=StringIO())
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.nutrition_per_serving,
+                         calculate_nutrition(self.recipe))
+
+
+    def test_migration_backfill_matches_calculation(self):
+        """Migration 0017's own copy of the calculation agrees"""
+        from importlib import import_module
+        from django.apps import apps
+        migration = import_module(
+            'recipes.migrations.0017_recipe_nutrition_per_serving'
+        )
+        Recipe.objects.update(calories_per_serving=None)
+        migration.backfill_nutrition(apps, None)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.nutrition_per_serving,
+                         calculate_nutrition(self.recipe))
+        self.assertEqual(self.recipe.nutrition_per_serving['calories'], 215.8)
+
+
+class RelatedRecipesTest(TestCase):
+    """Test the precomputed related recipes"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('testuser', 'test@example.com',
+                                             'pass123')
+        self.fans = [User.objects.create_user(f'fan{i}') for i in range(2)]
+        self.thai, self.vegan, self.quick = [
+            Tag.objects.create(name=name, tag_type='cuisine')
+            for name in ('Thai', 'Vegan', 'Quick')
+        ]
+        self.gram = Unit.objects.create(name='Gram', abbreviation='g',
+                                        unit_type='weight')
+        self.tofu = Ingredient.objects.create(name='Tofu')
+        self.recipes = {}
+        for title, tags in [('Green Curry', [self.thai, self.vegan]),
+                            ('Red Curry', [self.thai, self.vegan]),
+                            ('Pad Thai', [self.thai]),
+                            ('Vegan Chilli', [self.vegan, self.quick]),
+                            ('Toast', [])]:
+            recipe = Recipe.objects.create(title=title, user=self.user,
+                                           prep_time=5, cook_time=5)
+            recipe.tags.set(tags)
+            self.recipes[title] = recipe
+
+    def related_titles(self, title):
+        return [entry.related.title for entry in
+                self.recipes[title].related_entries.select_related('related')]
+
+    def test_ranked_by_tags_ingredients_and_likes(self):
+        """Scores combine tag Jaccard, shared ingredients and co-likes"""
+        from recipes.related import build_related_recipes
+        self.assertEqual(build_related_recipes(), 5)
+        self.assertEqual(self.related_titles('Green Curry'),
+                         ['Red Curry', 'Pad Thai', 'Vegan Chilli'])
+        self.assertEqual(self.related_titles('Toast'), [])
+
+        # Shared ingredients and likes lift Pad Thai above Red Curry
+        for title in ('Green Curry', 'Pad Thai'):
+            RecipeIngredient.objects.create(recipe=self.recipes[title],
+                                            ingredient=self.tofu,
+                                            unit=self.gram, quantity=100,
+                                            order=1)
+            for fan in self.fans:
+                self.recipes[title].likes.create(user=fan)
+        build_related_recipes()
+        self.assertEqual(self.related_titles('Green Curry'),
+                         ['Pad Thai', 'Red Curry', 'Vegan Chilli'])
+
+    def test_incremental_build_matches_full_build(self):
+        """Only changed recipes and lists they affect are rescored"""
+        from recipes.models import RelatedRecipe
+        from recipes.related import build_related_recipes
+        build_related_recipes()
+        self.assertFalse(Recipe.objects.filter(related_stale=True).exists())
+
+        self.recipes['Toast'].tags.add(self.quick)
+        self.assertEqual(
+            list(Recipe.objects.filter(related_stale=True)
+                 .values_list('title', flat=True)),
+            ['Toast']
+        )
+        # Vegan Chilli's list gains Toast, so it is rebuilt as well
+        self.assertEqual(build_related_recipes(), 2)
+        incremental = list(RelatedRecipe.objects.values_list(
+            'recipe_id', 'related_id', 'rank'))
+        build_related_recipes(full=True)
+        self.assertEqual(
+            incremental,
+            list(RelatedRecipe.objects.values_list('recipe_id', 'related_id',
+                                                   'rank'))
+        )
+
+    def test_detail_page_reads_stored_list(self):
+        """recipe_detail shows the stored list in rank order"""
+        from django.urls import reverse
+        call_command('build_related_recipes', stdout=StringIO())
+        response = self.client.get(
+            reverse('recipes:recipe_detail',
+                    args=[self.recipes['Green Curry'].slug])
+        )
+        self.assertEqual(
+            [recipe.title for recipe in response.context['related_recipes']],
+            ['Red Curry', 'Pad Thai', 'Vegan Chilli']
+        )
+
+
+class RecommendationsTest(TestCase):
+    """Test the precomputed "For You" recommendations"""
+
+    def setUp(self):
+        from django.utils import timezone
+        self.user = User.objects.create_user('reader',
+                                             last_login=timezone.now())
+        self.chef = User.objects.create_user('chef')
+        self.other = User.objects.create_user('other')
+        self.vegan = Tag.objects.create(name='Vegan', tag_type='dietary')
+        self.thai = Tag.objects.create(name='Thai', tag_type='cuisine')
+        self.recipes = {}
+        for title, author, tags, views in [
+                ('Green Curry', self.other, [self.vegan, self.thai], 0),
+                ('Tofu Bowl', self.chef, [self.vegan], 0),
+                ('Salad', self.other, [self.vegan], 50),
+                ('Steak', self.other, [], 500),
+                ('My Soup', self.user, [self.vegan], 0)]:
+            recipe = Recipe.objects.create(title=title, user=author,
+                                           prep_time=5, cook_time=5,
+                                           view_count=views)
+            recipe.tags.set(tags)
+            self.recipes[title] = recipe
+        profile = self.user.profile
+        profile.dietary_tags.add(self.vegan)
+        profile.favorite_cuisines.add(self.thai)
+        Follow.objects.create(follower=self.user, followed=self.chef)
+
+    def recommended_titles(self):
+        return [recipe.title for recipe in
+                self.user.profile.get_recommended_recipes()]
+
+    def test_ranked_by_preferences(self):
+        """Cuisine beats followed authors, which beat popularity"""
+        from recipes.recommendations import build_recommendations
+        self.assertEqual(build_recommendations(), 1)
+        # Steak breaks the dietary tags and My Soup is the user's own
+        self.assertEqual(self.recommended_titles(),
+                         ['Green Curry', 'Tofu Bowl', 'Salad'])
+
+    def test_served_list_is_refiltered(self):
+        """Recipes liked since the build or now off-diet are dropped"""
+        call_command('build_recommendations', stdout=StringIO())
+        self.recipes['Green Curry'].likes.create(user=self.user)
+        self.recipes['Tofu Bowl'].tags.remove(self.vegan)
+        with self.assertNumQueries(2):
+            self.assertEqual(self.recommended_titles(), ['Salad'])
+
+    def test_live_fallback_without_stored_ranking(self):
+        """Users without a ranking (or with new cuisines) get live results"""
+        call_command('build_recommendations', stdout=StringIO())
+        self.user.profile.favorite_cuisines.clear()
+        self.assertFalse(self.user.recommended_recipes.exists())
+        self.assertEqual(self.recommended_titles(),
+                         ['Salad', 'My Soup', 'Tofu Bowl', 'Green Curry'])
+
+
 class IngredientModelTest(TestCase):
     """Test Ingredient model functionality"""
 
@@ -147,6 +520,78 @@ class TagModelTest(TestCase):
         # self.assertIn('#17a2b8', cuisine_tag.get_color())
 
 
+class ReferenceDataSyncTest(TestCase):
+    """Test the reference data sync behind the populate_* commands"""
+
+    def setUp(self):
+        self.gram = Unit.objects.create(name='Gram', abbreviation='g',
+                                        unit_type='weight')
+        self.rice = Ingredient.objects.create(name='Rice',
+                                              calories_per_100g=130)
+        Ingredient.objects.create(name='Butter', calories_per_100g=717.5)
+        self.vegan = Tag.objects.create(name='Vegan', tag_type='dietary')
+        self.recipe = Recipe.objects.create(
+            title='Plain Rice', prep_time=5, cook_time=20, servings=1,
+            user=User.objects.create_user('cook'),
+        )
+        RecipeIngredient.objects.create(recipe=self.recipe,
+                                        ingredient=self.rice,
+                                        unit=self.gram, quantity=100,
+                                        order=1)
+
+    def test_sync_writes_only_changes(self):
+        """New and changed rows are written; a rerun writes nothing"""
+        from recipes import refdata
+        rows = [{'name': 'Rice', 'calories_per_100g': 150},
+                {'name': 'Butter', 'calories_per_100g': 717.5},
+                {'name': 'Tofu', 'calories_per_100g': 76}]
+        links = {'Tofu': [self.vegan.pk], 'Butter': []}
+        result = refdata.sync(Ingredient, rows, m2m={'dietary_tags': links})
+        self.assertEqual(result.inserted, ['Tofu'])
+        self.assertEqual(result.updated, ['Rice'])
+        self.assertEqual(result.unchanged, ['Butter'])
+        self.assertEqual(
+            list(Ingredient.objects.get(name='Tofu').dietary_tags.all()),
+            [self.vegan]
+        )
+        # Updated ingredients refresh the recipes using them
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.nutrition_per_serving['calories'], 150)
+
+        # Admin-added links are kept; missing ones count as an update
+        self.rice.dietary_tags.add(
+            Tag.objects.create(name='Gluten-Free', tag_type='dietary')
+        )
+        links['Rice'] = [self.vegan.pk]
+        result = refdata.sync(Ingredient, rows, m2m={'dietary_tags': links})
+        self.assertEqual(result.updated, ['Rice'])
+        self.assertEqual(self.rice.dietary_tags.count(), 2)
+
+        with self.assertNumQueries(4):
+            result = refdata.sync(Ingredient, rows,
+                                  m2m={'dietary_tags': links})
+        self.assertEqual(result.summary('ingredients'),
+                         '0 ingredients inserted, 0 updated, 3 unchanged')
+
+    def test_populate_commands_are_idempotent(self):
+        """A second run of each command changes nothing"""
+        for command in ['populate_tags', 'populate_units',
+                        'populate_unit_conversions']:
+            call_command(command, stdout=StringIO())
+        self.assertEqual(Tag.objects.get(name='Vegan').color, '#20c997')
+        self.assertEqual(Unit.objects.get(name='Cup').grams_per_unit, 240)
+
+        out = StringIO()
+        call_command('populate_tags', stdout=out)
+        self.assertIn('Updated: 0 tags', out.getvalue())
+        out = StringIO()
+        call_command('populate_units', stdout=out)
+        self.assertIn('0 units inserted, 0 updated', out.getvalue())
+        out = StringIO()
+        call_command('populate_unit_conversions', stdout=out)
+        self.assertIn('Successfully updated 0 units', out.getvalue())
+
+
 class UserProfileModelTest(TestCase):
     """Test UserProfile model functionality"""
 
@@ -221,6 +666,49 @@ class RatingModelTest(TestCase):
         with self.assertRaises(IntegrityError):
             Rating.objects.create(recipe=self.recipe, user=self.user, rating=3)
 
+    def test_rating_stats_follow_create_update_delete(self):
+        """Stored rating totals track every rating change"""
+        user2 = User.objects.create_user('user2', 'user2@test.com', 'pass123')
+        rating = Rating.objects.create(
+            recipe=self.recipe, user=self.user, rating=5
+        )
+        Rating.objects.update_or_create(
+            recipe=self.recipe, user=user2, defaults={'rating': 2}
+        )
+        self.recipe.refresh_from_db()
+        self.assertEqual(
+            (self.recipe.rating_sum, self.recipe.rating_count),
+            (7, 2)
+        )
+        self.assertEqual(self.recipe.average_rating, 3.5)
+
+        Rating.objects.update_or_create(
+            recipe=self.recipe, user=user2, defaults={'rating': 4}
+        )
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.average_rating, 4.5)
+
+        rating.delete()
+        Rating.objects.filter(user=user2).delete()
+        self.recipe.refresh_from_db()
+        self.assertEqual(
+            (self.recipe.rating_sum, self.recipe.rating_count,
+             self.recipe.rating_avg),
+            (0, 0, 0)
+        )
+
+    def test_rebuild_rating_stats_command(self):
+        """The rebuild command recomputes totals from the Rating table"""
+        Rating.objects.create(recipe=self.recipe, user=self.user, rating=4)
+        Recipe.objects.update(rating_sum=0, rating_count=0, rating_avg=0)
+        call_command('rebuild_rating_stats', stdout=StringIO())
+        self.recipe.refresh_from_db()
+        self.assertEqual(
+            (self.recipe.rating_sum, self.recipe.rating_count,
+             self.recipe.rating_avg),
+            (4, 1, 4.0)
+        )
+
 
 class CommentModelTest(TestCase):
     """Test Comment model functionality"""
@@ -4,7 +4,9 @@ Tests for authentication, recipe CRUD, user interactions
 """
 
 from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
+from django.db import connection
 from django.urls import reverse
 from recipes.models import Recipe, Tag, Ingredient
 
@@ -223,6 +225,58 @@ class SearchAndFilterTest(TestCase):
         self.assertContains(response, 'Italian Pasta')
         self.assertNotContains(response, 'Fresh Salad')
 
+    def test_recipe_total_time_filters(self):
+        """Total time filters and sorts run against the stored column"""
+        url = reverse('recipes:recipe_list')
+        response = self.client.get(url + '?max_total_time=10')
+        self.assertContains(response, 'Fresh Salad')
+        self.assertNotContains(response, 'Italian Pasta')
+
+        response = self.client.get(url + '?difficulty=easy&sort_by=-total_time')
+        self.assertEqual(
+            [recipe.title for recipe in response.context['page_obj']],
+            ['Italian Pasta', 'Fresh Salad']
+        )
+
+    def test_recipe_nutrition_filters(self):
+        """Nutrition filters and sorts use the stored per-serving values"""
+        from recipes.models import RecipeIngredient, Unit
+        gram = Unit.objects.create(name='Gram', abbreviation='g',
+                                   unit_type='weight')
+        pasta = Ingredient.objects.create(name='Pasta', calories_per_100g=350,
+                                          protein_per_100g=12)
+        lettuce = Ingredient.objects.create(name='Lettuce',
+                                            calories_per_100g=15,
+                                            protein_per_100g=1.4)
+        RecipeIngredient.objects.create(recipe=self.pasta_recipe,
+                                        ingredient=pasta, unit=gram,
+                                        quantity=300, order=1)
+        RecipeIngredient.objects.create(recipe=self.salad_recipe,
+                                        ingredient=lettuce, unit=gram,
+                                        quantity=400, order=1)
+
+        url = reverse('recipes:recipe_list')
+        response = self.client.get(url + '?max_calories=500')
+        self.assertContains(response, 'Fresh Salad')
+        self.assertNotContains(response, 'Italian Pasta')
+
+        response = self.client.get(url + '?min_protein=10&max_fat=0')
+        self.assertEqual(
+            [recipe.title for recipe in response.context['page_obj']],
+            ['Italian Pasta']
+        )
+
+        response = self.client.get(url + '?sort_by=calories_per_serving')
+        self.assertEqual(
+            [recipe.title for recipe in response.context['page_obj']],
+            ['Fresh Salad', 'Italian Pasta']
+        )
+        response = self.client.get(url + '?sort_by=-protein_per_serving')
+        self.assertEqual(
+            [recipe.title for recipe in response.context['page_obj']],
+            ['Italian Pasta', 'Fresh Salad']
+        )
+
     def test_recipe_filter_empty_results(self):
         """Test search with no results"""
         response = self.client.get(
@@ -232,6 +286,647 @@ class SearchAndFilterTest(TestCase):
         self.assertContains(response, 'No recipes found')
 
 
+class FullTextSearchTest(TestCase):
+    """Test ranked full-text recipe search"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.soup = Recipe.objects.create(
+            title='Tomato Soup',
+            description='Warming and simple',
+            user=self.user,
+            prep_time=5,
+            cook_time=20,
+        )
+        self.salad = Recipe.objects.create(
+            title='Summer Salad',
+            description='Crunchy leaves with ripe tomatoes',
+            user=self.user,
+            prep_time=5,
+            cook_time=5,
+        )
+
+    def search_titles(self, query):
+        response = self.client.get(
+            reverse('recipes:recipe_list'), {'search': query}
+        )
+        self.assertEqual(response.status_code, 200)
+        return [recipe.title for recipe in response.context['page_obj']]
+
+    def test_title_matches_rank_first(self):
+        """Stemmed matches in the title outrank description matches"""
+        self.assertEqual(self.search_titles('tomatoes'),
+                         ['Tomato Soup', 'Summer Salad'])
+
+    def test_search_form_submission_keeps_relevance_order(self):
+        """Submitting the rendered form doesn't override the ranking"""
+        url = reverse('recipes:recipe_list')
+        form = self.client.get(url).context['search_form']
+        data = {field.name: field.value() for field in form
+                if field.value() not in (None, [])}
+        data['search'] = 'tomatoes'
+        response = self.client.get(url, data)
+        titles = [recipe.title for recipe in response.context['page_obj']]
+        self.assertEqual(titles, ['Tomato Soup', 'Summer Salad'])
+
+    def test_query_without_words_filters_nothing(self):
+        """Punctuation alone lists every recipe, like a blank search"""
+        self.assertEqual(self.search_titles('!!!'),
+                         ['Summer Salad', 'Tomato Soup'])
+        self.assertEqual(self.search_titles('"'),
+                         ['Summer Salad', 'Tomato Soup'])
+
+    def test_last_term_matches_as_prefix(self):
+        """Partially typed words still find recipes"""
+        self.assertEqual(self.search_titles('summer sal'), ['Summer Salad'])
+
+    def test_index_follows_tags_and_ingredients(self):
+        """Tag and ingredient changes update the search document"""
+        from recipes.models import RecipeIngredient, Unit
+        self.assertEqual(self.search_titles('basil'), [])
+
+        unit = Unit.objects.create(name='Gram', abbreviation='g',
+                                   unit_type='weight')
+        basil = Ingredient.objects.create(name='Basil')
+        RecipeIngredient.objects.create(recipe=self.soup, ingredient=basil,
+                                        unit=unit, quantity=5, order=1)
+        self.assertEqual(self.search_titles('basil'), ['Tomato Soup'])
+
+        tag = Tag.objects.create(name='Italian', tag_type='cuisine')
+        tag.recipe_set.add(self.salad)
+        self.assertEqual(self.search_titles('italian'), ['Summer Salad'])
+
+        tag.name = 'Tuscan'
+        tag.save()
+        self.assertEqual(self.search_titles('italian'), [])
+        self.assertEqual(self.search_titles('tuscan'), ['Summer Salad'])
+
+
+class DietaryFilterViewTest(TestCase):
+    """Test dietary restrictions applied to the homepage"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.vegan = Tag.objects.create(name='Vegan', tag_type='dietary')
+        self.user.profile.dietary_tags.set([self.vegan])
+        self.client.login(username='testuser', password='testpass123')
+
+    def create_recipes(self, count, start=0):
+        for i in range(start, start + count):
+            recipe = Recipe.objects.create(
+                title=f'Recipe {i}',
+                user=self.user,
+                prep_time=5,
+                cook_time=5,
+            )
+            if i % 2 == 0:
+                recipe.tags.add(self.vegan)
+
+    def homepage_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('recipes:recipe_list'))
+        self.assertEqual(response.status_code, 200)
+        return response, len(ctx.captured_queries)
+
+    def test_only_compatible_recipes_listed(self):
+        """Recipes without the user's dietary tags are hidden"""
+        self.create_recipes(2)
+        response, _ = self.homepage_queries()
+        self.assertEqual(
+            [recipe.title for recipe in response.context['page_obj']],
+            ['Recipe 0']
+        )
+
+    def test_query_count_independent_of_catalogue_size(self):
+        """Dietary filtering doesn't issue queries per recipe"""
+        # Both sizes fill a whole page so per-card work is the same
+        self.create_recipes(30)
+        _, small = self.homepage_queries()
+        self.create_recipes(30, start=30)
+        _, large = self.homepage_queries()
+        self.assertEqual(small, large)
+
+
+class CursorPaginationTest(TestCase):
+    """Test keyset pagination of the recipe list and liked recipes"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.recipes = [
+            Recipe.objects.create(title=f'Recipe {i}', user=self.user,
+                                  prep_time=5, cook_time=i % 4)
+            for i in range(30)
+        ]
+
+    def walk(self, url, params=''):
+        """Follow next cursors from the first page, returning the ids."""
+        ids, cursor = [], ''
+        while cursor is not None:
+            response = self.client.get(f'{url}?cursor={cursor}{params}')
+            page = response.json()
+            ids.extend(recipe['id'] for recipe in page['results'])
+            cursor = page['next']
+        return ids
+
+    def test_cursor_pages_cover_every_recipe_once(self):
+        """Walking the cursors yields the same order as offset paging"""
+        url = reverse('recipes:recipe_list_api')
+        expected = list(Recipe.objects.order_by('-created_at', '-id')
+                        .values_list('id', flat=True))
+        self.assertEqual(self.walk(url), expected)
+
+        # total_time has many ties, broken by the primary key
+        expected = list(Recipe.objects.order_by('total_time', 'id')
+                        .values_list('id', flat=True))
+        self.assertEqual(self.walk(url, '&sort_by=total_time'), expected)
+
+    def test_nullable_sort_keeps_rows_without_values(self):
+        """Recipes with no stored value are paged last, not dropped"""
+        from django.db.models import F
+        url = reverse('recipes:recipe_list_api')
+        Recipe.objects.filter(pk__in=[recipe.pk for recipe in
+                                      self.recipes[::3]]).update(
+            calories_per_serving=None
+        )
+        expected = list(
+            Recipe.objects.order_by(
+                F('calories_per_serving').asc(nulls_last=True),
+                '-created_at', '-id',
+            ).values_list('id', flat=True)
+        )
+        self.assertEqual(self.walk(url, '&sort_by=calories_per_serving'),
+                         expected)
+
+        # And back again from the last page, across the NULLs
+        ids, cursor = [], ''
+        params = {'sort_by': 'calories_per_serving'}
+        while True:
+            page = self.client.get(url, {'cursor': cursor, **params}).json()
+            if not page['next']:
+                break
+            cursor = page['next']
+        while cursor is not None:
+            page = self.client.get(url, {'cursor': cursor, **params}).json()
+            ids[:0] = [recipe['id'] for recipe in page['results']]
+            cursor = page['previous']
+        self.assertEqual(ids, expected)
+
+    def test_previous_cursor_returns_previous_page(self):
+        """Previous tokens walk back to the page before"""
+        url = reverse('recipes:recipe_list_api')
+        first = self.client.get(url).json()
+        second = self.client.get(url, {'cursor': first['next']}).json()
+        back = self.client.get(url, {'cursor': second['previous']}).json()
+        self.assertEqual(back['results'], first['results'])
+        self.assertIsNone(back['previous'])
+
+    def test_page_cost_independent_of_depth(self):
+        """Deep pages issue the same queries as the first page"""
+        url = reverse('recipes:recipe_list')
+        self.client.get(url, {'cursor': ''})  # fill the facet count cache
+        with CaptureQueriesContext(connection) as first:
+            response = self.client.get(url, {'cursor': ''})
+        next_query = response.context['cursor_links']['next_query']
+        with CaptureQueriesContext(connection) as second:
+            response = self.client.get(f'{url}?{next_query}')
+        self.assertEqual(len(first), len(second))
+        self.assertFalse([
+            query for query in second.captured_queries
+            if query['sql'].startswith('SELECT COUNT(*) AS "__count" FROM '
+                                       '"recipes_recipe"')
+            or 'OFFSET' in query['sql']
+        ])
+        self.assertEqual(len(response.context['page_obj']), 12)
+
+    def test_tampered_cursor_serves_first_page(self):
+        """An invalid token falls back to the first page"""
+        url = reverse('recipes:recipe_list_api')
+        first = self.client.get(url).json()
+        response = self.client.get(url, {'cursor': first['next'] + 'x'})
+        self.assertEqual(response.json()['results'], first['results'])
+
+    def test_liked_recipes_cursor_mode(self):
+        """Liked recipes page through likes without loading them all"""
+        from recipes.models import RecipeLike
+        for recipe in self.recipes[:14]:
+            RecipeLike.objects.create(user=self.user, recipe=recipe)
+        self.client.login(username='testuser', password='testpass123')
+        url = reverse('recipes:liked_recipes')
+        response = self.client.get(url, {'cursor': ''})
+        self.assertEqual(response.context['total_liked'], 14)
+        next_query = response.context['cursor_links']['next_query']
+        response = self.client.get(f'{url}?{next_query}')
+        self.assertEqual(
+            [recipe.title for recipe in response.context['page_obj']],
+            ['Recipe 1', 'Recipe 0']
+        )
+
+
+class FacetCountTest(TestCase):
+    """Test filter sidebar facet counts"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.vegan = Tag.objects.create(name='Vegan', tag_type='dietary')
+        self.keto = Tag.objects.create(name='Keto', tag_type='dietary')
+        self.thai = Tag.objects.create(name='Thai', tag_type='cuisine')
+        curry = Recipe.objects.create(title='Green Curry', user=self.user,
+                                      prep_time=15, cook_time=30)
+        curry.tags.set([self.vegan, self.keto, self.thai])
+        salad = Recipe.objects.create(title='Som Tam', user=self.user,
+                                      prep_time=10, cook_time=0)
+        salad.tags.set([self.vegan, self.thai])
+        Recipe.objects.create(title='Toast', user=self.user, prep_time=2,
+                              cook_time=3)
+
+    def test_punctuation_search_lists_without_error(self):
+        """A search with no words still renders the filter counts"""
+        from recipes import facets
+        for query in ['"', '!!!']:
+            response = self.client.get(reverse('recipes:recipe_list'),
+                                       {'search': query})
+            self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(0):
+            counts = facets.facet_counts(Recipe.objects.none(), 'none')
+        self.assertEqual(counts, {'tags': {}, 'tag_types': {}, 'time': {}})
+
+    def test_counts_in_one_query(self):
+        """Tag, tag type and time bucket counts come from one query"""
+        from recipes.facets import count_facets
+        with self.assertNumQueries(1):
+            counts = count_facets(Recipe.objects.filter(prep_time__gte=10))
+        self.assertEqual(counts['tags'], {
+            self.vegan.pk: 2, self.keto.pk: 1, self.thai.pk: 2,
+        })
+        # Green Curry has two dietary tags but is one recipe
+        self.assertEqual(counts['tag_types'], {'dietary': 2, 'cuisine': 2})
+        self.assertEqual(counts['time'], {'easy': 1, 'medium': 1})
+
+    def test_counts_cached_per_filter_signature(self):
+        """Repeat visits reuse the counts until recipes change"""
+        url = reverse('recipes:recipe_list')
+        self.client.get(url, {'cursor': ''})  # fill the facet count cache
+        with CaptureQueriesContext(connection) as first:
+            response = self.client.get(url + '?min_servings=1&max_total_time=60')
+        dietary = {tag.name: tag.result_count
+                   for tag in response.context['dietary_tags']}
+        self.assertEqual(dietary, {'Keto': 1, 'Vegan': 2})
+        # Same filters in a different order, and a different sort
+        with CaptureQueriesContext(connection) as second:
+            self.client.get(url + '?max_total_time=60&min_servings=1'
+                            '&sort_by=title')
+        self.assertEqual(len(second), len(first) - 1)
+
+        Recipe.objects.create(title='Pad Thai', user=self.user, prep_time=10,
+                              cook_time=10).tags.add(self.thai)
+        response = self.client.get(url + '?min_servings=1&max_total_time=60')
+        self.assertEqual(
+            response.context['facet_counts']['tags'][self.thai.pk], 3
+        )
+
+
+    def test_evicted_version_does_not_revive_old_counts(self):
+        """Losing the version key doesn't bring back stale counts"""
+        from django.core.cache import cache
+        from recipes import facets
+        from recipes.forms import RecipeSearchForm
+        signature = facets.filter_signature(RecipeSearchForm())
+        cache.clear()
+        counts = facets.facet_counts(Recipe.objects.all(), signature)
+        self.assertEqual(counts['tags'][self.thai.pk], 2)
+        Recipe.objects.create(title='Pad Thai', user=self.user, prep_time=10,
+                              cook_time=10).tags.add(self.thai)
+        cache.delete(facets.VERSION_KEY)
+        counts = facets.facet_counts(Recipe.objects.all(), signature)
+        self.assertEqual(counts['tags'][self.thai.pk], 3)
+
+
+class CarouselTest(TestCase):
+    """Test the cached homepage cuisine carousel"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.cuisines = [
+            Tag.objects.create(name=f'Cuisine {i}', tag_type='cuisine')
+            for i in range(6)
+        ]
+        for i in range(8):
+            recipe = Recipe.objects.create(title=f'Dish {i}', user=self.user,
+                                           prep_time=5, cook_time=5)
+            recipe.tags.set(self.cuisines[:i % 6 + 1])
+
+    def test_carousel_built_in_two_queries(self):
+        """Tags, counts and recipes load without per-cuisine queries"""
+        from recipes.carousel import build_carousel
+        with self.assertNumQueries(2):
+            carousel = build_carousel()
+            titles = [[recipe.title for recipe in item['recipes']]
+                      for item in carousel]
+        self.assertEqual(len(carousel), 5)
+        self.assertEqual(carousel[0]['recipe_count'], 8)
+        self.assertEqual(titles[0], [f'Dish {i}' for i in range(7, 1, -1)])
+
+    def test_anonymous_homepage_uses_cached_carousel(self):
+        """Steady state homepage hits don't query for the carousel"""
+        url = reverse('recipes:recipe_list')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertFalse([query for query in ctx.captured_queries
+                          if 'recipe_count' in query['sql']])
+        self.assertContains(response, '+5 more')
+
+    def test_tagging_and_rating_invalidate_carousel(self):
+        """New tags and ratings show up on the next homepage hit"""
+        from recipes.models import Rating
+        url = reverse('recipes:recipe_list')
+        self.client.get(url)
+        recipe = Recipe.objects.create(title='Fresh Dish', user=self.user,
+                                       prep_time=5, cook_time=5)
+        recipe.tags.add(self.cuisines[0])
+        Rating.objects.create(recipe=recipe, user=self.user, rating=4)
+        response = self.client.get(url)
+        first = response.context['carousel_data'][0]
+        self.assertEqual(first['recipe_count'], 9)
+        self.assertEqual(first['recipes'][0].average_rating, 4)
+
+
+class LikedStateTest(TestCase):
+    """Test the liked flag on recipe cards"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        from recipes.models import RecipeLike
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.recipes = [
+            Recipe.objects.create(title=f'Recipe {i}', user=self.user,
+                                  prep_time=5, cook_time=5)
+            for i in range(5)
+        ]
+        for recipe in self.recipes[1::2]:
+            RecipeLike.objects.create(user=self.user, recipe=recipe)
+        self.client.login(username='testuser', password='testpass123')
+
+    def liked_titles(self):
+        response = self.client.get(reverse('recipes:recipe_list'))
+        return sorted(recipe.title for recipe in response.context['page_obj']
+                      if recipe.is_liked)
+
+    def test_liked_flag_from_exists_subquery(self):
+        """Cards are marked from a subquery on the page's rows"""
+        self.assertEqual(self.liked_titles(), ['Recipe 1', 'Recipe 3'])
+
+    def test_cached_id_set_holds_big_ids(self):
+        """Ids past 32 bits fit in the cached id set"""
+        from recipes import likes
+        from recipes.models import RecipeLike
+        big = Recipe.objects.create(id=2 ** 40, title='Big Id',
+                                    user=self.user, prep_time=5, cook_time=5)
+        RecipeLike.objects.create(user=self.user, recipe=big)
+        with self.settings(RECIPE_LIKED_IDS_CACHE=True):
+            self.assertEqual(list(likes.liked_ids(self.user)),
+                             [self.recipes[1].pk, self.recipes[3].pk, big.pk])
+            self.assertTrue(likes.has_liked(self.user, big))
+
+    def test_liked_flag_from_cached_id_set(self):
+        """The cached id set is used and refreshed when likes change"""
+        from recipes import likes
+        with self.settings(RECIPE_LIKED_IDS_CACHE=True):
+            self.assertEqual(self.liked_titles(), ['Recipe 1', 'Recipe 3'])
+            with self.assertNumQueries(0):
+                liked = likes.liked_ids(self.user)
+            self.assertEqual(list(liked), [self.recipes[1].pk,
+                                           self.recipes[3].pk])
+
+            self.client.post(reverse('recipes:toggle_like',
+                                     args=[self.recipes[0].slug]))
+            self.assertEqual(self.liked_titles(),
+                             ['Recipe 0', 'Recipe 1', 'Recipe 3'])
+            response = self.client.get(
+                reverse('recipes:recipe_detail', args=[self.recipes[0].slug])
+            )
+            self.assertTrue(response.context['is_liked'])
+            response = self.client.get(reverse('recipes:liked_recipes'))
+            self.assertEqual(response.context['total_liked'], 3)
+
+
+class FeedTest(TestCase):
+    """Test the home feed of followed authors' recipes"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        from recipes.models import Follow
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username='reader',
+                                             password='testpass123')
+        self.chef = User.objects.create_user('chef')
+        self.star = User.objects.create_user('star')
+        self.stranger = User.objects.create_user('stranger')
+        for author in (self.chef, self.star):
+            Follow.objects.create(follower=self.user, followed=author)
+        self.client.login(username='reader', password='testpass123')
+
+    def create(self, author, title):
+        return Recipe.objects.create(title=title, user=author,
+                                     prep_time=5, cook_time=5)
+
+    def feed_titles(self, **kwargs):
+        response = self.client.get(reverse('recipes:feed'), kwargs)
+        return [recipe.title for recipe in response.context['page_obj']]
+
+    def test_new_recipes_fan_out_to_followers(self):
+        """Followers get a timeline row; unfollowing removes it"""
+        from recipes.models import TimelineEntry
+        self.create(self.chef, 'Soup')
+        self.create(self.stranger, 'Stew')
+        self.create(self.chef, 'Bread')
+        self.assertEqual(self.feed_titles(), ['Bread', 'Soup'])
+        self.assertEqual(TimelineEntry.objects.count(), 2)
+
+        self.client.post(reverse('recipes:toggle_follow', args=['chef']))
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(self.feed_titles(), [])
+
+        # Following again copies the author's recent recipes back in
+        self.client.post(reverse('recipes:toggle_follow', args=['chef']))
+        self.assertEqual(self.feed_titles(), ['Bread', 'Soup'])
+
+    def test_large_authors_are_merged_on_read(self):
+        """Over the fan-out limit recipes aren't copied but still show"""
+        from recipes.models import TimelineEntry
+        from recipes.timeline import feed_page
+        titles = []
+        for author, title in [(self.star, 'Star 0'), (self.chef, 'Chef 0'),
+                              (self.star, 'Star 1'), (self.star, 'Star 2'),
+                              (self.chef, 'Chef 1')]:
+            # star has one follower, so a limit of 0 makes it a pull author
+            limit = 0 if author == self.star else 1000
+            with self.settings(RECIPE_FEED_FANOUT_LIMIT=limit):
+                titles.insert(0, self.create(author, title).title)
+        self.assertEqual(
+            list(TimelineEntry.objects.values_list('recipe__title',
+                                                   flat=True)),
+            ['Chef 1', 'Chef 0']
+        )
+
+        # Walk forwards two at a time, then back again
+        pages, cursor = [], None
+        while True:
+            page = feed_page(self.user, cursor, per_page=2)
+            pages.append([recipe.title for recipe in page])
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        self.assertEqual(sum(pages, []), titles)
+        page = feed_page(self.user, page.previous_cursor, per_page=2)
+        self.assertEqual([recipe.title for recipe in page], pages[-2])
+
+    def test_liked_recipes_render_as_liked(self):
+        """Feed cards show the reader's likes"""
+        from recipes.models import RecipeLike
+        liked = self.create(self.chef, 'Soup')
+        self.create(self.chef, 'Bread')
+        RecipeLike.objects.create(user=self.user, recipe=liked)
+        for cached in (False, True):
+            with self.settings(RECIPE_LIKED_IDS_CACHE=cached):
+                response = self.client.get(reverse('recipes:feed'))
+                self.assertEqual(
+                    [(recipe.title, recipe.is_liked)
+                     for recipe in response.context['page_obj']],
+                    [('Bread', False), ('Soup', True)]
+                )
+                # app.js's shared like handler picks up the buttons
+                self.assertContains(response, 'btn-danger like-btn', 1)
+
+    def test_migration_fans_out_existing_recipes(self):
+        """Recipes from before timelines are copied in by the migration"""
+        from importlib import import_module
+        from django.apps import apps
+        from recipes.models import TimelineEntry
+        self.create(self.chef, 'Soup')
+        self.create(self.star, 'Stew')
+        TimelineEntry.objects.all().delete()
+        Recipe.objects.update(fanned_out=False)
+        migration = import_module('recipes.migrations.0024_backfill_timelines')
+        with self.settings(RECIPE_FEED_FANOUT_LIMIT=0):
+            migration.fan_out_existing_recipes(apps, None)
+        self.assertFalse(TimelineEntry.objects.exists())
+
+        migration.fan_out_existing_recipes(apps, None)
+        self.assertEqual(
+            sorted(TimelineEntry.objects.values_list('recipe__title',
+                                                     flat=True)),
+            ['Soup', 'Stew']
+        )
+        self.assertFalse(Recipe.objects.filter(fanned_out=False).exists())
+
+    def test_feed_api(self):
+        """The JSON feed pages by cursor"""
+        for i in range(15):
+            self.create(self.chef, f'Recipe {i}')
+        data = self.client.get(reverse('recipes:feed_api')).json()
+        self.assertEqual(len(data['results']), 12)
+        self.assertEqual(data['results'][0]['author'], 'chef')
+        self.assertIsNone(data['previous'])
+        data = self.client.get(reverse('recipes:feed_api'),
+                               {'cursor': data['next']}).json()
+        self.assertEqual([result['title'] for result in data['results']],
+                         ['Recipe 2', 'Recipe 1', 'Recipe 0'])
+        self.assertIsNone(data['next'])
+
+
+class ViewCounterTest(TestCase):
+    """Test buffered recipe view counting"""
+
+    def setUp(self):
+        from recipes import view_counter
+        self.view_counter = view_counter
+        view_counter.flush()
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.pasta = Recipe.objects.create(
+            title='Pasta', user=self.user, prep_time=5, cook_time=5
+        )
+        self.salad = Recipe.objects.create(
+            title='Salad', user=self.user, prep_time=5, cook_time=5
+        )
+
+    def test_views_are_buffered_until_flush(self):
+        """Detail views don't write to the recipe row straight away"""
+        updated_at = self.pasta.updated_at
+        for _ in range(3):
+            response = self.client.get(
+                reverse('recipes:recipe_detail', args=[self.pasta.slug])
+            )
+        self.assertEqual(response.context['recipe'].view_count, 3)
+        self.pasta.refresh_from_db()
+        self.assertEqual(self.pasta.view_count, 0)
+
+        self.view_counter.flush()
+        self.pasta.refresh_from_db()
+        self.assertEqual(self.pasta.view_count, 3)
+        self.assertEqual(self.pasta.updated_at, updated_at)
+
+    def test_idle_buffer_is_flushed_on_the_interval(self):
+        """A timer flushes buffered views without another request"""
+        import threading
+        from unittest import mock
+        flushed = threading.Event()
+        self.view_counter.flush()
+        with self.settings(VIEW_COUNT_FLUSH_INTERVAL=0.5), \
+                mock.patch.object(self.view_counter, 'flush',
+                                  side_effect=flushed.set):
+            self.view_counter.record_view(self.pasta.pk)
+            self.assertTrue(flushed.wait(5))
+        self.assertEqual(self.view_counter.pending_views(self.pasta.pk), 1)
+        self.view_counter.flush()
+
+    def test_flush_is_one_statement(self):
+        """All buffered recipes are updated by a single query"""
+        for _ in range(2):
+            self.view_counter.record_view(self.pasta.pk)
+        self.view_counter.record_view(self.salad.pk)
+        with self.assertNumQueries(1):
+            self.view_counter.flush()
+        self.pasta.refresh_from_db()
+        self.salad.refresh_from_db()
+        self.assertEqual((self.pasta.view_count, self.salad.view_count),
+                         (2, 1))
+
+
 class ProfileViewTest(TestCase):
     """Test user profile views"""
 
@@ -265,3 +960,37 @@ class ProfileViewTest(TestCase):
         """Test profile edit redirects for unauthenticated user"""
         response = self.client.get(reverse('accounts:profile_edit'))
         self.assertEqual(response.status_code, 302)  # Redirect to login
+
+
+class AssetTagTest(TestCase):
+    """Test {% asset %} resolution through the build manifest"""
+
+    def tearDown(self):
+        from recipes.templatetags.assets import load_manifest
+        load_manifest.cache_clear()
+
+    def render(self, manifest, debug=False):
+        import json
+        import tempfile
+        from django.test import override_settings
+        from recipes.templatetags.assets import load_manifest
+        load_manifest.cache_clear()
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as f:
+            json.dump(manifest, f)
+            f.flush()
+            with override_settings(ASSET_MANIFEST=f.name, DEBUG=debug):
+                return self.client.get(reverse('recipes:recipe_list'))
+
+    def test_built_assets_are_served_when_listed(self):
+        """Listed assets use the hashed build, others the source file"""
+        manifest = {'assets': {'css/styles.css': {
+            'source': 'abc', 'output': 'dist/css/styles.0123456789ab.min.css'
+        }}}
+        response = self.render(manifest)
+        self.assertContains(response,
+                            '/static/dist/css/styles.0123456789ab.min.css')
+        self.assertContains(response, '/static/js/app.js')
+
+        response = self.render(manifest, debug=True)
+        self.assertContains(response, '/static/css/styles.css')
+        self.assertNotContains(response, '/static/dist/')